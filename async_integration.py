@@ -0,0 +1,336 @@
+"""
+Variante asyncio de l'intégration de fichier sur un modèle : la validation produit des lots de
+lignes dans une file bornée, pendant qu'un chargeur asynchrone (asyncpg) les envoie par COPY,
+le travail CPU de la validation et les attentes réseau de PostgreSQL se recouvrent.
+asyncpg est une dépendance optionnelle, nécessaire uniquement pour ce module.
+    exemple:
+        integration_file_csv_async(
+            kwargs_cnx, kwargs_file, kwargs_modele, kwargs_validate, kwargs_upsert
+        )
+"""
+import sys
+import asyncio
+import time
+from datetime import datetime as dt
+from decimal import Decimal
+from itertools import islice
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+from functions import (
+    COPY_NULL,
+    CsvTxtValidator,
+    GetModel,
+    IntegrationStats,
+    cnx_postgresql,
+    delete_file,
+    envoi_mail_erreur,
+    get_copy_upsert_queries,
+    get_types_champs,
+    list_file,
+    write_log,
+    LOG_FILE
+)
+
+QUEUE_SIZE = 8
+BATCH_SIZE = 5000
+
+
+def get_record_converter(types_champs, champs):
+    """
+    Fonction qui renvoie la conversion des lignes validées en records pour asyncpg : les
+    '<NULL>' deviennent None et les numeric des Decimal, les autres valeurs ont déjà le type
+    Python attendu par les codecs binaires d'asyncpg
+        :param types_champs: dict {champ: (type, taille, is_nullable)} de get_types_champs
+        :param champs: champs, dans l'ordre des valeurs des lignes
+        :return: fonction ligne -> tuple
+    """
+    numerics = {i for i, champ in enumerate(champs) if types_champs[champ][0] == 'numeric'}
+
+    def convert_value(i, value):
+        if value is None or value == COPY_NULL:
+            return None
+
+        if i in numerics:
+            return Decimal(repr(value) if isinstance(value, float) else str(value))
+
+        return value
+
+    def convert(row):
+        return tuple(convert_value(i, value) for i, value in enumerate(row))
+
+    return convert
+
+
+async def produce_batches(rows, queue, batch_size, convert):
+    """
+    Producteur : lit et convertit les lots de lignes validées dans un thread, pour ne pas
+    bloquer la boucle pendant la validation, et les place dans la file. La fin est signalée
+    par None, une erreur de validation par l'exception elle même
+        :param rows: itérable des lignes validées, CsvTxtValidator.iter_validation
+        :param queue: asyncio.Queue bornée
+        :param batch_size: nombre de lignes par lot
+        :param convert: conversion des lignes, get_record_converter
+        :return: None
+    """
+    loop = asyncio.get_running_loop()
+    rows = iter(rows)
+
+    def next_batch():
+        return [convert(row) for row in islice(rows, batch_size)]
+
+    try:
+        while True:
+            batch = await loop.run_in_executor(None, next_batch)
+
+            if not batch:
+                break
+
+            await queue.put(batch)
+
+    except Exception as error:
+        await queue.put(error)
+        return
+
+    await queue.put(None)
+
+
+async def get_tuples_counts_async(cnx, table):
+    """
+    Fonction qui renvoie le nombre de lignes insérées et mises à jour dans la table, depuis le
+    début de la transaction en cours, voir functions.get_tuples_counts
+        :param cnx: connexion asyncpg
+        :param table: table
+        :return: (inserted, updated)
+    """
+    counts = await cnx.fetchrow(
+        "SELECT n_tup_ins, n_tup_upd FROM pg_stat_xact_user_tables WHERE relid = $1::regclass",
+        f'"{table}"'
+    )
+
+    return tuple(counts) if counts is not None else (0, 0)
+
+
+async def load_batches(cnx, queue, kwargs_upsert, stats):
+    """
+    Chargeur : dans une seule transaction, envoie les lots de la file par COPY binaire dans la
+    table temporaire de execute_copy_upsert, puis applique le même INSERT ... SELECT. Une
+    erreur du producteur annule la transaction
+        :param cnx: connexion asyncpg
+        :param queue: asyncio.Queue bornée, alimentée par produce_batches
+        :param kwargs_upsert: dictionaire de execute_copy_upsert, sans cnx ni rows
+        :param stats: IntegrationStats
+        :return: None, ou {"inserted": n, "updated": n, "skipped": n} si skip_unchanged
+    """
+    table = kwargs_upsert['table']
+    staging, create, insert = get_copy_upsert_queries(kwargs_upsert)
+    skip_unchanged = kwargs_upsert.get('skip_unchanged')
+    nb_rows = 0
+    counts = None
+
+    async with cnx.transaction():
+        if skip_unchanged:
+            counts_before = await get_tuples_counts_async(cnx, table)
+
+        await cnx.execute(create)
+
+        while True:
+            batch = await queue.get()
+
+            if batch is None:
+                break
+
+            if isinstance(batch, Exception):
+                raise batch
+
+            with stats.timer('upsert'):
+                await cnx.copy_records_to_table(
+                    staging, records=batch, columns=kwargs_upsert['champs']
+                )
+
+            nb_rows += len(batch)
+
+        with stats.timer('upsert'):
+            await cnx.execute(insert)
+
+        if skip_unchanged:
+            counts_after = await get_tuples_counts_async(cnx, table)
+            inserted = counts_after[0] - counts_before[0]
+            updated = counts_after[1] - counts_before[1]
+            counts = {
+                "inserted": inserted, "updated": updated, "skipped": nb_rows - inserted - updated
+            }
+
+    return counts
+
+
+async def async_integration_file_csv(
+        kwargs_cnx, kwargs_file, kwargs_modele, kwargs_validate, kwargs_upsert, file_csv=None,
+        queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE, stats=None
+):
+    """
+    Intégration asyncio d'un fichier csv en base de données pour un modèle Django. La lecture du
+    schéma se fait par psycopg2 (get_types_champs et son cache), le chargement par asyncpg.
+    La mémoire est bornée à queue_size lots de batch_size lignes
+        :param kwargs_cnx: voir integration_file_csv, POOL_DATABASE n'est pas utilisé
+        :param kwargs_file: voir integration_file_csv
+        :param kwargs_modele: voir integration_file_csv
+        :param kwargs_validate: voir integration_file_csv
+        :param kwargs_upsert: voir integration_file_csv, copy et commit_every ne sont pas
+                              utilisés, le chargement est toujours un COPY binaire en une
+                              seule transaction
+        :param file_csv: fichier à intégrer, si None le premier fichier de list_file(**kwargs_file)
+        :param queue_size: nombre maximum de lots en attente de chargement
+        :param batch_size: nombre de lignes par lot
+        :param stats: IntegrationStats remplie au fil de l'intégration
+        :return: voir integration_file_csv, (None, log) en cas d'erreur ou (True, "success")
+    """
+    if asyncpg is None:
+        raise ImportError("asyncpg est nécessaire pour async_integration_file_csv")
+
+    stats = IntegrationStats() if stats is None else stats
+    start = time.perf_counter()
+    kwargs_validate = dict(kwargs_validate, stats=stats)
+    postgres_cnx = None
+    async_cnx = None
+    producer = None
+
+    try:
+        stats.table = GetModel(None, **kwargs_modele).get_model_table_name()
+        cnx_string = (
+            f"dbname={kwargs_cnx['NAME_DATABASE']} "
+            f"user={kwargs_cnx['USER_DATABASE']} "
+            f"password={kwargs_cnx['PASSWORD_DATABASE']} "
+            f"host={kwargs_cnx['HOST_DATABASE']} "
+            f"port={kwargs_cnx['PORT_DATABASE']}"
+        )
+
+        with stats.timer('connect'):
+            postgres_cnx = cnx_postgresql(cnx_string)
+            async_cnx = await asyncpg.connect(
+                database=kwargs_cnx['NAME_DATABASE'],
+                user=kwargs_cnx['USER_DATABASE'],
+                password=kwargs_cnx['PASSWORD_DATABASE'],
+                host=kwargs_cnx['HOST_DATABASE'],
+                port=kwargs_cnx['PORT_DATABASE']
+            )
+
+        if postgres_cnx is None:
+            log_line = (
+                f'{dt.now().isoformat()} | async_integration_file_csv : '
+                f'pas de connexion à postgresql\n'
+            )
+            envoi_mail_erreur(log_line)
+            write_log(LOG_FILE, log_line)
+            return None, log_line
+
+        if file_csv is None:
+            file_csv = (list_file(**kwargs_file) or [None])[0]
+
+        if file_csv is None:
+            log_line = (
+                f'{dt.now().isoformat()} | async_integration_file_csv : '
+                f'pas de fichier à mettre à jour\n'
+            )
+            envoi_mail_erreur(log_line)
+            write_log(LOG_FILE, log_line)
+            return None, log_line
+
+        stats.file = file_csv
+
+        with stats.timer('schema'):
+            table, champs_type = GetModel(postgres_cnx, **kwargs_modele).get_champs_types()
+            champs = [r[0] for r in champs_type]
+            types_champs = get_types_champs(postgres_cnx, table, champs)[0]
+
+        kwargs_upsert = dict(kwargs_upsert, table=table, champs=champs)
+        validator = CsvTxtValidator(file_csv, champs_type, **kwargs_validate)
+        queue = asyncio.Queue(maxsize=queue_size)
+        producer = asyncio.ensure_future(
+            produce_batches(
+                validator.iter_validation(),
+                queue,
+                batch_size,
+                get_record_converter(types_champs, champs)
+            )
+        )
+
+        try:
+            counts = await load_batches(async_cnx, queue, kwargs_upsert, stats)
+
+        except Exception:
+            if validator.log_error is None:
+                raise
+
+            envoi_mail_erreur(validator.log_error)
+            write_log(LOG_FILE, validator.log_error)
+            return None, validator.log_error
+
+        delete_file(file_csv)
+        stats.success = True
+        stats.counts = counts
+
+        if validator.log_rejects is not None:
+            envoi_mail_erreur(validator.log_rejects)
+            write_log(LOG_FILE, validator.log_rejects)
+
+        ligne = (
+            f'{dt.now().isoformat()} | async_integration_file_csv : le modèle '
+            f'{kwargs_modele["modele"].__name__} '
+            f'a été mis à jour'
+        )
+
+        if counts is not None:
+            ligne += (
+                f' ({counts["inserted"]} insérées, {counts["updated"]} mises à jour, '
+                f'{counts["skipped"]} inchangées)'
+            )
+
+        write_log(LOG_FILE, f'{ligne}\n')
+
+    except Exception:
+        ligne = f'{dt.now().isoformat()} | async_integration_file_csv : ' \
+                f'{file_csv}\n\t\t{sys.exc_info()[1]}\n'
+        write_log(LOG_FILE, ligne)
+        envoi_mail_erreur(ligne)
+        return None, ligne
+
+    finally:
+        if producer is not None and not producer.done():
+            producer.cancel()
+
+        if async_cnx is not None:
+            await async_cnx.close()
+
+        if postgres_cnx is not None:
+            postgres_cnx.close()
+
+        stats.elapsed = time.perf_counter() - start
+
+        if stats.success is None:
+            stats.success = False
+
+        stats.log_events('async_integration_file_csv')
+
+        if stats.prometheus_file:
+            try:
+                stats.write_prometheus()
+            except OSError:
+                write_log(
+                    LOG_FILE,
+                    f'{dt.now().isoformat()} | async_integration_file_csv : '
+                    f'{stats.prometheus_file}\n\t\t{sys.exc_info()[1]}\n'
+                )
+
+    return True, "success"
+
+
+def integration_file_csv_async(*args, **kwargs):
+    """
+    Lancement synchrone de async_integration_file_csv, dans sa propre boucle asyncio
+        :return: voir async_integration_file_csv
+    """
+    return asyncio.run(async_integration_file_csv(*args, **kwargs))
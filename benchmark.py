@@ -0,0 +1,614 @@
+"""
+Module de benchmark des étapes d'intégration : génération de fichiers csv synthétiques, mesure
+des lignes/s et du pic mémoire par étape, chargement dans un cluster PostgreSQL temporaire lancé
+pour l'occasion, résultats en json pour comparer les versions entre elles
+    exemple:
+        python benchmark.py --rows 100000 --types int,str,float,date --error-rate 0.001 \
+            --encoding cp1252 --output bench_v2.json
+        python benchmark.py --compare bench_v1.json bench_v2.json
+"""
+import os
+import sys
+import argparse
+import json
+import platform
+import random
+import resource
+import shutil
+import socket
+import string
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from datetime import datetime as dt
+
+import psycopg2
+
+from functions import (
+    CsvTxtValidator,
+    ValidatorPlan,
+    clear_schema_cache,
+    execute_copy_upsert,
+    execute_prepared_upsert,
+    remove_columuns_lines,
+    setting_delete_lines,
+    validate_element
+)
+
+BENCH_TABLE = 'bench_integration'
+BENCH_CHARS = string.ascii_letters + string.digits + ' éèàçùÉ'
+BENCH_DATE = date(2000, 1, 1)
+
+# type: (type postgresql, tup_type CsvTxtValidator, valeur valide, valeur en erreur)
+BENCH_TYPES = {
+    'int': (
+        'integer',
+        (0, True, 'validate_int'),
+        lambda rnd: str(rnd.randint(-100000, 100000)),
+        lambda rnd: f'{rnd.randint(1, 99)}-{rnd.randint(1, 99)}'
+    ),
+    'float': (
+        'numeric(14, 4)',
+        (1, True, 'validate_float'),
+        lambda rnd: f'{rnd.uniform(-100000, 100000):.2f}',
+        lambda rnd: ''
+    ),
+    'str': (
+        'character varying(30)',
+        (30, True, 'validate_str'),
+        lambda rnd: ''.join(rnd.choices(BENCH_CHARS, k=rnd.randint(1, 30))).strip() or 'a',
+        lambda rnd: ''
+    ),
+    'date': (
+        'date',
+        (('-', 'Y', 'M', 'D'), True, 'validate_date'),
+        lambda rnd: (BENCH_DATE + timedelta(days=rnd.randint(0, 9000))).isoformat(),
+        lambda rnd: f'2020-02-{rnd.randint(30, 31)}'
+    ),
+}
+DEFAULT_TYPES = ('int', 'str', 'float', 'date', 'str')
+
+
+def get_bench_columns(types=DEFAULT_TYPES):
+    """
+    Fonction qui renvoie les colonnes du fichier synthétique, la première colonne "id" est la
+    clé unique de la table
+        :param types: types des colonnes, clés de BENCH_TYPES
+        :return: list des (champs, (taille, obligatoire, validateur)), comme get_champs_types
+    """
+    columns_table = [('id', BENCH_TYPES['int'][1])]
+
+    for i, tipe in enumerate(types, 1):
+        if tipe not in BENCH_TYPES:
+            raise ValueError(f"type {tipe} inconnu, types possibles : {', '.join(BENCH_TYPES)}")
+
+        columns_table.append((f'{tipe}_{i}', BENCH_TYPES[tipe][1]))
+
+    return columns_table
+
+
+def generate_csv(file_path, nb_rows, types=DEFAULT_TYPES, error_rate=0.0, encoding='utf-8',
+                 sep=';', seed=0):
+    """
+    Fonction qui génère un fichier csv synthétique, avec une ligne d'entêtes
+        :param file_path: fichier à générer
+        :param nb_rows: nombre de lignes hors entêtes
+        :param types: types des colonnes, clés de BENCH_TYPES, en plus de la colonne id
+        :param error_rate: proportion de lignes avec une valeur en erreur
+        :param encoding: encoding du fichier
+        :param sep: séparateur
+        :param seed: graine du générateur aléatoire, pour des fichiers identiques d'une
+                     version à l'autre
+        :return: nombre de lignes en erreur
+    """
+    rnd = random.Random(seed)
+    columns_table = get_bench_columns(types)
+    generators = [BENCH_TYPES[tipe] for tipe in types]
+    nb_errors = 0
+
+    with open(file_path, 'w', encoding=encoding, errors='replace', newline='') as csv_file:
+        csv_file.write(sep.join(r[0] for r in columns_table) + '\n')
+
+        for num in range(1, nb_rows + 1):
+            values = [generator[2](rnd) for generator in generators]
+
+            if error_rate and rnd.random() < error_rate:
+                i = rnd.randrange(len(values))
+                values[i] = generators[i][3](rnd)
+                nb_errors += 1
+
+            csv_file.write(sep.join([str(num)] + values) + '\n')
+
+    return nb_errors
+
+
+def measure(run, nb_rows, setup=None, memory=True, repeat=1):
+    """
+    Fonction qui mesure une étape : repeat passes chronométrées dont on garde la meilleure,
+    puis une passe sous tracemalloc pour le pic mémoire Python, les allocations de libpq ne
+    sont pas comptées
+        :param run: fonction de l'étape, sans argument
+        :param nb_rows: nombre de lignes traitées par l'étape
+        :param setup: fonction appelée avant chaque passe, hors mesure
+        :param memory: si False, pas de passe mémoire
+        :param repeat: nombre de passes chronométrées
+        :return: dict {rows, seconds, rows_s, peak_memory} ou {error}
+    """
+    try:
+        seconds = None
+
+        for _ in range(max(repeat, 1)):
+            if setup is not None:
+                setup()
+
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            seconds = elapsed if seconds is None else min(seconds, elapsed)
+
+        result = {
+            'rows': nb_rows,
+            'seconds': round(seconds, 6),
+            'rows_s': round(nb_rows / seconds, 1) if seconds else None,
+        }
+
+        if memory:
+            if setup is not None:
+                setup()
+
+            tracemalloc.start()
+
+            try:
+                run()
+                result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+    except Exception as error:
+        return {'error': f'{error.__class__.__name__}: {error}'}
+
+    return result
+
+
+class TemporaryPostgresql:
+    """
+    Cluster PostgreSQL jetable : initdb dans un répertoire temporaire, démarrage sur un socket
+    unix et un port libre, arrêt et suppression en sortie
+        exemple:
+            with TemporaryPostgresql() as dsn:
+                cnx = psycopg2.connect(dsn)
+    """
+
+    def __init__(self, bin_dir=None):
+        """
+        Initialisation de la class TemporaryPostgresql
+            :param bin_dir: répertoire de initdb et pg_ctl, sinon $PG_BIN, le PATH, puis
+                            pg_config --bindir
+        """
+        self.bin_dir = bin_dir or os.environ.get('PG_BIN') or self.find_bin_dir()
+        self.base_dir = None
+        self.data_dir = None
+
+    @staticmethod
+    def find_bin_dir():
+        """
+        Fonction qui recherche le répertoire des binaires PostgreSQL
+            :return: répertoire ou None
+        """
+        initdb = shutil.which('initdb')
+
+        if initdb is not None:
+            return os.path.dirname(initdb)
+
+        try:
+            return subprocess.run(
+                ['pg_config', '--bindir'], check=True, capture_output=True, text=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def command(self, name, *args):
+        """
+        Fonction qui lance un binaire PostgreSQL
+            :param name: binaire
+            :param args: arguments
+            :return: None
+        """
+        subprocess.run(
+            [os.path.join(self.bin_dir, name), *args], check=True, capture_output=True
+        )
+
+    def __enter__(self):
+        if self.bin_dir is None or not os.path.isfile(os.path.join(self.bin_dir, 'initdb')):
+            raise OSError("initdb n'est pas disponible, renseignez PG_BIN")
+
+        self.base_dir = tempfile.mkdtemp(prefix='bench_pg_')
+        self.data_dir = os.path.join(self.base_dir, 'data')
+
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+
+        try:
+            self.command(
+                'initdb', '-D', self.data_dir, '-A', 'trust', '-U', 'bench', '-E', 'UTF8'
+            )
+            self.command(
+                'pg_ctl', '-D', self.data_dir, '-w', '-l', os.path.join(self.base_dir, 'log'),
+                '-o', f"-p {port} -k {self.base_dir} -c listen_addresses=''", 'start'
+            )
+        except Exception:
+            shutil.rmtree(self.base_dir, ignore_errors=True)
+            raise
+
+        return f'dbname=postgres user=bench host={self.base_dir} port={port}'
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self.command('pg_ctl', '-D', self.data_dir, '-w', '-m', 'immediate', 'stop')
+        finally:
+            shutil.rmtree(self.base_dir, ignore_errors=True)
+
+
+def get_version():
+    """
+    Fonction qui renvoie la version du code mesuré
+        :return: git describe ou None
+    """
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True,
+            capture_output=True,
+            text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_validation(work_dir, file_csv, nb_rows, columns_table, encoding, memory, repeat=1):
+    """
+    Fonction qui mesure les étapes de validation, sans base de données
+        :param work_dir: répertoire de travail
+        :param file_csv: fichier généré par generate_csv
+        :param nb_rows: nombre de lignes du fichier
+        :param columns_table: colonnes de get_bench_columns
+        :param encoding: encoding du fichier
+        :param memory: voir measure
+        :param repeat: voir measure
+        :return: dict {étape: mesure}
+    """
+    stages = {}
+    plan = ValidatorPlan(columns_table)
+    columns = list(range(len(columns_table)))
+    to_validate = os.path.join(work_dir, 'TO_VALIDATED_bench.csv')
+    error_dir = os.path.join(work_dir, 'errors')
+    os.makedirs(error_dir, exist_ok=True)
+
+    with open(file_csv, encoding=encoding, newline='') as open_file:
+        rows = [line.rstrip('\n').split(';') for line in open_file][1:]
+
+    stages['remove_columuns_lines'] = measure(
+        lambda: remove_columuns_lines(
+            file_csv,
+            to_validate,
+            columns,
+            setting_delete_lines((), 1),
+            sep=';',
+            encoding_e=encoding,
+            encoding_s='utf-8',
+            errors='replace'
+        ),
+        nb_rows,
+        memory=memory,
+        repeat=repeat
+    )
+
+    stages['validate_element'] = measure(
+        lambda: [
+            [validate_element(row[i], col, tup) for i, (col, tup) in enumerate(columns_table)]
+            for row in rows
+        ],
+        nb_rows,
+        memory=memory,
+        repeat=repeat
+    )
+    stages['validator_plan'] = measure(
+        lambda: [plan.validate(row) for row in rows], nb_rows, memory=memory, repeat=repeat
+    )
+    stages['validator_plan_batch'] = measure(
+        lambda: [plan.validate_batch(rows[i:i + 10000]) for i in range(0, len(rows), 10000)],
+        nb_rows,
+        memory=memory,
+        repeat=repeat
+    )
+
+    file_bench = os.path.join(work_dir, 'bench_validation.csv')
+    kwargs_validate = {
+        'error_dir': error_dir,
+        'header_line': 1,
+        'encoding_e': encoding,
+        'time_sleep': 0
+    }
+
+    def setup():
+        for name in os.listdir(error_dir):
+            os.remove(os.path.join(error_dir, name))
+
+        shutil.copyfile(file_csv, file_bench)
+
+    def validation(**kwargs):
+        CsvTxtValidator(file_bench, plan, **kwargs_validate, **kwargs).validation
+
+    def iter_validation():
+        try:
+            for _ in CsvTxtValidator(file_bench, plan, **kwargs_validate).iter_validation():
+                pass
+        except Exception:
+            pass
+
+    stages['validation'] = measure(validation, nb_rows, setup, memory, repeat)
+    stages['validation_batch'] = measure(
+        lambda: validation(batch_size=10000), nb_rows, setup, memory, repeat
+    )
+    stages['iter_validation'] = measure(iter_validation, nb_rows, setup, memory, repeat)
+
+    if (os.cpu_count() or 1) > 1:
+        # Le fichier généré peut être sous le seuil de la validation en parallèle, qui ferait
+        # alors la validation séquentielle, le seuil est levé le temps de la mesure
+        parallel_min_size = CsvTxtValidator.PARALLEL_MIN_SIZE
+        CsvTxtValidator.PARALLEL_MIN_SIZE = 0
+
+        try:
+            stages['validation_parallel'] = measure(
+                lambda: validation(workers=os.cpu_count()), nb_rows, setup, memory, repeat
+            )
+        finally:
+            CsvTxtValidator.PARALLEL_MIN_SIZE = parallel_min_size
+
+    for name in (to_validate, file_bench):
+        if os.path.isfile(name):
+            os.remove(name)
+
+    return stages
+
+
+def bench_upsert(dsn, file_csv, columns_table, types, encoding, memory, repeat=1):
+    """
+    Fonction qui mesure les chargements execute_prepared_upsert et execute_copy_upsert, csv et
+    binaire, en insertion dans la table vide, puis en mise à jour de toutes les lignes
+        :param dsn: chaîne de connexion
+        :param file_csv: fichier généré par generate_csv
+        :param columns_table: colonnes de get_bench_columns
+        :param types: types des colonnes, en plus de la colonne id
+        :param encoding: encoding du fichier
+        :param memory: voir measure
+        :param repeat: voir measure
+        :return: dict {étape: mesure}
+    """
+    stages = {}
+    plan = ValidatorPlan(columns_table)
+    champs = [r[0] for r in columns_table]
+
+    with open(file_csv, encoding=encoding, newline='') as open_file:
+        rows = [plan.validate(line.rstrip('\n').split(';')) for line in open_file][1:]
+
+    # Les lignes en erreur ne sont pas chargées
+    rows = [row for row in rows if not any(isinstance(value, tuple) for value in row)]
+
+    cnx = psycopg2.connect(dsn)
+
+    try:
+        definition = ', '.join(
+            f'"{col}" {BENCH_TYPES[tipe][0]} NOT NULL'
+            for (col, _), tipe in zip(columns_table[1:], types)
+        )
+
+        with cnx:
+            with cnx.cursor() as cursor:
+                cursor.execute(f'DROP TABLE IF EXISTS "{BENCH_TABLE}"')
+                cursor.execute(
+                    f'CREATE TABLE "{BENCH_TABLE}" ("id" integer PRIMARY KEY, {definition})'
+                )
+
+        clear_schema_cache(BENCH_TABLE)
+
+        def kwargs_upsert(copy=None):
+            return {
+                'cnx': cnx,
+                'table': BENCH_TABLE,
+                'champs': champs,
+                'rows': rows,
+                'champs_unique': ('id',),
+                'upsert': True,
+                'copy': copy
+            }
+
+        def truncate():
+            with cnx:
+                with cnx.cursor() as cursor:
+                    cursor.execute(f'TRUNCATE "{BENCH_TABLE}"')
+
+        def load():
+            truncate()
+            execute_copy_upsert(kwargs_upsert())
+
+        for name, upsert, copy in (
+                ('execute_prepared_upsert', execute_prepared_upsert, None),
+                ('execute_copy_upsert', execute_copy_upsert, True),
+                ('execute_copy_upsert_binary', execute_copy_upsert, 'binary')
+        ):
+            stages[f'{name}_insert'] = measure(
+                lambda: upsert(kwargs_upsert(copy)), len(rows), truncate, memory, repeat
+            )
+            stages[f'{name}_update'] = measure(
+                lambda: upsert(kwargs_upsert(copy)), len(rows), load, memory, repeat
+            )
+
+        with cnx:
+            with cnx.cursor() as cursor:
+                cursor.execute(f'DROP TABLE "{BENCH_TABLE}"')
+
+    finally:
+        cnx.close()
+
+    return stages
+
+
+def run_benchmark(nb_rows=100000, types=DEFAULT_TYPES, error_rate=0.0, encoding='utf-8',
+                  seed=0, dsn=None, database=True, memory=True, repeat=1):
+    """
+    Fonction qui lance le benchmark de toutes les étapes
+        :param nb_rows: nombre de lignes du fichier synthétique
+        :param types: types des colonnes, clés de BENCH_TYPES, en plus de la colonne id
+        :param error_rate: proportion de lignes en erreur
+        :param encoding: encoding du fichier synthétique
+        :param seed: graine du générateur aléatoire
+        :param dsn: base existante, sinon un cluster TemporaryPostgresql est lancé
+        :param database: si False, pas d'étape de chargement
+        :param memory: si False, pas de mesure du pic mémoire
+        :param repeat: nombre de passes chronométrées par étape, la meilleure est gardée
+        :return: dict des résultats, sérialisable en json
+    """
+    columns_table = get_bench_columns(types)
+    work_dir = tempfile.mkdtemp(prefix='bench_csv_')
+    results = {
+        'date': dt.now().isoformat(),
+        'version': get_version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {
+            'rows': nb_rows,
+            'types': list(types),
+            'error_rate': error_rate,
+            'encoding': encoding,
+            'seed': seed,
+            'repeat': repeat,
+        },
+        'stages': {},
+    }
+
+    try:
+        file_csv = os.path.join(work_dir, 'bench.csv')
+        start = time.perf_counter()
+        results['parameters']['error_rows'] = generate_csv(
+            file_csv, nb_rows, types, error_rate, encoding, seed=seed
+        )
+        results['parameters']['generate_seconds'] = round(time.perf_counter() - start, 6)
+        results['parameters']['file_size'] = os.path.getsize(file_csv)
+
+        results['stages'].update(
+            bench_validation(
+                work_dir, file_csv, nb_rows, columns_table, encoding, memory, repeat
+            )
+        )
+
+        if database:
+            try:
+                if dsn is None:
+                    with TemporaryPostgresql() as temp_dsn:
+                        stages = bench_upsert(
+                            temp_dsn, file_csv, columns_table, types, encoding, memory, repeat
+                        )
+                else:
+                    stages = bench_upsert(
+                        dsn, file_csv, columns_table, types, encoding, memory, repeat
+                    )
+
+                results['stages'].update(stages)
+
+            except Exception as error:
+                results['stages']['upsert'] = {
+                    'skipped': f'{error.__class__.__name__}: {error}'
+                }
+
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return results
+
+
+def compare_results(old, new, threshold=0.1):
+    """
+    Fonction qui compare les lignes/s de deux résultats de run_benchmark
+        :param old: résultats de référence
+        :param new: nouveaux résultats
+        :param threshold: baisse relative des lignes/s au delà de laquelle on a une régression
+        :return: list des (étape, lignes/s old, lignes/s new, ratio, régression)
+    """
+    comparison = []
+
+    for stage, result in new['stages'].items():
+        old_rows_s = old['stages'].get(stage, {}).get('rows_s')
+        new_rows_s = result.get('rows_s')
+
+        if not old_rows_s or not new_rows_s:
+            continue
+
+        ratio = new_rows_s / old_rows_s
+        comparison.append((stage, old_rows_s, new_rows_s, round(ratio, 3), ratio < 1 - threshold))
+
+    return comparison
+
+
+def main(argv=None):
+    """
+    Lancement en ligne de commande
+        :param argv: arguments, sys.argv[1:] si None
+        :return: code retour, 1 si une régression est trouvée par --compare
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--types', default=','.join(DEFAULT_TYPES))
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--encoding', default='utf-8')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dsn', default=None)
+    parser.add_argument('--no-database', action='store_true')
+    parser.add_argument('--no-memory', action='store_true')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), default=None)
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0], encoding='utf-8') as old_file, \
+                open(args.compare[1], encoding='utf-8') as new_file:
+            comparison = compare_results(json.load(old_file), json.load(new_file), args.threshold)
+
+        for stage, old_rows_s, new_rows_s, ratio, regression in comparison:
+            flag = ' REGRESSION' if regression else ''
+            print(f'{stage:40} {old_rows_s:>14} {new_rows_s:>14} {ratio:>8}{flag}')
+
+        return 1 if any(r[-1] for r in comparison) else 0
+
+    results = run_benchmark(
+        nb_rows=args.rows,
+        types=tuple(r for r in args.types.split(',') if r),
+        error_rate=args.error_rate,
+        encoding=args.encoding,
+        seed=args.seed,
+        dsn=args.dsn,
+        database=not args.no_database,
+        memory=not args.no_memory,
+        repeat=args.repeat
+    )
+    output = json.dumps(results, indent=4, ensure_ascii=False)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as json_file:
+            json_file.write(output)
+    else:
+        print(output)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
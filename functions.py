@@ -2,9 +2,49 @@
 Module apportant des fonctionnalités pratique à base de psycopg2
 """
 
+import atexit
+import bz2
+import codecs
+import csv
+import glob
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import mmap
+import os
+import queue
+import re
+import shutil
+import smtplib
+import struct
+import sys
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from operator import itemgetter
+from itertools import count, cycle, islice, repeat
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
 import psycopg2
 from psycopg2.extras import execute_batch
-from psycopg2.extensions import parse_dsn
+from psycopg2.extensions import (
+    parse_dsn, TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INERROR
+)
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 TYPE_POSTGRESQL = {
     'bigint': ('int', 'validate_int'),
@@ -51,6 +91,12 @@ TYPE_POSTGRESQL = {
     'xml': ('xml', 'validate_xml'),
 }
 
+COPY_SEP = ';'
+COPY_NULL = '<NULL>'
+COPY_BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+COPY_BINARY_TRAILER = struct.pack('!h', -1)
+COPY_BINARY_NULL = struct.pack('!i', -1)
+
 
 def clean_sql_in(sql, entier=None):
     """
@@ -82,6 +128,18 @@ def clean_sql_in(sql, entier=None):
     return sql_in
  
 
+def get_backoff(attempt, backoff=0.5, max_backoff=30):
+    """
+    Fonction qui renvoie le délai d'attente avant une nouvelle tentative de connexion,
+    exponentiel : 0.5, 1, 2, 4 ... secondes, borné à max_backoff
+        :param attempt: numéro de la tentative qui a échoué, commence à 0
+        :param backoff: délai après le premier échec
+        :param max_backoff: délai maximum
+        :return: délai en secondes
+    """
+    return min(backoff * 2 ** attempt, max_backoff)
+
+
 class WithCnxPostgresql:
     """
     Classe de connection à postgresql avec with
@@ -98,9 +156,25 @@ class WithCnxPostgresql:
                 cur.execute(sql)
 
         conn.close()
+
+    Si un pool est donné, la connexion est prise dans le pool et lui est rendue en sortie :
+        with WithCnxPostgresql(dsn, get_pool_postgresql(dsn)) as conn:
+            ...
     """
-    def __init__(self, string_of_connexion):
+    def __init__(self, string_of_connexion, pool=None):
         self.connexion = None
+        self.pool = pool
+
+        if pool is not None:
+            try:
+                self.connexion = pool.getconn()
+
+            except psycopg2.Error as error:
+                log_line = f"WithCnxPostgresql error: {error}\n"
+                print(log_line)
+
+            return
+
         i = 0
         while i < 5:
             try:
@@ -112,6 +186,9 @@ class WithCnxPostgresql:
                 log_line = f"WithCnxPostgresql error: {error}\n"
                 print(log_line)
 
+            if i < 4:
+                time.sleep(get_backoff(i))
+
             i += 1
 
     def __enter__(self):
@@ -119,10 +196,13 @@ class WithCnxPostgresql:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.connexion is not None:
-            self.connexion.close()
+            if self.pool is not None:
+                self.pool.putconn(self.connexion)
+            else:
+                self.connexion.close()
 
 
-def cnx_postgresql(string_of_connexion):
+def cnx_postgresql(string_of_connexion, pool=None):
     """
     Fonction de connexion à Postgresql par psycopg2
         :param string_of_connexion: cnx_string = (
@@ -132,11 +212,16 @@ def cnx_postgresql(string_of_connexion):
                                         f"host={HOST_DATABASE} "
                                         f"port={PORT_DATABASE}"
                                     )
+        :param pool: PoolCnxPostgresql, si la connexion doit être prise dans un pool,
+                     elle devra lui être rendue par pool.putconn(cnx)
         :return: cnx
     """
     try:
-        kwargs_cnx = parse_dsn(string_of_connexion)
-        connexion = psycopg2.connect(**kwargs_cnx)
+        if pool is not None:
+            connexion = pool.getconn()
+        else:
+            kwargs_cnx = parse_dsn(string_of_connexion)
+            connexion = psycopg2.connect(**kwargs_cnx)
 
     except psycopg2.Error as error:
         log_line = f"cnx_postgresql error: {error}\n"
@@ -146,10 +231,255 @@ def cnx_postgresql(string_of_connexion):
     return connexion
 
 
-def get_types_champs(cnx, table, list_champs=None):
+class PoolCnxPostgresql:
     """
-    Fonction qui récupère les types de champs de la table et des champs demandés pour la requête
-        :return: list des champs, (taille, type, list des champs)
+    Pool de connexions à postgresql, réutilisées d'une intégration à l'autre, pour ne payer
+    l'établissement de la connexion (TLS, authentification) qu'une seule fois.
+        - au plus maxconn connexions ouvertes, au delà getconn attend qu'une connexion soit rendue
+        - chaque connexion est vérifiée (SELECT 1) avant d'être donnée, une connexion morte est
+          fermée et remplacée
+        - en cas d'échec de connexion, nouvelles tentatives avec un délai exponentiel
+        - getconns prend plusieurs connexions d'un seul coup, sans en garder une partie en
+          attendant les autres, deux demandes simultanées ne peuvent donc pas se bloquer
+
+        exemple:
+            pool = PoolCnxPostgresql(cnx_string, minconn=1, maxconn=5)
+            cnx = pool.getconn()
+            try:
+                with cnx:
+                    with cnx.cursor() as cursor:
+                        cursor.execute(sql)
+            finally:
+                pool.putconn(cnx)
+    """
+
+    def __init__(self, string_of_connexion, minconn=1, maxconn=5, retries=5, backoff=0.5,
+                 max_backoff=30, timeout=None):
+        """
+        Initialisation de la class PoolCnxPostgresql, les connexions ne sont ouvertes qu'au
+        premier getconn
+            :param string_of_connexion: voir cnx_postgresql
+            :param minconn: nombre de connexions ouvertes à la création du pool
+            :param maxconn: nombre maximum de connexions ouvertes
+            :param retries: nombre de tentatives de connexion
+            :param backoff: délai après le premier échec, doublé à chaque échec
+            :param max_backoff: délai maximum entre deux tentatives
+            :param timeout: attente maximum d'une connexion libre, None pour attendre sans fin
+        """
+        self.kwargs_cnx = parse_dsn(string_of_connexion)
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.pool = None
+        self.lock = threading.Lock()
+        self.slots = threading.Condition()
+        self.used = 0
+
+    def connect(self):
+        """
+        Fonction qui prend une connexion dans le pool psycopg2, en le créant si besoin, avec
+        des nouvelles tentatives à délai exponentiel en cas d'échec
+            :return: cnx
+        """
+        attempt = 0
+
+        while True:
+            try:
+                with self.lock:
+                    if self.pool is None:
+                        self.pool = ThreadedConnectionPool(
+                            self.minconn, self.maxconn, **self.kwargs_cnx
+                        )
+
+                return self.pool.getconn()
+
+            except psycopg2.OperationalError as error:
+                log_line = f"PoolCnxPostgresql error: {error}\n"
+                print(log_line)
+                attempt += 1
+
+                if attempt >= self.retries:
+                    raise
+
+                time.sleep(get_backoff(attempt - 1, self.backoff, self.max_backoff))
+
+    @staticmethod
+    def is_alive(cnx):
+        """
+        Fonction qui vérifie qu'une connexion répond
+            :param cnx: connexion psycopg2
+            :return: bool
+        """
+        if cnx.closed:
+            return False
+
+        try:
+            with cnx.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            cnx.rollback()
+
+        except psycopg2.Error:
+            return False
+
+        return True
+
+    def resize(self, maxconn):
+        """
+        Fonction qui augmente le nombre maximum de connexions ouvertes, un maxconn inférieur
+        à l'actuel est ignoré
+            :param maxconn: nombre maximum de connexions ouvertes
+            :return: None
+        """
+        with self.slots:
+            if maxconn <= self.maxconn:
+                return
+
+            with self.lock:
+                self.maxconn = maxconn
+
+                if self.pool is not None:
+                    self.pool.maxconn = maxconn
+
+            self.slots.notify_all()
+
+    def release_slots(self, nb):
+        """
+        Fonction qui libère nb places du pool
+            :param nb: nombre de places
+            :return: None
+        """
+        with self.slots:
+            self.used -= nb
+            self.slots.notify_all()
+
+    def getconns(self, nb, timeout=None):
+        """
+        Fonction qui renvoie nb connexions vérifiées du pool, à rendre par putconn. Les nb
+        places sont prises ensemble, quand elles sont toutes libres
+            :param nb: nombre de connexions
+            :param timeout: attente maximum des places libres, None pour self.timeout
+            :return: list des cnx
+        """
+        timeout = self.timeout if timeout is None else timeout
+
+        with self.slots:
+            if nb > self.maxconn:
+                raise PoolError(
+                    f"PoolCnxPostgresql : {nb} connexions demandées pour {self.maxconn} au plus"
+                )
+
+            if not self.slots.wait_for(lambda: self.maxconn - self.used >= nb, timeout):
+                raise PoolError("PoolCnxPostgresql : pas de connexion libre")
+
+            self.used += nb
+
+        connexions = []
+
+        try:
+            while len(connexions) < nb:
+                cnx = self.connect()
+
+                if self.is_alive(cnx):
+                    connexions.append(cnx)
+                else:
+                    self.pool.putconn(cnx, close=True)
+
+        except BaseException:
+            for cnx in connexions:
+                self.pool.putconn(cnx)
+
+            self.release_slots(nb)
+            raise
+
+        return connexions
+
+    def getconn(self):
+        """
+        Fonction qui renvoie une connexion vérifiée du pool, à rendre par putconn
+            :return: cnx
+        """
+        return self.getconns(1)[0]
+
+    def putconn(self, cnx):
+        """
+        Fonction qui rend une connexion au pool, une transaction en cours est annulée et la
+        session est remise à zéro par DISCARD ALL (requêtes préparées, tables temporaires,
+        paramètres SET), ce que le rollback ne fait pas
+            :param cnx: connexion prise par getconn
+            :return: None
+        """
+        try:
+            close = bool(cnx.closed)
+
+            if not close:
+                try:
+                    if cnx.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                        cnx.rollback()
+
+                    # DISCARD ALL ne peut pas être exécuté dans une transaction
+                    autocommit = cnx.autocommit
+                    cnx.autocommit = True
+
+                    with cnx.cursor() as cursor:
+                        cursor.execute("DISCARD ALL")
+
+                    cnx.autocommit = autocommit
+
+                except psycopg2.Error:
+                    close = True
+
+            self.pool.putconn(cnx, close=close)
+
+        finally:
+            self.release_slots(1)
+
+    def closeall(self):
+        """
+        Fonction qui ferme toutes les connexions du pool
+            :return: None
+        """
+        with self.lock:
+            if self.pool is not None:
+                self.pool.closeall()
+                self.pool = None
+
+
+POOLS_POSTGRESQL = {}
+POOLS_LOCK = threading.Lock()
+
+
+def get_pool_postgresql(string_of_connexion, minconn=1, maxconn=5):
+    """
+    Fonction qui renvoie le pool de connexions du process, pour une chaîne de connexion. Un
+    pool existant est agrandi si maxconn est supérieur au sien
+        :param string_of_connexion: voir cnx_postgresql
+        :param minconn: nombre de connexions ouvertes à la création du pool
+        :param maxconn: nombre maximum de connexions ouvertes
+        :return: PoolCnxPostgresql
+    """
+    with POOLS_LOCK:
+        if string_of_connexion not in POOLS_POSTGRESQL:
+            POOLS_POSTGRESQL[string_of_connexion] = PoolCnxPostgresql(
+                string_of_connexion, minconn, maxconn
+            )
+        else:
+            POOLS_POSTGRESQL[string_of_connexion].resize(maxconn)
+
+        return POOLS_POSTGRESQL[string_of_connexion]
+
+
+SCHEMA_CACHE_TTL = 300
+SCHEMA_CACHE = {}
+SCHEMA_CACHE_LOCK = threading.Lock()
+
+
+def query_types_champs(cnx, table, list_champs=None):
+    """
+    Fonction qui interroge information_schema, pour les types de champs de la table
+        :return: dict {champ: (type, taille, is_nullable)}
     """
     champs = f"AND column_name {clean_sql_in(list_champs)}" if list_champs is not None else ""
 
@@ -164,18 +494,191 @@ def get_types_champs(cnx, table, list_champs=None):
         cursor.execute(sql_champs)
         list_champs_taille_type = {r[0]: tuple(r[1:]) for r in cursor.fetchall()}
 
+    return list_champs_taille_type
+
+
+def get_schema_marker(cnx, table):
+    """
+    Fonction qui renvoie un marqueur de version de la définition de la table, lu dans le
+    catalogue (pg_class, pg_attribute), beaucoup plus rapide que information_schema. Le
+    marqueur change à chaque création, suppression ou modification de la table ou de ses colonnes
+        :return: str ou None si la table n'existe pas
+    """
+    with cnx.cursor() as cursor:
+        sql_marker = f"""
+            SELECT md5(string_agg(
+                c.oid::text || '.' || c.xmin::text || '.' || a.attnum::text || '.' || a.xmin::text,
+                ',' ORDER BY c.oid, a.attnum
+            ))
+            FROM pg_class c
+            JOIN pg_attribute a ON a.attrelid = c.oid
+            WHERE c.relname = '{table}'
+        """
+        cursor.execute(sql_marker)
+        marker = cursor.fetchone()[0]
+
+    return marker
+
+
+def clear_schema_cache(table=None):
+    """
+    Fonction qui vide le cache des types de champs, pour une table ou pour toutes les tables
+        :param table: table à retirer du cache, None pour tout vider
+        :return: None
+    """
+    with SCHEMA_CACHE_LOCK:
+        if table is None:
+            SCHEMA_CACHE.clear()
+        else:
+            for key in [k for k in SCHEMA_CACHE if k[1] == table]:
+                del SCHEMA_CACHE[key]
+
+
+def get_types_champs(cnx, table, list_champs=None):
+    """
+    Fonction qui récupère les types de champs de la table et des champs demandés pour la requête.
+    Les types de champs de la table sont gardés en cache pour le process, par base et par table :
+    pendant SCHEMA_CACHE_TTL secondes aucune requête n'est faite, puis seul le marqueur du
+    catalogue est relu et information_schema n'est interrogé que si la table a changé.
+    SCHEMA_CACHE_TTL = 0 désactive le cache.
+        :return: list des champs, (taille, type, list des champs)
+    """
+    if not SCHEMA_CACHE_TTL:
+        return query_types_champs(cnx, table, list_champs), list_champs
+
+    key = (cnx.dsn, table)
+    now = time.monotonic()
+
+    with SCHEMA_CACHE_LOCK:
+        cached = SCHEMA_CACHE.get(key)
+
+    if cached is None or now - cached[0] > SCHEMA_CACHE_TTL:
+        marker = get_schema_marker(cnx, table)
+
+        if cached is None or cached[1] != marker:
+            cached = (now, marker, query_types_champs(cnx, table))
+        else:
+            cached = (now, marker, cached[2])
+
+        with SCHEMA_CACHE_LOCK:
+            SCHEMA_CACHE[key] = cached
+
+    if list_champs is None:
+        return dict(cached[2]), list_champs
+
+    champs = {list_champs} if isinstance(list_champs, str) else set(list_champs)
+    list_champs_taille_type = {k: v for k, v in cached[2].items() if k in champs}
+
     return list_champs_taille_type, list_champs
 
 
+def get_on_conflict(kwargs_upsert):
+    """
+    Fonction qui renvoie la fin de la requête d'insertion, suivant upsert et champs_unique
+        :param kwargs_upsert: dictionaire comprenant -->
+                                   champs: champs de la table, souhaités dans la requête
+                            champs_unique: liste des champs d'unicité dans la table,
+                                            si on veut un Upsert ON CONFLICT UPDATE
+                                   upsert: None explicit, si on ne veut pas d'upsert
+                           skip_unchanged: si True, la mise à jour n'est faite que si au moins
+                                            un champ hors champs_unique est différent
+        :return: ";" ou "ON CONFLICT DO NOTHING;" ou " ON CONFLICT (...) DO UPDATE SET ...;"
+    """
+    if kwargs_upsert['upsert'] is None:
+        return ';'
+
+    if kwargs_upsert['champs_unique'] is None:
+        return 'ON CONFLICT DO NOTHING;'
+
+    chu = "("
+    for k in kwargs_upsert['champs_unique']:
+        chu += f'"{k}", '
+    chu = f'{chu[:-2]})'
+    on_conflict = f' ON CONFLICT {chu} DO UPDATE SET '
+    champs_update = [
+        str(champ) for champ in kwargs_upsert['champs']
+        if champ not in kwargs_upsert['champs_unique']
+    ]
+    for champ in champs_update:
+        on_conflict += f'"{champ}" = excluded."{champ}", '
+    on_conflict = on_conflict[:-2]
+
+    if kwargs_upsert.get('skip_unchanged'):
+        table = kwargs_upsert['table']
+        existant = ", ".join(f'"{table}"."{champ}"' for champ in champs_update)
+        nouveau = ", ".join(f'excluded."{champ}"' for champ in champs_update)
+        on_conflict += f' WHERE ({existant}) IS DISTINCT FROM ({nouveau})'
+
+    return f'{on_conflict};'
+
+
+class CountRows:
+    """
+    Itérable qui compte les lignes de rows au fil de l'eau
+    """
+
+    def __init__(self, rows):
+        """
+        Initialisation de la class CountRows
+            :param rows: itérable des lignes
+        """
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            yield row
+
+
+def get_tuples_counts(cursor, table):
+    """
+    Fonction qui renvoie le nombre de lignes insérées et mises à jour dans la table, depuis le
+    début de la transaction en cours
+        :param cursor: cursor psycopg2
+        :param table: table
+        :return: (inserted, updated)
+    """
+    cursor.execute(
+        "SELECT n_tup_ins, n_tup_upd FROM pg_stat_xact_user_tables WHERE relid = %s::regclass",
+        (f'"{table}"',)
+    )
+    counts = cursor.fetchone()
+
+    return counts if counts is not None else (0, 0)
+
+
+def get_upsert_counts(cursor, table, counts_before, nb_rows):
+    """
+    Fonction qui renvoie les compteurs d'un upsert skip_unchanged
+        :param cursor: cursor psycopg2
+        :param table: table
+        :param counts_before: get_tuples_counts avant l'upsert
+        :param nb_rows: nombre de lignes envoyées
+        :return: dict {"inserted": n, "updated": n, "skipped": n}
+    """
+    counts_after = get_tuples_counts(cursor, table)
+    inserted = counts_after[0] - counts_before[0]
+    updated = counts_after[1] - counts_before[1]
+
+    return {"inserted": inserted, "updated": updated, "skipped": nb_rows - inserted - updated}
+
+
+STATEMENT_IDS = count(1)
+
+
 def execute_prepared_upsert(kwargs_upsert):
     """
     Fonction qui exécute une requete préparée, INSERT ou UPSERT.
     Attention!!! cette requête sera en autocommit.
     exemple :
-    cursor.execute("PREPARE stmt (int, text, bool)
+    cursor.execute("PREPARE stmt_1 (int, text, bool)
     AS INSERT INTO foo VALUES ($1, $2, $3) ON CONFLICT DO NOTHING;")
-    execute_batch(cursor, "EXECUTE stmt (%s, %s, %s)", list_values)
-    cursor.execute("DEALLOCATE stmt")
+    execute_batch(cursor, "EXECUTE stmt_1 (%s, %s, %s)", list_values)
+    cursor.execute("DEALLOCATE stmt_1")
+
+    Le nom de la requête préparée est unique dans le process : une requête restée préparée
+    sur une connexion du pool après une erreur ne peut pas gêner le chargement suivant.
 
         :param kwargs_upsert: dictionaire comprenant -->
                                       cnx: connexion psycopg2
@@ -185,7 +688,9 @@ def execute_prepared_upsert(kwargs_upsert):
                             champs_unique: liste des champs d'unicité dans la table,
                                             si on veut un Upsert ON CONFLICT UPDATE
                                    upsert: None explicit, si on ne veut pas d'upsert
-        :return: None
+                           skip_unchanged: si True, les lignes identiques à l'existant ne sont
+                                            pas mises à jour, et les compteurs sont renvoyés
+        :return: None, ou {"inserted": n, "updated": n, "skipped": n} si skip_unchanged
     """
 
     dict_rows = get_types_champs(
@@ -193,10 +698,11 @@ def execute_prepared_upsert(kwargs_upsert):
         kwargs_upsert['table'],
         kwargs_upsert['champs']
     )[0]
-    prepare = "PREPARE stmt ("
+    stmt = f"stmt_{next(STATEMENT_IDS)}"
+    prepare = f"PREPARE {stmt} ("
     insert = "("
     colonnes = "("
-    execute = "EXECUTE stmt ("
+    execute = f"EXECUTE {stmt} ("
 
     for i, k in enumerate(kwargs_upsert['champs']):
         champ, t_p = k, dict_rows[k][0]
@@ -211,178 +717,1457 @@ def execute_prepared_upsert(kwargs_upsert):
     {prepare[:-2]}) AS INSERT INTO "{kwargs_upsert['table']}" {colonnes} VALUES {insert} 
     '''
     execute = f'{execute[:-2]});'
-
-    if kwargs_upsert['upsert'] is None:
-        prepare += ';'
-
-    else:
-
-        if kwargs_upsert['champs_unique'] is None:
-            prepare += 'ON CONFLICT DO NOTHING;'
-
-        else:
-            chu = "("
-            for k in kwargs_upsert['champs_unique']:
-                chu += f'"{k}", '
-            chu = f'{chu[:-2]})'
-            prepare += f' ON CONFLICT {chu} DO UPDATE SET '
-            for champ in kwargs_upsert['champs']:
-                if champ not in kwargs_upsert['champs_unique']:
-                    prepare += f'"{str(champ)}" = excluded."{str(champ)}", '
-
-            prepare = f'{prepare[:-2]};'
+    prepare += get_on_conflict(kwargs_upsert)
 
     # print(prepare)
     # print(execute)
+    skip_unchanged = kwargs_upsert.get('skip_unchanged')
+    rows = CountRows(kwargs_upsert['rows']) if skip_unchanged else kwargs_upsert['rows']
+    counts = None
+
     with kwargs_upsert['cnx'] as cnx:
         with cnx.cursor() as cursor:
+            if skip_unchanged:
+                counts_before = get_tuples_counts(cursor, kwargs_upsert['table'])
+
             cursor.execute(prepare)
-            execute_batch(cursor, execute, kwargs_upsert['rows'])
-            cursor.execute("DEALLOCATE stmt")
 
+            try:
+                execute_batch(cursor, execute, rows)
+
+            finally:
+                # La requête préparée survit au rollback, elle est retirée aussi en cas d'erreur
+                # de lecture des lignes, une transaction en erreur est laissée à putconn
+                if cnx.info.transaction_status != TRANSACTION_STATUS_INERROR:
+                    cursor.execute(f"DEALLOCATE {stmt}")
 
-class GetModel:
+            if skip_unchanged:
+                counts = get_upsert_counts(
+                    cursor, kwargs_upsert['table'], counts_before, rows.count
+                )
+
+    return counts
+
+
+class IteratorFile:
     """
-    Class de récupération des champs, des champs_et_type et des noms de table, pour un modèle
-    dans Postgresql
+    Objet fichier en lecture seule, alimenté par un itérable de lignes, pour envoyer les lignes
+    à cursor.copy_expert au fil de l'eau, sans fichier intermédiaire
     """
 
-    def __init__(self, cnx, modele, **kwargs):
+    def __init__(self, rows, sep=COPY_SEP):
         """
-        Initialisation de la class GetModel
-            :param cnx: Connexion
-            :param modele: Modèle
-            :param kwargs: date_format=('-', 'Y', 'M', 'D')
-                            exclude=None
-                            fields=None
+        Initialisation de la class IteratorFile
+            :param rows: itérable des lignes (list ou tuple des valeurs)
+            :param sep: séparateur du format csv de COPY
         """
-        self.cnx = cnx
-        self.modele = modele
-
-        self.date_format = kwargs['date_format'] \
-            if 'date_format' in kwargs else ('-', 'Y', 'M', 'D')
-        self.exclude = kwargs['exclude'] if 'exclude' in kwargs else None
-        self.fields = kwargs['fields'] if 'fields' in kwargs else None
+        self.rows = iter(rows)
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(
+            self.buffer,
+            delimiter=sep,
+            quotechar='"',
+            quoting=csv.QUOTE_MINIMAL,
+            lineterminator='\n'
+        )
 
-    def get_model_fields(self):
+    def read(self, size=-1):
         """
-        Fonction qui retourne les champs de modèles
-            :return: générateur de la liste des modèles
+        Fonction qui renvoie au plus size caractères du flux csv
+            :param size: nombre de caractères souhaités, -1 pour tout le flux
+            :return: str, vide en fin de flux
         """
-        model = self.modele.__doc__.replace(self.modele.__name__, "").replace("(", "")
-        model = model.replace(")", "").replace(" ", "")
+        while size < 0 or self.buffer.tell() < size:
+            try:
+                self.writer.writerow(next(self.rows))
+            except StopIteration:
+                break
 
-        if self.exclude is not None:
-            model = ','.join(r for r in model.split(",") if r not in self.exclude)
-        elif self.fields is not None:
-            model = ','.join(r for r in model.split(",") if r in self.fields)
+        data = self.buffer.getvalue()
 
-        return (r for r in model.split(",") if r)
+        if 0 <= size < len(data):
+            data, rest = data[:size], data[size:]
+        else:
+            rest = ''
 
-    def get_model_table_name(self):
-        """
-        Fonction qui retourne le nom de la table d'un modèle
-        :return: le nom de la table dans postgresql
-        """
-        module = self.modele.__module__.split('.')[-2]
-        table_name = f"{module}_{self.modele.__name__.lower()}"
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        self.buffer.write(rest)
 
-        return table_name
+        return data
 
-    def get_champs_types(self):
+    def readline(self, size=-1):
         """
-        Fonction de récupération des champs avec leur type pour les validations
-            :return: genérateur des (champs, (type, taille, validateur))
-                exemple:
-                    [   ('num_facture', (30, True, 'validate_str')),                    <-- string
-                        ('date_retour', (('-', 'Y', 'M', 'D'), True, 'validate_date')), <-- date
-                        ('montant', (2, True, 'validate_float')),                       <-- float
-                        ('qte_vte', (0, True, 'validate_int')),                         <-- int
-                        ('test', (0, True, validate_bool) ]                             <-- booléen
+        Fonction readline, demandée par l'interface fichier de copy_expert
+            :param size: nombre de caractères souhaités, -1 pour tout le flux
+            :return: str
         """
-        champs = tuple(self.get_model_fields())
-        table = self.get_model_table_name()
-        champs_types = get_types_champs(self.cnx, table=table)[0]
-        champs_validate = []
-
-        for k in champs:
-            sol = champs_types[k]
-            tipe = TYPE_POSTGRESQL[sol[0]][0]
-            l_g = self.date_format if tipe == 'date' else sol[1]
-            bol = True if sol[2] == 'NO' else False
-            validator = TYPE_POSTGRESQL[sol[0]][1]
-            champs_validate.append((k, (l_g, bol, validator)))
-
-        return table, champs_validate
+        return self.read(size)
 
 
-LOG_FILE = os.path.join("/home", 'log_mise_a_jour.log')
-LOG_FILE_DIVERS = os.path.join("/home", 'log_divers.log')
+PG_EPOCH_ORDINAL = date(2000, 1, 1).toordinal()
+PG_EPOCH = datetime(2000, 1, 1)
+BOOL_TRUE = {True, 'True', 'true', 't', '1'}
 
 
-def write_log(fichier=None, line_to_write=None):
+def encode_binary_numeric(value):
     """
-    Fonction pour écrire une ligne de log dans un fichier
-        :param fichier: Fichier ou écrire la ligne
-        :param line_to_write: Ligne à écrire
-        :return: None
+    Fonction qui encode une valeur au format binaire numeric de PostgreSQL : nombre de
+    chiffres, poids, signe, échelle, puis les chiffres en base 10000
+        :param value: int, float, Decimal ou str
+        :return: bytes, avec la longueur
     """
-    if fichier and line_to_write:
-        if not os.path.isfile(fichier):
-            open(fichier, 'a').close()
+    number = Decimal(repr(value) if isinstance(value, float) else str(value).strip())
 
-        with open(fichier, 'a', encoding="utf-8") as log_file:
-            log_file.write(line_to_write)
+    if number.is_nan():
+        return struct.pack('!ihhhh', 8, 0, 0, 0xC000 - 0x10000, 0)
 
+    if number.is_infinite():
+        raise ValueError(f"numeric infini non géré : {value}")
 
-def envoi_mail_erreur(erreur, subject_error=None):
-    """
-    Fonction qui envoi les erreurs par mail
-        :param erreur: Erreur à envoyer
-        :param subject_error: Sujet de l'erreur
-        :return: None
-    """
-    msg = MIMEMultipart()
-    msg['From'] = EMAIL_HOST_USER
-    msg['To'] = EMAIL_DEV
+    sign, digits, exponent = number.as_tuple()
+    digits = ''.join(map(str, digits))
+    dscale = max(0, -exponent)
 
-    if subject_error is None:
-        msg['Subject'] = 'Erreur B.I'
+    if exponent >= 0:
+        int_part, frac_part = digits + '0' * exponent, ''
+    elif -exponent >= len(digits):
+        int_part, frac_part = '', '0' * (-exponent - len(digits)) + digits
     else:
-        msg['Subject'] = subject_error
-    print(erreur)
-    message = erreur
-    msg.attach(MIMEText(message))
+        int_part, frac_part = digits[:exponent], digits[exponent:]
 
-    if EMAIL_USE_SSL:
-        mailserver = smtplib.SMTP_SSL(EMAIL_HOST, EMAIL_PORT)
-    else:
-        mailserver = smtplib.SMTP(EMAIL_HOST, EMAIL_PORT)
+    int_part = int_part.zfill((len(int_part) + 3) // 4 * 4)
+    frac_part = frac_part.ljust((len(frac_part) + 3) // 4 * 4, '0')
+    groups = [int(int_part[i:i + 4]) for i in range(0, len(int_part), 4)]
+    weight = len(groups) - 1
+    groups += [int(frac_part[i:i + 4]) for i in range(0, len(frac_part), 4)]
 
-    mailserver.ehlo()
+    while groups and groups[0] == 0:
+        groups.pop(0)
+        weight -= 1
 
-    if EMAIL_USE_TLS:
-        mailserver.starttls()
+    while groups and groups[-1] == 0:
+        groups.pop()
 
-    mailserver.ehlo()
-    mailserver.login(EMAIL_HOST_USER, EMAIL_HOST_PASSWORD)
-    mailserver.sendmail(EMAIL_HOST_USER, msg['To'], msg.as_string())
-    mailserver.quit()
+    if not groups:
+        weight = sign = 0
 
+    return struct.pack(
+        f'!ihhhh{len(groups)}H',
+        8 + 2 * len(groups),
+        len(groups),
+        weight,
+        0x4000 if sign else 0,
+        dscale,
+        *groups
+    )
 
-def delete_file(file):
+
+def encode_binary_date(value):
     """
-    Fonction qui supprime un fichier
-        :param file: Chemin vers le fichier à supprimer
-        :return: None
+    Fonction qui encode une date en jours depuis le 01/01/2000
+        :param value: date, datetime ou str iso
+        :return: bytes, avec la longueur
     """
-    if os.path.isfile(file):
-        os.remove(file)
+    if not isinstance(value, date):
+        value = date.fromisoformat(value.strip()[:10])
 
+    return struct.pack('!ii', 4, value.toordinal() - PG_EPOCH_ORDINAL)
 
-def list_file(path, extension=None, reverse=None, first=None, name_part=None):
+
+def encode_binary_timestamp(value):
     """
-    Fonction qui renvoie la liste des fichiers présent dans un répertoire
+    Fonction qui encode un timestamp sans fuseau, en microsecondes depuis le 01/01/2000
+        :param value: datetime, date ou str iso
+        :return: bytes, avec la longueur
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip())
+    elif not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+
+    return struct.pack('!iq', 8, (value - PG_EPOCH) // timedelta(microseconds=1))
+
+
+BINARY_ENCODERS = {
+    'smallint': lambda value: struct.pack('!ih', 2, int(value)),
+    'integer': lambda value: struct.pack('!ii', 4, int(value)),
+    'bigint': lambda value: struct.pack('!iq', 8, int(value)),
+    'real': lambda value: struct.pack('!if', 4, float(value)),
+    'double precision': lambda value: struct.pack('!id', 8, float(value)),
+    'numeric': encode_binary_numeric,
+    'boolean': lambda value: struct.pack('!i?', 1, value in BOOL_TRUE),
+    'date': encode_binary_date,
+    'timestamp without time zone': encode_binary_timestamp,
+}
+BINARY_TEXT_TYPES = {'character varying', 'character', 'text'}
+
+
+def get_binary_encoders(cnx, table, champs):
+    """
+    Fonction qui renvoie les encodeurs binaires des champs, suivant leur type dans la table,
+    lu par get_types_champs. Le texte est encodé dans l'encodage client de la connexion,
+    PostgreSQL le convertit comme pour un COPY texte
+        :param cnx: connexion psycopg2
+        :param table: table
+        :param champs: champs, dans l'ordre des valeurs des lignes
+        :return: list des encodeurs, ou None si un des types n'a pas d'encodeur binaire
+    """
+    dict_types = get_types_champs(cnx, table, champs)[0]
+    codec = psycopg2.extensions.encodings.get(cnx.encoding, 'utf-8')
+    encoders = []
+
+    def encode_text(value):
+        data = str(value).encode(codec)
+        return struct.pack('!i', len(data)) + data
+
+    for champ in champs:
+        type_champ = dict_types[champ][0]
+
+        if type_champ in BINARY_TEXT_TYPES:
+            encode = encode_text
+        elif type_champ in BINARY_ENCODERS:
+            encode = BINARY_ENCODERS[type_champ]
+        else:
+            return None
+
+        encoders.append(encode)
+
+    return encoders
+
+
+class BinaryIteratorFile:
+    """
+    Objet fichier binaire en lecture seule, alimenté par un itérable de lignes de valeurs déjà
+    typées par la validation, pour envoyer les lignes à cursor.copy_expert au format COPY
+    BINARY, sans formatage texte ni analyse du texte par le serveur
+    """
+
+    def __init__(self, rows, encoders):
+        """
+        Initialisation de la class BinaryIteratorFile
+            :param rows: itérable des lignes (list ou tuple des valeurs)
+            :param encoders: encodeurs des colonnes, renvoyés par get_binary_encoders
+        """
+        self.rows = iter(rows)
+        self.encoders = encoders
+        self.nb_fields = struct.pack('!h', len(encoders))
+        self.buffer = bytearray(COPY_BINARY_HEADER)
+        self.end = False
+
+    def read(self, size=-1):
+        """
+        Fonction qui renvoie au plus size octets du flux binaire
+            :param size: nombre d'octets souhaités, -1 pour tout le flux
+            :return: bytes, vide en fin de flux
+        """
+        buffer = self.buffer
+
+        while not self.end and (size < 0 or len(buffer) < size):
+            try:
+                row = next(self.rows)
+            except StopIteration:
+                buffer += COPY_BINARY_TRAILER
+                self.end = True
+                break
+
+            buffer += self.nb_fields
+
+            for encode, value in zip(self.encoders, row):
+                if value is None or value == COPY_NULL:
+                    buffer += COPY_BINARY_NULL
+                else:
+                    buffer += encode(value)
+
+        if 0 <= size < len(buffer):
+            data = bytes(buffer[:size])
+            del buffer[:size]
+        else:
+            data = bytes(buffer)
+            buffer.clear()
+
+        return data
+
+    def readline(self, size=-1):
+        """
+        Fonction readline, demandée par l'interface fichier de copy_expert
+            :param size: nombre d'octets souhaités, -1 pour tout le flux
+            :return: bytes
+        """
+        return self.read(size)
+
+
+def get_copy_upsert_queries(kwargs_upsert):
+    """
+    Fonction qui renvoie les requêtes du chargement par une table temporaire : création de la
+    table temporaire, puis INSERT ... SELECT ensembliste, INSERT ou UPSERT, sur la table
+        :param kwargs_upsert: dictionaire de execute_copy_upsert
+        :return: (table temporaire, requête de création, requête d'insertion)
+    """
+    table = kwargs_upsert['table']
+    staging = f"tmp_{table}"
+    colonnes = ", ".join(f'"{champ}"' for champ in kwargs_upsert['champs'])
+
+    create = f"""
+    CREATE TEMP TABLE "{staging}" ON COMMIT DROP AS
+    SELECT {colonnes} FROM "{table}" WITH NO DATA;
+    ALTER TABLE "{staging}" ADD COLUMN "num_ligne_copy" bigserial;
+    """
+
+    if kwargs_upsert['upsert'] is not None and kwargs_upsert['champs_unique'] is not None:
+        chu = ", ".join(f'"{champ}"' for champ in kwargs_upsert['champs_unique'])
+        select = (
+            f'SELECT DISTINCT ON ({chu}) {colonnes} FROM "{staging}" '
+            f'ORDER BY {chu}, "num_ligne_copy" DESC'
+        )
+    else:
+        select = f'SELECT {colonnes} FROM "{staging}" ORDER BY "num_ligne_copy"'
+
+    insert = f"""
+    INSERT INTO "{table}" ({colonnes}) {select}
+    {get_on_conflict(kwargs_upsert)}
+    """
+
+    return staging, create, insert
+
+
+def execute_copy_upsert(kwargs_upsert):
+    """
+    Fonction qui charge les lignes par COPY ... FROM STDIN dans une table temporaire, puis
+    applique un seul INSERT ... SELECT ensembliste, INSERT ou UPSERT, sur la table.
+    exemple :
+    CREATE TEMP TABLE "tmp_foo" ON COMMIT DROP AS SELECT "a", "b" FROM "foo" WITH NO DATA;
+    COPY "tmp_foo" ("a", "b") FROM STDIN WITH (FORMAT csv, DELIMITER ';', NULL '<NULL>');
+    INSERT INTO "foo" ("a", "b") SELECT "a", "b" FROM "tmp_foo" ON CONFLICT ("a") DO UPDATE ...;
+
+    Avec copy='binary', les valeurs typées sont envoyées au format COPY BINARY, encodées
+    suivant les types de get_types_champs. Si un des types n'a pas d'encodeur binaire, le
+    chargement se fait en csv.
+
+    Pour un upsert avec champs_unique, seule la dernière ligne d'une même clé est appliquée,
+    comme avec execute_prepared_upsert où les lignes s'écrasent successivement.
+
+        :param kwargs_upsert: dictionaire comprenant -->
+                                      cnx: connexion psycopg2
+                                    table: table concerné par la requête
+                                   champs: champs de la table, souhaités dans la requête
+                                     rows: Itérable des valeurs à inserer dans la table
+                            champs_unique: liste des champs d'unicité dans la table,
+                                            si on veut un Upsert ON CONFLICT UPDATE
+                                   upsert: None explicit, si on ne veut pas d'upsert
+                                     copy: 'binary' pour le format COPY BINARY
+                           skip_unchanged: si True, les lignes identiques à l'existant ne sont
+                                            pas mises à jour, et les compteurs sont renvoyés
+        :return: None, ou {"inserted": n, "updated": n, "skipped": n} si skip_unchanged,
+                 skipped comprend les lignes en double d'une même clé
+    """
+    table = kwargs_upsert['table']
+    staging, create, insert = get_copy_upsert_queries(kwargs_upsert)
+    colonnes = ", ".join(f'"{champ}"' for champ in kwargs_upsert['champs'])
+    encoders = None
+
+    if kwargs_upsert.get('copy') == 'binary':
+        encoders = get_binary_encoders(kwargs_upsert['cnx'], table, kwargs_upsert['champs'])
+
+    if encoders is None:
+        copy = (
+            f'COPY "{staging}" ({colonnes}) FROM STDIN '
+            f"WITH (FORMAT csv, DELIMITER '{COPY_SEP}', NULL '{COPY_NULL}')"
+        )
+    else:
+        copy = f'COPY "{staging}" ({colonnes}) FROM STDIN WITH (FORMAT binary)'
+
+    skip_unchanged = kwargs_upsert.get('skip_unchanged')
+    rows = CountRows(kwargs_upsert['rows']) if skip_unchanged else kwargs_upsert['rows']
+    counts = None
+
+    with kwargs_upsert['cnx'] as cnx:
+        with cnx.cursor() as cursor:
+            if skip_unchanged:
+                counts_before = get_tuples_counts(cursor, table)
+
+            cursor.execute(create)
+
+            if encoders is None:
+                cursor.copy_expert(copy, IteratorFile(rows))
+            else:
+                cursor.copy_expert(copy, BinaryIteratorFile(rows, encoders))
+            cursor.execute(insert)
+
+            if skip_unchanged:
+                counts = get_upsert_counts(cursor, table, counts_before, rows.count)
+
+    return counts
+
+
+def get_file_fingerprint(file_path, block_size=1024 * 1024):
+    """
+    Fonction qui renvoie l'empreinte d'un fichier : taille et sha1 du début et de la fin du
+    fichier, sans lire tout le fichier. Un fichier corrigé ou remplacé change d'empreinte
+        :param file_path: fichier
+        :param block_size: taille lue au début et à la fin du fichier
+        :return: str
+    """
+    size = os.path.getsize(file_path)
+    sha = hashlib.sha1(str(size).encode())
+
+    with open(file_path, 'rb') as binary_file:
+        sha.update(binary_file.read(block_size))
+
+        if size > block_size:
+            binary_file.seek(max(block_size, size - block_size))
+            sha.update(binary_file.read(block_size))
+
+    return f"{size}-{sha.hexdigest()}"
+
+
+class UpsertCheckpoint:
+    """
+    Point de reprise d'un chargement par morceaux : empreinte du fichier et nombre de lignes
+    déjà committées, dans un fichier json écrit à chaque commit
+        exemple:
+            checkpoint = UpsertCheckpoint('/path/CHECKPOINT_file.csv.json', file_csv)
+            offset = checkpoint.load()
+    """
+
+    def __init__(self, checkpoint_file, file_csv):
+        """
+        Initialisation de la class UpsertCheckpoint
+            :param checkpoint_file: fichier json du point de reprise
+            :param file_csv: fichier chargé, dont on prend l'empreinte
+        """
+        self.checkpoint_file = checkpoint_file
+        self.file_csv = file_csv
+        self.fingerprint = get_file_fingerprint(file_csv)
+
+    def load(self):
+        """
+        Fonction qui renvoie le nombre de lignes déjà committées, si le point de reprise est
+        celui du même fichier
+            :return: int, 0 si pas de point de reprise ou si le fichier a changé
+        """
+        try:
+            with open(self.checkpoint_file, encoding='utf-8') as json_file:
+                checkpoint = json.load(json_file)
+        except (OSError, ValueError):
+            return 0
+
+        if checkpoint.get('fingerprint') != self.fingerprint:
+            return 0
+
+        return int(checkpoint.get('offset', 0))
+
+    def save(self, offset):
+        """
+        Fonction qui enregistre le nombre de lignes committées, par un fichier temporaire
+        renommé, pour ne jamais laisser un point de reprise incomplet
+            :param offset: nombre de lignes committées
+            :return: None
+        """
+        file_tmp = f'{self.checkpoint_file}.{os.getpid()}.tmp'
+
+        with open(file_tmp, 'w', encoding='utf-8') as json_file:
+            json.dump(
+                {
+                    'file': self.file_csv,
+                    'fingerprint': self.fingerprint,
+                    'offset': offset,
+                    'date': datetime.now().isoformat(),
+                },
+                json_file
+            )
+
+        os.replace(file_tmp, self.checkpoint_file)
+
+    def delete(self):
+        """
+        Fonction qui supprime le point de reprise, une fois le chargement terminé
+            :return: None
+        """
+        delete_file(self.checkpoint_file)
+
+
+def execute_chunked_upsert(kwargs_upsert):
+    """
+    Fonction qui charge les lignes par morceaux de commit_every lignes, chaque morceau dans sa
+    propre transaction, par execute_copy_upsert si copy est renseigné, sinon par
+    execute_prepared_upsert. La durée des verrous et le travail perdu en cas d'erreur sont
+    limités à un morceau.
+
+    Si un point de reprise est donné, les lignes déjà committées lors d'un chargement précédent
+    du même fichier sont sautées, et le point de reprise est mis à jour après chaque commit.
+    Un arrêt entre le commit et l'écriture du point de reprise fait recharger le dernier
+    morceau, sans effet pour un upsert ou un ON CONFLICT DO NOTHING, mais en double pour un
+    simple INSERT (upsert=None) sur une table sans contrainte d'unicité.
+
+        :param kwargs_upsert: dictionaire de execute_prepared_upsert ou execute_copy_upsert,
+                              comprenant en plus -->
+                             commit_every: nombre de lignes par transaction
+                               checkpoint: UpsertCheckpoint ou None
+        :return: None, ou {"inserted": n, "updated": n, "skipped": n} si skip_unchanged,
+                 pour les lignes chargées par cet appel
+    """
+    upsert = execute_copy_upsert if kwargs_upsert.get('copy') else execute_prepared_upsert
+    commit_every = kwargs_upsert['commit_every']
+    checkpoint = kwargs_upsert.get('checkpoint')
+    rows = iter(kwargs_upsert['rows'])
+    offset = 0
+    counts = None
+
+    if checkpoint is not None:
+        offset = checkpoint.load()
+
+        # Les lignes déjà committées sont lues, pour la validation, mais pas rechargées
+        for _ in islice(rows, offset):
+            pass
+
+    chunk = list(islice(rows, commit_every))
+
+    while chunk:
+        counts_chunk = upsert(dict(kwargs_upsert, rows=chunk))
+        offset += len(chunk)
+
+        if checkpoint is not None:
+            checkpoint.save(offset)
+
+        if counts_chunk is not None:
+            counts = counts_chunk if counts is None else {
+                k: counts[k] + counts_chunk[k] for k in counts
+            }
+
+        chunk = list(islice(rows, commit_every))
+
+    if checkpoint is not None:
+        checkpoint.delete()
+
+    return counts
+
+
+PARALLEL_BATCH_SIZE = 1000
+PARALLEL_QUEUE_SIZE = 8
+PARALLEL_POOL_TIMEOUT = 600
+
+
+class DeferredCommit:
+    """
+    Connexion dont le bloc with ne fait ni commit ni rollback : la transaction reste ouverte,
+    pour être committée ou annulée avec celles des autres partitions par
+    execute_parallel_upsert. Les autres attributs sont ceux de la connexion
+    """
+
+    def __init__(self, cnx):
+        """
+        Initialisation de la class DeferredCommit
+            :param cnx: connexion psycopg2
+        """
+        self.cnx = cnx
+
+    def __enter__(self):
+        return self.cnx
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self.cnx, name)
+
+
+class PartitionRows:
+    """
+    Itérable des lignes d'une partition, reçues par lots dans une file jusqu'à None
+    """
+
+    def __init__(self, partition):
+        """
+        Initialisation de la class PartitionRows
+            :param partition: queue.Queue des lots de lignes
+        """
+        self.partition = partition
+        self.ended = False
+
+    def __iter__(self):
+        for batch in iter(self.partition.get, None):
+            yield from batch
+
+        self.ended = True
+
+    def drain(self):
+        """
+        Fonction qui vide la file jusqu'à None, pour ne pas bloquer le producteur après une
+        erreur de chargement
+            :return: None
+        """
+        if not self.ended:
+            for _ in self:
+                pass
+
+
+def get_partition_key(kwargs_upsert, workers):
+    """
+    Fonction qui renvoie la fonction de partition des lignes : par hash des champs_unique, les
+    lignes d'une même clé vont toujours dans la même partition, dans l'ordre du fichier. Sans
+    champs_unique les lignes sont réparties tour à tour
+        :param kwargs_upsert: dictionaire de execute_parallel_upsert
+        :param workers: nombre de partitions
+        :return: fonction ligne -> numéro de partition
+    """
+    champs_unique = kwargs_upsert.get('champs_unique')
+
+    if not champs_unique:
+        turn = cycle(range(workers))
+
+        return lambda row: next(turn)
+
+    champs = list(kwargs_upsert['champs'])
+    key = itemgetter(*[champs.index(champ) for champ in champs_unique])
+
+    return lambda row: hash(key(row)) % workers
+
+
+def execute_parallel_upsert(kwargs_upsert):
+    """
+    Fonction qui charge les lignes sur workers connexions du pool en parallèle, par
+    execute_copy_upsert si copy est renseigné, sinon par execute_prepared_upsert. Les lignes
+    sont réparties par hash des champs_unique : chaque partition a ses propres clés, les
+    connexions ne s'attendent donc pas sur les mêmes lignes et ne peuvent pas se bloquer
+    mutuellement, et la dernière ligne d'une même clé reste celle appliquée.
+
+    Chaque partition est chargée dans une transaction ouverte, committée seulement quand toutes
+    les partitions sont chargées et que toutes les lignes ont été lues. Une erreur de chargement
+    ou de lecture (validation en stream) annule toutes les partitions. Les commits étant
+    successifs, une coupure entre deux commits laisserait une partie des partitions en base.
+
+    Les workers connexions sont prises d'un seul coup par PoolCnxPostgresql.getconns, en
+    attendant au plus pool.timeout ou PARALLEL_POOL_TIMEOUT secondes. L'appelant ne doit pas
+    garder de connexion du même pool pendant l'appel : des chargements simultanés qui
+    garderaient chacun une connexion en attendant les autres pourraient se bloquer.
+
+        :param kwargs_upsert: dictionaire de execute_prepared_upsert ou execute_copy_upsert,
+                              comprenant en plus -->
+                                     pool: PoolCnxPostgresql, d'au moins workers
+                                            connexions
+                                  workers: nombre de connexions en parallèle
+        :return: None, ou {"inserted": n, "updated": n, "skipped": n} si skip_unchanged,
+                 total des partitions
+    """
+    upsert = execute_copy_upsert if kwargs_upsert.get('copy') else execute_prepared_upsert
+    pool = kwargs_upsert['pool']
+    workers = kwargs_upsert['workers']
+    partition_key = get_partition_key(kwargs_upsert, workers)
+    partitions = [queue.Queue(maxsize=PARALLEL_QUEUE_SIZE) for _ in range(workers)]
+    failed = threading.Event()
+    results = [None] * workers
+    errors = []
+    connexions = []
+    threads = []
+
+    def load_partition(i, cnx):
+        rows = PartitionRows(partitions[i])
+
+        try:
+            results[i] = upsert(dict(kwargs_upsert, cnx=DeferredCommit(cnx), rows=rows))
+
+        except Exception as error:
+            errors.append(error)
+            failed.set()
+            rows.drain()
+
+    try:
+        connexions = pool.getconns(workers, pool.timeout or PARALLEL_POOL_TIMEOUT)
+
+        for i, cnx in enumerate(connexions):
+            thread = threading.Thread(
+                target=load_partition, args=(i, cnx), name=f"upsert-{i}", daemon=True
+            )
+            thread.start()
+            threads.append(thread)
+
+        batches = [[] for _ in range(workers)]
+
+        try:
+            for row in kwargs_upsert['rows']:
+                i = partition_key(row)
+                batches[i].append(row)
+
+                if len(batches[i]) >= PARALLEL_BATCH_SIZE:
+                    if failed.is_set():
+                        break
+
+                    partitions[i].put(batches[i])
+                    batches[i] = []
+
+            else:
+                for i, batch in enumerate(batches):
+                    if batch:
+                        partitions[i].put(batch)
+
+        finally:
+            for partition in partitions:
+                partition.put(None)
+
+            for thread in threads:
+                thread.join()
+
+        if errors:
+            raise errors[0]
+
+        for cnx in connexions:
+            cnx.commit()
+
+    except BaseException:
+        for cnx in connexions:
+            try:
+                cnx.rollback()
+            except psycopg2.Error:
+                pass
+
+        raise
+
+    finally:
+        for cnx in connexions:
+            pool.putconn(cnx)
+
+    if kwargs_upsert.get('skip_unchanged'):
+        return {k: sum(counts[k] for counts in results) for k in results[0]}
+
+    return None
+
+
+class GetModel:
+    """
+    Class de récupération des champs, des champs_et_type et des noms de table, pour un modèle
+    dans Postgresql
+    """
+
+    def __init__(self, cnx, modele, **kwargs):
+        """
+        Initialisation de la class GetModel
+            :param cnx: Connexion
+            :param modele: Modèle
+            :param kwargs: date_format=('-', 'Y', 'M', 'D')
+                            exclude=None
+                            fields=None
+        """
+        self.cnx = cnx
+        self.modele = modele
+
+        self.date_format = kwargs['date_format'] \
+            if 'date_format' in kwargs else ('-', 'Y', 'M', 'D')
+        self.exclude = kwargs['exclude'] if 'exclude' in kwargs else None
+        self.fields = kwargs['fields'] if 'fields' in kwargs else None
+
+    def get_model_fields(self):
+        """
+        Fonction qui retourne les champs de modèles
+            :return: générateur de la liste des modèles
+        """
+        model = self.modele.__doc__.replace(self.modele.__name__, "").replace("(", "")
+        model = model.replace(")", "").replace(" ", "")
+
+        if self.exclude is not None:
+            model = ','.join(r for r in model.split(",") if r not in self.exclude)
+        elif self.fields is not None:
+            model = ','.join(r for r in model.split(",") if r in self.fields)
+
+        return (r for r in model.split(",") if r)
+
+    def get_model_table_name(self):
+        """
+        Fonction qui retourne le nom de la table d'un modèle
+        :return: le nom de la table dans postgresql
+        """
+        module = self.modele.__module__.split('.')[-2]
+        table_name = f"{module}_{self.modele.__name__.lower()}"
+
+        return table_name
+
+    def get_champs_types(self):
+        """
+        Fonction de récupération des champs avec leur type pour les validations
+            :return: genérateur des (champs, (type, taille, validateur))
+                exemple:
+                    [   ('num_facture', (30, True, 'validate_str')),                    <-- string
+                        ('date_retour', (('-', 'Y', 'M', 'D'), True, 'validate_date')), <-- date
+                        ('montant', (2, True, 'validate_float')),                       <-- float
+                        ('qte_vte', (0, True, 'validate_int')),                         <-- int
+                        ('test', (0, True, validate_bool) ]                             <-- booléen
+        """
+        champs = tuple(self.get_model_fields())
+        table = self.get_model_table_name()
+        champs_types = get_types_champs(self.cnx, table=table)[0]
+        champs_validate = []
+
+        for k in champs:
+            sol = champs_types[k]
+            tipe = TYPE_POSTGRESQL[sol[0]][0]
+            l_g = self.date_format if tipe == 'date' else sol[1]
+            bol = True if sol[2] == 'NO' else False
+            validator = TYPE_POSTGRESQL[sol[0]][1]
+            champs_validate.append((k, (l_g, bol, validator)))
+
+        return table, champs_validate
+
+
+LOG_DIR = os.environ.get('INTEGRATION_LOG_DIR', "/home")
+LOG_FILE = os.path.join(LOG_DIR, 'log_mise_a_jour.log')
+LOG_FILE_DIVERS = os.path.join(LOG_DIR, 'log_divers.log')
+LOG_FILE_JSON = os.path.join(LOG_DIR, 'log_mise_a_jour.jsonl')
+LOG_MAX_BYTES = 50 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_FLUSH_INTERVAL = 0.5
+LOG_BATCH_SIZE = 1000
+
+
+class LogWriter:
+    """
+    Écriture d'un fichier de log par un seul thread : les lignes sont mises dans une file,
+    sans attendre, et écrites par lots, le fichier n'est ouvert qu'une fois par lot. Les
+    lignes de plusieurs threads ne se mélangent pas. Au delà de max_bytes, le fichier est
+    renommé en fichier.1, fichier.1 en fichier.2..., jusqu'à backup_count fichiers gardés.
+        exemple:
+            writer = get_log_writer(LOG_FILE)
+            writer.write("ligne\n")
+    """
+    STOP = object()
+
+    def __init__(self, fichier, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT,
+                 flush_interval=LOG_FLUSH_INTERVAL, batch_size=LOG_BATCH_SIZE):
+        """
+        Initialisation de la class LogWriter
+            :param fichier: Fichier de log
+            :param max_bytes: taille du fichier à partir de laquelle il est renommé, 0 pour
+                              ne jamais le renommer
+            :param backup_count: nombre de fichiers renommés gardés
+            :param flush_interval: attente maximum des lignes suivantes avant l'écriture d'un
+                                   lot, en secondes
+            :param batch_size: nombre maximum de lignes par lot
+        """
+        self.fichier = fichier
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def write(self, line_to_write):
+        """
+        Fonction qui met une ligne dans la file d'écriture
+            :param line_to_write: Ligne à écrire
+            :return: None
+        """
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name=f'LogWriter {self.fichier}', daemon=True
+                )
+                self.thread.start()
+
+        self.queue.put(line_to_write)
+
+    def close(self, timeout=None):
+        """
+        Fonction qui écrit les lignes en attente et arrête le thread
+            :param timeout: attente maximum de l'arrêt, en secondes
+            :return: None
+        """
+        with self.lock:
+            thread = self.thread
+
+        if thread is not None and thread.is_alive():
+            self.queue.put(LogWriter.STOP)
+            thread.join(timeout)
+
+    def run(self):
+        """
+        Boucle du thread d'écriture
+            :return: None
+        """
+        while True:
+            lines = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+
+            while lines[-1] is not LogWriter.STOP and len(lines) < self.batch_size:
+                try:
+                    lines.append(self.queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+
+            stop = lines[-1] is LogWriter.STOP
+
+            if stop:
+                lines.pop()
+
+            if lines:
+                try:
+                    self.write_lines(lines)
+                except OSError:
+                    print(f"{self.fichier} : {sys.exc_info()[1]}\n{''.join(lines)}")
+
+            if stop:
+                return
+
+    def write_lines(self, lines):
+        """
+        Fonction qui écrit un lot de lignes, le fichier est renommé avant l'écriture si le lot
+        lui ferait dépasser max_bytes
+            :param lines: list des lignes
+            :return: None
+        """
+        data = ''.join(lines).encode('utf-8')
+        size = os.path.getsize(self.fichier) if os.path.isfile(self.fichier) else 0
+
+        if self.max_bytes and size and size + len(data) > self.max_bytes:
+            self.rotate()
+
+        with open(self.fichier, 'ab') as log_file:
+            log_file.write(data)
+
+    def rotate(self):
+        """
+        Fonction qui renomme les fichiers de log, fichier --> fichier.1 --> fichier.2 ...
+            :return: None
+        """
+        if self.backup_count <= 0:
+            os.remove(self.fichier)
+            return
+
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.isfile(f"{self.fichier}.{i}"):
+                os.replace(f"{self.fichier}.{i}", f"{self.fichier}.{i + 1}")
+
+        os.replace(self.fichier, f"{self.fichier}.1")
+
+
+LOG_WRITERS = {}
+LOG_WRITERS_LOCK = threading.Lock()
+
+
+def get_log_writer(fichier):
+    """
+    Fonction qui renvoie le LogWriter du process, pour un fichier de log
+        :param fichier: Fichier de log
+        :return: LogWriter
+    """
+    with LOG_WRITERS_LOCK:
+        if fichier not in LOG_WRITERS:
+            LOG_WRITERS[fichier] = LogWriter(fichier)
+
+        return LOG_WRITERS[fichier]
+
+
+def close_log_writers(timeout=10):
+    """
+    Fonction qui écrit les lignes en attente de tous les LogWriter du process
+        :param timeout: attente maximum par fichier, en secondes
+        :return: None
+    """
+    with LOG_WRITERS_LOCK:
+        writers = list(LOG_WRITERS.values())
+
+    for writer in writers:
+        writer.close(timeout)
+
+
+atexit.register(close_log_writers)
+
+
+def write_log(fichier=None, line_to_write=None):
+    """
+    Fonction pour écrire une ligne de log dans un fichier, sans attendre, par son LogWriter
+        :param fichier: Fichier ou écrire la ligne
+        :param line_to_write: Ligne à écrire
+        :return: None
+    """
+    if fichier and line_to_write:
+        get_log_writer(fichier).write(line_to_write)
+
+
+def log_event(message, level='info', fichier=None, **fields):
+    """
+    Fonction pour écrire un enregistrement de log structuré, une ligne JSON, dans LOG_FILE_JSON
+        exemple:
+            log_event('validation', file='/path/file.csv', table='table', stage='validation',
+                      duration=1.2)
+        :param message: message
+        :param level: niveau, 'info', 'warning' ou 'error'
+        :param fichier: Fichier de log, None pour LOG_FILE_JSON
+        :param fields: champs de l'enregistrement, file, table, stage, duration...
+        :return: None
+    """
+    record = {"time": datetime.now().isoformat(), "level": level, "message": message}
+    record.update((key, value) for key, value in fields.items() if value is not None)
+    write_log(fichier or LOG_FILE_JSON, json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+MAIL_WINDOW = 60
+MAIL_MAX_ERRORS = 50
+MAIL_IDLE_TIMEOUT = 30
+MAIL_QUEUE_SIZE = 1000
+# Date en tête des erreurs, ex: "2024-01-31T12:00:00.123456 | ", ignorée pour les regrouper
+MAIL_TIMESTAMP = re.compile(r'^\s*\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?\s*\|?\s*')
+
+
+class MailDispatcher:
+    """
+    Envoi des erreurs par mail en tâche de fond : les erreurs sont mises dans une file, sans
+    jamais bloquer l'intégration. Un thread regroupe les erreurs reçues pendant window
+    secondes, fusionne les erreurs identiques au delà de leur date en tête, en les comptant
+    avec les dates de la première et de la dernière, et envoie un mail par sujet,
+    d'au plus max_errors erreurs, sur une seule session SMTP, gardée ouverte tant que des
+    erreurs arrivent et fermée après idle_timeout secondes sans envoi.
+    Les paramètres SMTP par défaut sont ceux de EMAIL_HOST, EMAIL_PORT, EMAIL_USE_SSL,
+    EMAIL_USE_TLS, EMAIL_HOST_USER, EMAIL_HOST_PASSWORD et EMAIL_DEV, lus à la connexion.
+        exemple:
+            dispatcher = MailDispatcher(host='localhost', port=1025, login=False, window=1)
+            dispatcher.send("Erreur de validation")
+            dispatcher.close()
+    """
+    STOP = object()
+
+    def __init__(self, window=MAIL_WINDOW, max_errors=MAIL_MAX_ERRORS,
+                 idle_timeout=MAIL_IDLE_TIMEOUT, queue_size=MAIL_QUEUE_SIZE, **smtp_params):
+        """
+        Initialisation de la class MailDispatcher
+            :param window: délai de regroupement des erreurs, en secondes
+            :param max_errors: nombre maximum d'erreurs différentes par mail
+            :param idle_timeout: délai sans envoi, avant de fermer la session SMTP
+            :param queue_size: nombre maximum d'erreurs en attente, au delà elles sont
+                               seulement écrites dans LOG_FILE
+            :param smtp_params: host, port, use_ssl, use_tls, user, password, sender, to,
+                                login=True, remplacent les paramètres EMAIL_*
+        """
+        self.window = window
+        self.max_errors = max_errors
+        self.idle_timeout = idle_timeout
+        self.smtp_params = smtp_params
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.mailserver = None
+        self.pending = {}
+        self.nb_sent = 0
+        self.nb_dropped = 0
+
+    def get_smtp_param(self, key, default):
+        """
+        Fonction qui renvoie un paramètre SMTP, celui donné à l'initialisation ou EMAIL_*
+            :param key: nom du paramètre
+            :param default: fonction qui renvoie la valeur EMAIL_*
+            :return: valeur du paramètre
+        """
+        if key in self.smtp_params:
+            return self.smtp_params[key]
+
+        return default()
+
+    def send(self, erreur, subject_error=None):
+        """
+        Fonction qui met une erreur dans la file d'envoi, sans attendre
+            :param erreur: Erreur à envoyer
+            :param subject_error: Sujet de l'erreur
+            :return: None
+        """
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name='MailDispatcher', daemon=True
+                )
+                self.thread.start()
+
+        try:
+            self.queue.put_nowait((subject_error or 'Erreur B.I', erreur, datetime.now()))
+        except queue.Full:
+            self.nb_dropped += 1
+            write_log(
+                LOG_FILE,
+                f'{datetime.now().isoformat()} | MailDispatcher : file pleine, '
+                f'erreur non envoyée\n\t\t{erreur}\n'
+            )
+
+    def close(self, timeout=None):
+        """
+        Fonction qui envoie les erreurs en attente, ferme la session SMTP et arrête le thread
+            :param timeout: attente maximum de l'arrêt, en secondes
+            :return: None
+        """
+        with self.lock:
+            thread = self.thread
+
+        if thread is not None and thread.is_alive():
+            self.queue.put(MailDispatcher.STOP)
+            thread.join(timeout)
+
+    def run(self):
+        """
+        Boucle du thread d'envoi
+            :return: None
+        """
+        deadline = None
+        last_sent = time.monotonic()
+
+        while True:
+            now = time.monotonic()
+
+            if deadline is not None:
+                timeout = max(deadline - now, 0)
+            elif self.mailserver is not None:
+                timeout = max(last_sent + self.idle_timeout - now, 0)
+            else:
+                timeout = None
+
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is MailDispatcher.STOP:
+                self.flush()
+                self.disconnect()
+                return
+
+            if item is not None:
+                subject, erreur, received = item
+                key = (subject, MAIL_TIMESTAMP.sub('', erreur, count=1))
+                entry = self.pending.setdefault(key, [0, received, received, erreur])
+                entry[0] += 1
+                entry[2] = received
+
+                if deadline is None:
+                    deadline = time.monotonic() + self.window
+
+            now = time.monotonic()
+
+            if deadline is not None and now >= deadline:
+                self.flush()
+                deadline = None
+                last_sent = time.monotonic()
+
+            elif (
+                    deadline is None
+                    and self.mailserver is not None
+                    and now - last_sent >= self.idle_timeout
+            ):
+                self.disconnect()
+
+    def flush(self):
+        """
+        Fonction qui envoie les erreurs regroupées, un mail par sujet et par max_errors erreurs
+            :return: None
+        """
+        by_subject = {}
+
+        for (subject, erreur), (nb, first, last, original) in self.pending.items():
+            by_subject.setdefault(subject, []).append(
+                (first, last, erreur if nb > 1 else original, nb)
+            )
+
+        self.pending = {}
+
+        for subject, errors in by_subject.items():
+            for i in range(0, len(errors), self.max_errors):
+                self.send_mail(subject, errors[i:i + self.max_errors])
+
+    def get_message(self, errors):
+        """
+        Fonction qui met en forme le corps du mail
+            :param errors: list des (première réception, dernière réception, erreur, nombre)
+            :return: texte du mail
+        """
+        if len(errors) == 1 and errors[0][3] == 1:
+            return errors[0][2]
+
+        message = ""
+
+        for first, last, erreur, nb in errors:
+            message += f"===== {first.isoformat()}"
+
+            if nb > 1:
+                message += f" -> {last.isoformat()} ({nb} fois)"
+
+            message += f" =====\n{erreur}\n\n"
+
+        return message
+
+    def connect(self):
+        """
+        Fonction qui ouvre la session SMTP, si elle n'est pas déjà ouverte
+            :return: session SMTP
+        """
+        if self.mailserver is not None:
+            return self.mailserver
+
+        host = self.get_smtp_param('host', lambda: EMAIL_HOST)
+        port = self.get_smtp_param('port', lambda: EMAIL_PORT)
+
+        if self.get_smtp_param('use_ssl', lambda: EMAIL_USE_SSL):
+            mailserver = smtplib.SMTP_SSL(host, port)
+        else:
+            mailserver = smtplib.SMTP(host, port)
+
+        mailserver.ehlo()
+
+        if self.get_smtp_param('use_tls', lambda: EMAIL_USE_TLS):
+            mailserver.starttls()
+            mailserver.ehlo()
+
+        if self.smtp_params.get('login', True):
+            mailserver.login(
+                self.get_smtp_param('user', lambda: EMAIL_HOST_USER),
+                self.get_smtp_param('password', lambda: EMAIL_HOST_PASSWORD)
+            )
+
+        self.mailserver = mailserver
+
+        return mailserver
+
+    def disconnect(self):
+        """
+        Fonction qui ferme la session SMTP
+            :return: None
+        """
+        if self.mailserver is None:
+            return
+
+        try:
+            self.mailserver.quit()
+        except (smtplib.SMTPException, OSError):
+            self.mailserver.close()
+
+        self.mailserver = None
+
+    def send_mail(self, subject, errors):
+        """
+        Fonction qui envoie un mail sur la session ouverte, avec une nouvelle tentative sur
+        une nouvelle session si la session a été fermée par le serveur. En cas d'échec les
+        erreurs sont écrites dans LOG_FILE
+            :param subject: sujet du mail
+            :param errors: list des (première réception, dernière réception, erreur, nombre)
+            :return: None
+        """
+        sender = self.get_smtp_param('sender', lambda: EMAIL_HOST_USER)
+        msg = MIMEMultipart()
+        msg['From'] = sender
+        msg['To'] = self.get_smtp_param('to', lambda: EMAIL_DEV)
+        msg['Subject'] = subject if len(errors) == 1 else f"{subject} ({len(errors)})"
+        msg.attach(MIMEText(self.get_message(errors)))
+
+        error = None
+
+        for attempt in range(2):
+            try:
+                self.connect().sendmail(sender, msg['To'], msg.as_string())
+                self.nb_sent += 1
+                return
+
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPSenderRefused, OSError) as exc:
+                error = exc
+                self.disconnect()
+
+                if attempt:
+                    break
+
+            except Exception as exc:
+                error = exc
+                self.disconnect()
+                break
+
+        write_log(
+            LOG_FILE,
+            f'{datetime.now().isoformat()} | MailDispatcher : mail non envoyé'
+            f'\n\t\t{error}\n\t\t{self.get_message(errors)}\n'
+        )
+
+
+MAIL_DISPATCHER = MailDispatcher()
+atexit.register(MAIL_DISPATCHER.close, 10)
+
+
+def envoi_mail_erreur(erreur, subject_error=None):
+    """
+    Fonction qui envoi les erreurs par mail, par MAIL_DISPATCHER : l'erreur est mise en file
+    et envoyée en tâche de fond, regroupée avec les autres erreurs, voir MailDispatcher
+        :param erreur: Erreur à envoyer
+        :param subject_error: Sujet de l'erreur
+        :return: None
+    """
+    print(erreur)
+    MAIL_DISPATCHER.send(erreur, subject_error)
+
+
+def move_file(file, destination):
+    """
+    Fonction qui déplace un fichier, le répertoire de destination est créé si besoin
+        :param file: Chemin vers le fichier à déplacer
+        :param destination: Chemin de destination
+        :return: None
+    """
+    os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+    shutil.move(file, destination)
+
+
+def delete_file(file):
+    """
+    Fonction qui supprime un fichier
+        :param file: Chemin vers le fichier à supprimer
+        :return: None
+    """
+    if os.path.isfile(file):
+        os.remove(file)
+
+
+def get_file_pattern(path, extension=None, name_part=None):
+    """
+    Fonction qui renvoie le motif glob des fichiers recherchés par list_file
+        :param path: Répertoire de recherche
+        :param extension: Extension du fichier 'csv', 'xls', 'xlsx', 'txt' ....
+        :param name_part: Partie d'un nom à rechercher
+        :return: motif glob, ex: "/path/*.csv"
+    """
+    path_name = f"{path}/*." if name_part is None else f"{path}/{str(name_part)}"
+
+    if name_part is None:
+        path_name = f"{path_name}*" if extension is None else f"{path_name}{extension}"
+
+    return path_name
+
+
+COMPRESSED_EXTENSIONS = ('.gz', '.bz2', '.xz', '.zst')
+
+
+def get_file_patterns(path, extension=None, name_part=None):
+    """
+    Fonction qui renvoie les motifs glob des fichiers recherchés par list_file, le motif de
+    get_file_pattern et ses variantes compressées (.gz, .bz2, .xz, .zst)
+        :param path: Répertoire de recherche
+        :param extension: Extension du fichier 'csv', 'xls', 'xlsx', 'txt' ....
+        :param name_part: Partie d'un nom à rechercher
+        :return: list des motifs glob, ex: ["/path/*.csv", "/path/*.csv.gz", ...]
+    """
+    pattern = get_file_pattern(path, extension, name_part)
+
+    if name_part is None and extension is None:
+        return [pattern]
+
+    return [pattern] + [f"{pattern}{compression}" for compression in COMPRESSED_EXTENSIONS]
+
+
+def get_compression(file_path):
+    """
+    Fonction qui renvoie l'extension de compression d'un fichier
+        :param file_path: fichier
+        :return: '.gz', '.bz2', '.xz', '.zst' ou None
+    """
+    ext = os.path.splitext(file_path)[-1].lower()
+
+    return ext if ext in COMPRESSED_EXTENSIONS else None
+
+
+def strip_compression(file_path):
+    """
+    Fonction qui retire l'extension de compression d'un nom de fichier
+        :param file_path: fichier, ex: "/path/file.csv.gz"
+        :return: nom sans l'extension de compression, ex: "/path/file.csv"
+    """
+    return os.path.splitext(file_path)[0] if get_compression(file_path) else file_path
+
+
+class ZstdReader(io.RawIOBase):
+    """
+    Lecture en flux d'un fichier .zst, par zstandard. Seul le retour au début du fichier est
+    possible, ce qui suffit à CsvTxtValidator.get_header
+    """
+
+    def __init__(self, file_path):
+        """
+        Initialisation de la class ZstdReader
+            :param file_path: fichier .zst
+        """
+        super().__init__()
+
+        if zstandard is None:
+            raise ImportError(f"zstandard est nécessaire pour lire le fichier {file_path}")
+
+        self.file_path = file_path
+        self.file = None
+        self.reader = None
+        self.position = 0
+        self.rewind()
+
+    def rewind(self):
+        """
+        Fonction qui relance la décompression depuis le début du fichier
+            :return: None
+        """
+        if self.file is not None:
+            self.file.close()
+
+        self.file = open(self.file_path, 'rb')
+        self.reader = zstandard.ZstdDecompressor().stream_reader(self.file)
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.reader.read(len(buffer))
+        buffer[:len(data)] = data
+        self.position += len(data)
+
+        return len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET and offset == 0:
+            self.rewind()
+        elif not (whence == io.SEEK_CUR and offset == 0):
+            raise io.UnsupportedOperation("ZstdReader ne peut revenir qu'au début du fichier")
+
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+        super().close()
+
+
+def open_text_file(file_path, encoding='utf-8', errors='replace'):
+    """
+    Fonction qui ouvre un fichier texte en lecture, en décompressant au fil de la lecture les
+    fichiers .gz, .bz2, .xz et .zst
+        :param file_path: fichier
+        :param encoding: encoding du fichier
+        :param errors: gestion des erreurs d'encodage
+        :return: fichier ouvert en lecture, avec newline=''
+    """
+    compression = get_compression(file_path)
+
+    if compression is None:
+        return open(file_path, 'r', encoding=encoding, errors=errors, newline='')
+
+    if compression == '.zst':
+        return io.TextIOWrapper(
+            io.BufferedReader(ZstdReader(file_path)),
+            encoding=encoding,
+            errors=errors,
+            newline=''
+        )
+
+    opener = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}[compression]
+
+    return opener(file_path, 'rt', encoding=encoding, errors=errors, newline='')
+
+
+def list_file(path, extension=None, reverse=None, first=None, name_part=None):
+    """
+    Fonction qui renvoie la liste des fichiers présent dans un répertoire
         :param path: Répertoire de recherche
         :param extension: Extension du fichier 'csv', 'xls', 'xlsx', 'txt' ....
         :param reverse: Tri de la liste, reverse=None -> ascendante et reverse=True -> descendante
@@ -391,339 +2176,1072 @@ def list_file(path, extension=None, reverse=None, first=None, name_part=None):
                             tous les fichiers  -> name=None
         :return: La liste des fichiers ou le fichier sinon None
     """
-    path_name = f"{path}/*." if name_part is None else f"{path}/{str(name_part)}"
+    list_files = sorted({
+        file_path
+        for pattern in get_file_patterns(path, extension, name_part)
+        for file_path in glob.glob(pattern)
+    })
 
-    if name_part is None:
-        path_name = f"{path_name}*" if extension is None else f"{path_name}{extension}"
+    if reverse is None:
+        list_files.sort()
+    else:
+        list_files.sort(reverse=True)
+
+    if first is None:
+        return list_files if list_files else None
+
+    return list_files[0] if list_files else None
+
+
+class NotValidatorError(Exception):
+    """
+    Exception personalisée en cas ou un validateur n'existe pas
+    """
+    pass
+
+
+class CsvValidationError(Exception):
+    """
+    Exception personalisée en cas d'erreurs de validation d'un fichier lu au fil de l'eau
+    """
+    pass
+
+
+def validate_bool(value, bool_type, col_name):
+    """
+    Fonction de validation des booléens
+        :param value: valeur
+        :param bool_type: type de bool
+        :param col_name: nom de colonne
+        :return: valeur validée
+    """
+    if not value:
+        value_retour = '<NULL>'
+
+    else:
+        if value == 'f':
+            value = False
+        else:
+            value = True
+
+        value_retour = value
+
+    # Il faut ajouter un test bool nullable pour vérification plus robuste
+    print(bool_type, col_name)
+
+    return value_retour
+
+
+def validate_date(value, format_date, col_name):
+    """
+    Fonction de validation des dates
+        :param value: valeur
+        :param format_date: format de date demandé
+        :param col_name: nom de colonne
+        :return: valeur validée
+    """
+    if not value:
+        value_retour = '<NULL>'
+        return value_retour
+
+    lg_valide = {'/', '-', '_', ':', 'D', 'M', 'Y', 'date_adp'}
+
+    if any(r not in lg_valide for r in format_date):
+        err = (f"Sep {', '.join(lg_valide)}, Obligatoires, "
+               f"pour la colonne {col_name}\n")
+        value_retour = (err,)
+
+    elif format_date[0] not in value and format_date[0] != 'date_adp':
+        err = (f"la séparation de date attendu, est {format_date[0]}, la date du fichier est : "
+               f"{value}, pour la colonne {col_name}\n")
+        value_retour = (err,)
+
+    else:
+
+        try:
+            sep = format_date[0]
+
+            if sep == 'date_adp':
+                n_d = 0
+                n_m = 1
+                n_y = 2
+                d_t = date_adp(value)
+
+            else:
+                d_t = value.split(' ')[0].split(sep)
+                dte = format_date[1:]
+                n_d = dte.index('D')
+                n_m = dte.index('M')
+                n_y = dte.index('Y')
+
+            jour = int(d_t[n_d])
+            mois = int(d_t[n_m])
+            annee = int(d_t[n_y])
+
+            if len(str(annee)) == 2:
+                annee += 2000
+
+            value_retour = date(annee, mois, jour)
+
+        except (ValueError, IndexError):
+            err = (f"la value '{value}' ne correspond pas à une date, pour la colonne "
+                   f"{col_name}\n")
+            value_retour = (err,)
+
+    return value_retour
+
+
+def validate_datetime(value):
+    """
+    Fonction de validation des datetime
+        :param value: valeur
+        :return: valeur validée
+    """
+    print(value)
+
+
+def validate_float(value, decimale, col_name):
+    """
+    Fonction de validation des float
+        :param value: valeur
+        :param decimale: decimales
+        :param col_name: nom de colonne
+        :return: valeur validée
+    """
+    value = str(value).replace(',', '.').replace(' ', '')
+    list_s = []
+
+    for l_s in value[::-1]:
+
+        try:
+            int(l_s)
+            list_s.append(l_s)
+
+        except ValueError:
+            if '.' not in list_s and l_s == '.' or '-' in l_s:
+                list_s.append(l_s)
+            elif '(' in l_s and '-' not in list_s:
+                list_s.append('-')
+
+    list_s.reverse()
+    value = "".join(list_s)
+
+    if not value:
+        value_retour = int(0)
+
+    elif decimale not in {0, 1}:
+        err = (f"Pour un float, l_g doit être un int, 0 (pour int) ou 1 (pour float), "
+               f"colonne {col_name}")
+        value_retour = (err,)
+
+    else:
+        val = value
+        try:
+            v_a = float(val)
+            if not value:
+                v_a = int(0)
+            elif v_a == 0:
+                v_a = int(0)
+            else:
+                if decimale == 0:
+                    v_a = int(v_a)
+                elif decimale == 1:
+                    v_a = float(v_a)
+
+            value_retour = v_a
+
+        except ValueError:
+            err = f"la value '{val}' doit être un nombre, pour la colonne {col_name}\n"
+            value_retour = (err,)
+
+    return value_retour
+
+
+def validate_int(value, decimale, col_name):
+    """
+    Fonction de validation des int
+        :param value: valeur
+        :param decimale: non nécessaire, juste pour la signature globle
+        :param col_name: nom de colonne
+        :return: valeur validée
+    """
+    value = str(value).replace(',', '.').replace(' ', '')
+    list_s = []
+
+    for l_s in value[::-1]:
+
+        try:
+            int(l_s)
+            list_s.append(l_s)
+
+        except ValueError:
+            if '.' not in list_s and l_s == '.' or '-' in l_s:
+                list_s.append(l_s)
+            elif '(' in l_s and '-' not in list_s:
+                list_s.append('-')
+
+    list_s.reverse()
+    value = "".join(list_s)
+
+    if not value:
+        value_retour = int(0)
+
+    elif decimale not in {0, 1}:
+        err = (f"Pour un float, l_g doit être un int, 0 (pour int) ou 1 (pour float), "
+               f"colonne {col_name}")
+        value_retour = (err,)
 
-    list_files = glob.glob(path_name)
+    else:
+        val = value
+        try:
+            v_a = float(val)
+            if not value:
+                v_a = int(0)
+            elif v_a == 0:
+                v_a = int(0)
+            else:
+                if decimale == 0:
+                    v_a = int(v_a)
+                elif decimale == 1:
+                    v_a = float(v_a)
 
-    if reverse is None:
-        list_files.sort()
-    else:
-        list_files.sort(reverse=True)
+            value_retour = v_a
 
-    if first is None:
-        return list_files if list_files else None
+        except ValueError:
+            err = f"la value '{val}' doit être un nombre, pour la colonne {col_name}\n"
+            value_retour = (err,)
 
-    return list_files[0] if list_files else None
+    return value_retour
 
 
-class NotValidatorError(Exception):
+def validate_str(value, lg_str, col_name):
     """
-    Exception personalisée en cas ou un validateur n'existe pas
+    Fonction de validation des str
+        :param value: valeur
+        :param lg_str: longueur maxi du str à renvoyer
+        :param col_name: nom de colonne
+        :return: valeur validée
     """
-    pass
+    try:
+        if not value:
+            value = ''
+        else:
+            nb_car = int(lg_str)
+            value = value.replace('"', '') \
+                .replace("'", "''") \
+                .replace('\n', '') \
+                .replace('\r', '') \
+                .replace('\t', '')
+            value = value[:nb_car]
+
+            if value == '0.0':
+                value = '0'
 
+        value_retour = value
 
-def validate_bool(value, bool_type, col_name):
+    except ValueError:
+        err = f"La longueur de str doit être un integer, colonne {col_name}\n"
+        value_retour = (err,)
+
+    return value_retour
+
+
+def validate_text(value, lg_str, col_name):
     """
-    Fonction de validation des booléens
+    Fonction de validation des texte
         :param value: valeur
-        :param bool_type: type de bool
+        :param lg_str: on nécessaire, juste pour la signature globle
         :param col_name: nom de colonne
         :return: valeur validée
     """
-    if not value:
-        value_retour = '<NULL>'
+    print(lg_str)
 
-    else:
-        if value == 'f':
-            value = False
+    try:
+        if not value:
+            value = ''
         else:
-            value = True
+            value = value.replace('"', '') \
+                .replace("'", "''") \
+                .replace('\n', '') \
+                .replace('\r', '') \
+                .replace('\t', '')
+            value = value[:2056]
+
+            if value == '0.0':
+                value = '0'
 
         value_retour = value
 
-    # Il faut ajouter un test bool nullable pour vérification plus robuste
-    print(bool_type, col_name)
+    except ValueError:
+        err = f"La longueur de str doit être un integer, colonne {col_name}\n"
+        value_retour = (err,)
 
     return value_retour
 
 
-def validate_date(value, format_date, col_name):
+def clean_columns(clean_column):
     """
-    Fonction de validation des dates
-        :param value: valeur
+    fonction qui clean le nom des colonnes
+        :param clean_column: colonne à cleaner
+        :return: valeur cleanée
+    """
+    col = clean_column.strip().replace(' ', '_').replace('\n', '_').replace('\r', '_').lower()
+    return col
+
+
+def validate_element(value, col_name, tup_type):
+    """
+    Fonction de validation des données de leur type. La taille de la valeur pour les str
+    est tronquée à la valeur demandée
+        :param value: valeur a verifier
+        :param col_name: nom ou numero de la colonne, pour information en cas d'erreur
+        :param tup_type: le tuple de type de donnees
+        :return: retourne la valeur nettoyee, ou l'erreur
+    """
+    l_g, mandatory, validator = tup_type
+    valeur = str(value).strip()
+
+    # Si l'on a pas de valeur dans la cellule et quelle est obligatoire, alors on lance une
+    # erreur
+    if not valeur and mandatory:
+        err = f"une valeur est obligatoire, pour la colonne {col_name}, le champ est vide\n"
+        valeur_retour = (err,)
+
+    else:
+        try:
+            valeur_retour = globals()[validator](valeur, l_g, col_name)
+
+        except KeyError:
+            raise NotValidatorError(f"le validateur : {validator}, n'existe pas!'")
+
+    return valeur_retour
+
+
+def compile_str(lg_str, col_name):
+    """
+    Fonction qui renvoie le validateur des str d'une colonne, avec la longueur pré-calculée
+        :param lg_str: longueur maxi du str à renvoyer
+        :param col_name: nom de colonne
+        :return: fonction(valeur) -> valeur validée, ou None si lg_str n'est pas un entier
+    """
+    try:
+        nb_car = int(lg_str)
+    except (TypeError, ValueError):
+        return None
+
+    def validate(value):
+        if not value:
+            return ''
+
+        value = value.replace('"', '') \
+            .replace("'", "''") \
+            .replace('\n', '') \
+            .replace('\r', '') \
+            .replace('\t', '')
+        value = value[:nb_car]
+
+        return '0' if value == '0.0' else value
+
+    return validate
+
+
+def compile_date(format_date, col_name):
+    """
+    Fonction qui renvoie le validateur des dates d'une colonne, avec le séparateur et la
+    position du jour, du mois et de l'année pré-calculés
         :param format_date: format de date demandé
         :param col_name: nom de colonne
-        :return: valeur validée
+        :return: fonction(valeur) -> valeur validée, ou None si le format n'est pas pré-calculable
     """
-    if not value:
-        value_retour = '<NULL>'
-        return value_retour
+    lg_valide = {'/', '-', '_', ':', 'D', 'M', 'Y', 'date_adp'}
+
+    if any(r not in lg_valide for r in format_date) or format_date[0] == 'date_adp':
+        return None
+
+    try:
+        sep = format_date[0]
+        dte = format_date[1:]
+        n_d = dte.index('D')
+        n_m = dte.index('M')
+        n_y = dte.index('Y')
+    except (ValueError, IndexError):
+        return None
+
+    def validate(value):
+        if not value:
+            return '<NULL>'
+
+        if sep not in value:
+            return (f"la séparation de date attendu, est {sep}, la date du fichier est : "
+                    f"{value}, pour la colonne {col_name}\n",)
+
+        try:
+            d_t = value.split(' ')[0].split(sep)
+            jour = int(d_t[n_d])
+            mois = int(d_t[n_m])
+            annee = int(d_t[n_y])
+
+            if len(str(annee)) == 2:
+                annee += 2000
+
+            return date(annee, mois, jour)
+
+        except (ValueError, IndexError):
+            return (f"la value '{value}' ne correspond pas à une date, pour la colonne "
+                    f"{col_name}\n",)
+
+    return validate
+
+
+COMPILED_VALIDATORS = {
+    'validate_str': compile_str,
+    'validate_date': compile_date,
+}
+
+
+def compile_validator(col_name, tup_type):
+    """
+    Fonction qui lie une fois pour toutes, une colonne à son validateur, avec le contrôle des
+    valeurs obligatoires. Le résultat est le même que validate_element(value, col_name, tup_type)
+        :param col_name: nom de la colonne, pour information en cas d'erreur
+        :param tup_type: le tuple de type de donnees (l_g, mandatory, validator)
+        :return: fonction(valeur str) -> valeur nettoyee, ou l'erreur
+    """
+    l_g, mandatory, validator = tup_type
+
+    try:
+        func = globals()[validator]
+    except KeyError:
+        raise NotValidatorError(f"le validateur : {validator}, n'existe pas!'")
+
+    validate = None
+
+    if validator in COMPILED_VALIDATORS:
+        validate = COMPILED_VALIDATORS[validator](l_g, col_name)
+
+    if validate is None:
+        def validate(value):
+            return func(value, l_g, col_name)
+
+    err_mandatory = (
+        f"une valeur est obligatoire, pour la colonne {col_name}, le champ est vide\n",
+    )
+
+    if mandatory:
+        def validate_column(value):
+            valeur = value.strip()
+            return validate(valeur) if valeur else err_mandatory
+    else:
+        def validate_column(value):
+            return validate(value.strip())
+
+    return validate_column
+
+
+NUMBER_LINES_RE = re.compile(r'^(-?[0-9]+(?:\.[0-9]+)?)?$', re.MULTILINE)
+
+
+def compile_number_batch(decimale, col_name, mandatory):
+    """
+    Fonction qui renvoie le validateur par lot des int et float d'une colonne. Le lot est
+    contrôlé en une seule passe d'expression régulière, puis converti par float ; si une seule
+    valeur n'est pas un nombre simple (-1234.56), il est rendu None pour que le lot soit validé
+    valeur par valeur
+        :param decimale: 0 pour int, 1 pour float
+        :param col_name: nom de colonne
+        :param mandatory: True si la donnee est obligatoire
+        :return: fonction(list de valeurs) -> list des valeurs validées ou None
+    """
+    if decimale not in {0, 1}:
+        return None
+
+    err_mandatory = (
+        f"une valeur est obligatoire, pour la colonne {col_name}, le champ est vide\n",
+    )
+    empty = err_mandatory if mandatory else int(0)
 
+    def validate_batch(values):
+        joined = '\n'.join(values).replace(',', '.').replace(' ', '')
+        found = NUMBER_LINES_RE.findall(joined)
+
+        if len(found) != len(values) or joined.count('\n') != len(values) - 1:
+            return None
+
+        values_retour = []
+
+        for value in found:
+            if not value:
+                values_retour.append(empty)
+                continue
+
+            v_a = float(value)
+
+            if v_a == 0:
+                v_a = int(0)
+            elif decimale == 0:
+                v_a = int(v_a)
+
+            values_retour.append(v_a)
+
+        return values_retour
+
+    return validate_batch
+
+
+def compile_date_batch(format_date, col_name, mandatory):
+    """
+    Fonction qui renvoie le validateur par lot des dates d'une colonne. Le jour, le mois et
+    l'année de tout le lot sont extraits en une seule passe d'expression régulière ; si une
+    seule valeur n'est pas au format attendu, il est rendu None pour que le lot soit validé
+    valeur par valeur
+        :param format_date: format de date demandé
+        :param col_name: nom de colonne
+        :param mandatory: True si la donnee est obligatoire
+        :return: fonction(list de valeurs) -> list des valeurs validées ou None
+    """
     lg_valide = {'/', '-', '_', ':', 'D', 'M', 'Y', 'date_adp'}
 
-    if any(r not in lg_valide for r in format_date):
-        err = (f"Sep {', '.join(lg_valide)}, Obligatoires, "
-               f"pour la colonne {col_name}\n")
-        value_retour = (err,)
+    if any(r not in lg_valide for r in format_date) or format_date[0] == 'date_adp':
+        return None
 
-    elif format_date[0] not in value and format_date[0] != 'date_adp':
-        err = (f"la séparation de date attendu, est {format_date[0]}, la date du fichier est : "
-               f"{value}, pour la colonne {col_name}\n")
-        value_retour = (err,)
+    try:
+        sep = format_date[0]
+        dte = format_date[1:]
+        n_d = dte.index('D')
+        n_m = dte.index('M')
+        n_y = dte.index('Y')
+    except (ValueError, IndexError):
+        return None
+
+    line = re.escape(sep).join(['([0-9]+)'] * len(dte))
+    date_lines_re = re.compile(f'^[ \t]*(?:{line})?[ \t]*$', re.MULTILINE)
+
+    err_mandatory = (
+        f"une valeur est obligatoire, pour la colonne {col_name}, le champ est vide\n",
+    )
+    empty = err_mandatory if mandatory else '<NULL>'
+
+    def validate_batch(values):
+        joined = '\n'.join(values)
+        found = date_lines_re.findall(joined)
+
+        if len(found) != len(values) or joined.count('\n') != len(values) - 1:
+            return None
+
+        values_retour = []
+
+        for k, d_t in enumerate(found):
+            if not d_t[0]:
+                values_retour.append(empty)
+                continue
+
+            annee = int(d_t[n_y])
+
+            if 9 < annee < 100:
+                annee += 2000
+
+            try:
+                values_retour.append(date(annee, int(d_t[n_m]), int(d_t[n_d])))
+            except ValueError:
+                values_retour.append(
+                    (f"la value '{values[k].strip()}' ne correspond pas à une date, "
+                     f"pour la colonne {col_name}\n",)
+                )
+
+        return values_retour
+
+    return validate_batch
+
+
+BATCH_VALIDATORS = {
+    'validate_float': compile_number_batch,
+    'validate_int': compile_number_batch,
+    'validate_date': compile_date_batch,
+}
+
+
+def compile_validator_batch(col_name, tup_type, validate_column=None):
+    """
+    Fonction qui renvoie le validateur par lot d'une colonne, les valeurs du lot qui ne passent
+    pas le contrôle rapide sont validées une à une, par compile_validator. Le résultat est le
+    même que [validate_element(value, col_name, tup_type) for value in values]
+        :param col_name: nom de la colonne, pour information en cas d'erreur
+        :param tup_type: le tuple de type de donnees (l_g, mandatory, validator)
+        :param validate_column: validateur valeur par valeur déjà compilé, sinon compile_validator
+        :return: fonction(list de valeurs str) -> list des valeurs nettoyees, ou des erreurs
+    """
+    l_g, mandatory, validator = tup_type
+
+    if validate_column is None:
+        validate_column = compile_validator(col_name, tup_type)
+
+    validate_fast = None
+
+    if validator in BATCH_VALIDATORS:
+        validate_fast = BATCH_VALIDATORS[validator](l_g, col_name, mandatory)
+
+    if validate_fast is None:
+        def validate_batch(values):
+            return [validate_column(value) for value in values]
 
     else:
+        def validate_batch(values):
+            values_retour = validate_fast(values)
+
+            if values_retour is None:
+                values_retour = [validate_column(value) for value in values]
+
+            return values_retour
+
+    return validate_batch
+
+
+class MemoValidator:
+    """
+    Cache LRU borné, devant le validateur d'une colonne. Les résultats des valeurs répétées
+    (dates, codes, statuts, montants...) ne sont calculés qu'une fois. Après sample appels,
+    si le taux de succès du cache est inférieur à min_hit_rate, la colonne est jugée à trop
+    forte cardinalité et le cache se désactive de lui-même.
+        exemple:
+            validate = MemoValidator(compile_validator('date_retour', tup_type), 1024)
+            validate('2020-01-31')
+            validate.cache_info() -> {'hits': 0, 'misses': 1, 'bypass': 0, 'enabled': True, ...}
+    """
+
+    def __init__(self, validate, maxsize=1024, min_hit_rate=0.5, sample=10000):
+        """
+        Initialisation de la class MemoValidator
+            :param validate: validateur d'une colonne, fonction(valeur) -> valeur validée
+            :param maxsize: nombre maximum de valeurs en cache
+            :param min_hit_rate: taux de succès minimum, en dessous le cache est désactivé
+            :param sample: nombre d'appels entre deux contrôles du taux de succès
+        """
+        self.validate = validate
+        self.maxsize = maxsize
+        self.min_hit_rate = min_hit_rate
+        self.sample = sample
+        self.cached = lru_cache(maxsize=maxsize)(validate)
+        self.call = self.cached
+        self.enabled = True
+        self.calls = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, value):
+        self.calls += 1
+
+        if self.calls % self.sample == 0 and self.enabled:
+            self.check_hit_rate()
+
+        return self.call(value)
+
+    def check_hit_rate(self):
+        """
+        Fonction qui désactive le cache, si le taux de succès est trop faible
+            :return: None
+        """
+        info = self.cached.cache_info()
+        lookups = info.hits + info.misses
+
+        if lookups and info.hits / lookups < self.min_hit_rate:
+            self.hits, self.misses = info.hits, info.misses
+            self.enabled = False
+            self.call = self.validate
+            self.cached.cache_clear()
+
+    def cache_info(self):
+        """
+        Fonction qui renvoie les compteurs du cache, pour le réglage de maxsize
+            :return: dict hits, misses, bypass (appels sans cache), enabled, size, maxsize
+        """
+        if self.enabled:
+            info = self.cached.cache_info()
+            hits, misses, size = info.hits, info.misses, info.currsize
+        else:
+            hits, misses, size = self.hits, self.misses, 0
+
+        return {
+            'hits': hits,
+            'misses': misses,
+            'bypass': self.calls - hits - misses,
+            'enabled': self.enabled,
+            'size': size,
+            'maxsize': self.maxsize,
+        }
+
+
+class ValidatorPlan:
+    """
+    Plan de validation compilé, à partir des (champs, (type, taille, validateur)) renvoyés par
+    GetModel.get_champs_types(). Chaque colonne est liée une seule fois à son validateur,
+    le plan est réutilisable pour tous les fichiers d'un même modèle.
+        exemple:
+            plan = ValidatorPlan(GetModel(cnx, modele).get_champs_types()[1])
+            valeurs = plan.validate(['F001', '2020-01-31', '12,5'])
+    """
+
+    def __init__(self, columns_table, cache_size=0):
+        """
+        Initialisation de la class ValidatorPlan
+            :param columns_table: la liste des colonnes et leur format, comme CsvTxtValidator
+            :param cache_size: si renseigné, taille du cache LRU par colonne (MemoValidator)
+        """
+        self.columns_table = list(columns_table)
+        self.columns = tuple(r[0] for r in self.columns_table)
+        self.validators = tuple(compile_validator(col, tup) for col, tup in self.columns_table)
+
+        if cache_size:
+            self.validators = tuple(
+                MemoValidator(validate, cache_size) for validate in self.validators
+            )
+
+        self.batch_validators = tuple(
+            compile_validator_batch(col, tup, self.validators[i])
+            for i, (col, tup) in enumerate(self.columns_table)
+        )
 
-        try:
-            sep = format_date[0]
+    def __len__(self):
+        return len(self.validators)
 
-            if sep == 'date_adp':
-                n_d = 0
-                n_m = 1
-                n_y = 2
-                d_t = date_adp(value)
+    def cache_info(self):
+        """
+        Fonction qui renvoie les compteurs des caches par colonne
+            :return: dict {colonne: MemoValidator.cache_info()}, vide si pas de cache
+        """
+        return {
+            col: validate.cache_info()
+            for col, validate in zip(self.columns, self.validators)
+            if isinstance(validate, MemoValidator)
+        }
 
-            else:
-                d_t = value.split(' ')[0].split(sep)
-                dte = format_date[1:]
-                n_d = dte.index('D')
-                n_m = dte.index('M')
-                n_y = dte.index('Y')
+    def validate(self, values):
+        """
+        Fonction qui applique le plan à une ligne
+            :param values: valeurs str de la ligne, dans l'ordre des colonnes du plan
+            :return: list des valeurs nettoyées, les erreurs sont des tuples (erreur,)
+        """
+        return [validate(values[i]) for i, validate in enumerate(self.validators)]
 
-            jour = int(d_t[n_d])
-            mois = int(d_t[n_m])
-            annee = int(d_t[n_y])
+    def validate_batch(self, rows):
+        """
+        Fonction qui applique le plan à un lot de lignes, colonne par colonne
+            :param rows: list des lignes de valeurs str, dans l'ordre des colonnes du plan
+            :return: list des lignes de valeurs nettoyées, les erreurs sont des tuples (erreur,)
+        """
+        if not rows:
+            return []
 
-            if len(str(annee)) == 2:
-                annee += 2000
+        columns = [
+            validate([row[i] for row in rows]) for i, validate in enumerate(self.batch_validators)
+        ]
 
-            value_retour = date(annee, mois, jour)
+        return [list(ligne) for ligne in zip(*columns)]
 
-        except (ValueError, IndexError):
-            err = (f"la value '{value}' ne correspond pas à une date, pour la colonne "
-                   f"{col_name}\n")
-            value_retour = (err,)
 
-    return value_retour
+MMAP_MIN_SIZE = 8 * 1024 * 1024
+MMAP_BLOCK_SIZE = 16 * 1024 * 1024
+# Octets ascii blancs pour str.strip, et octets non ascii, pour tester les lignes sans décodage
+BLANK_BYTES = bytes(b for b in range(128) if chr(b).isspace())
+HIGH_BYTES = bytes(range(128, 256))
+# Caractères blancs pour str.strip, le dernier est U+3000
+BLANK_CHARS = ''.join(chr(c) for c in range(0x3001) if chr(c).isspace())
 
 
-def validate_datetime(value):
+def iter_records_blocks(buffer, quotechar='"', block_size=MMAP_BLOCK_SIZE):
     """
-    Fonction de validation des datetime
-        :param value: valeur
-        :return: valeur validée
+    Générateur des enregistrements d'un csv en octets, par blocs, sans décodage. Les lignes
+    sont découpées par bytes.split, seules celles qui ont un nombre impair de guillemets
+    ouvrent ou ferment un champ sur plusieurs lignes, et sont regroupées avec les suivantes
+    (même repérage que get_chunks_offsets)
+        :param buffer: bytes ou mmap du fichier
+        :param quotechar: caractère des guillemets du csv
+        :param block_size: taille des blocs de lecture
+        :return: générateur des (numéro du premier enregistrement, list des enregistrements
+                 sans la fin de ligne)
     """
-    print(value)
+    quote = quotechar.encode('ascii')
+    size = len(buffer)
+    position = 0
+    first = 0
+    carry = None
 
+    while position < size:
+        end = size
 
-def validate_float(value, decimale, col_name):
-    """
-    Fonction de validation des float
-        :param value: valeur
-        :param decimale: decimales
-        :param col_name: nom de colonne
-        :return: valeur validée
-    """
-    value = str(value).replace(',', '.').replace(' ', '')
-    list_s = []
+        if position + block_size < size:
+            end = buffer.rfind(b'\n', position, position + block_size) + 1 \
+                or buffer.find(b'\n', position + block_size) + 1 \
+                or size
 
-    for l_s in value[::-1]:
+        block = buffer[position:end]
+        position = end
 
-        try:
-            int(l_s)
-            list_s.append(l_s)
+        if block.endswith(b'\n'):
+            block = block[:-1]
 
-        except ValueError:
-            if '.' not in list_s and l_s == '.' or '-' in l_s:
-                list_s.append(l_s)
-            elif '(' in l_s and '-' not in list_s:
-                list_s.append('-')
+        if carry is not None:
+            block = carry + b'\n' + block
+            carry = None
 
-    list_s.reverse()
-    value = "".join(list_s)
+        lines = block.split(b'\n')
+        odd = None
 
-    if not value:
-        value_retour = int(0)
+        if quote in block:
+            odd = [i for i, n in enumerate(map(bytes.count, lines, repeat(quote))) if n % 2]
 
-    elif decimale not in {0, 1}:
-        err = (f"Pour un float, l_g doit être un int, 0 (pour int) ou 1 (pour float), "
-               f"colonne {col_name}")
-        value_retour = (err,)
+        if odd:
+            records = []
+            start = 0
 
-    else:
-        val = value
-        try:
-            v_a = float(val)
-            if not value:
-                v_a = int(0)
-            elif v_a == 0:
-                v_a = int(0)
-            else:
-                if decimale == 0:
-                    v_a = int(v_a)
-                elif decimale == 1:
-                    v_a = float(v_a)
+            for i_open, i_close in zip(odd[::2], odd[1::2]):
+                records.extend(lines[start:i_open])
+                records.append(b'\n'.join(lines[i_open:i_close + 1]))
+                start = i_close + 1
 
-            value_retour = v_a
+            # Champ encore ouvert en fin de bloc, il se poursuit dans le bloc suivant
+            if len(odd) % 2:
+                records.extend(lines[start:odd[-1]])
+                carry = b'\n'.join(lines[odd[-1]:])
 
-        except ValueError:
-            err = f"la value '{val}' doit être un nombre, pour la colonne {col_name}\n"
-            value_retour = (err,)
+                if position >= size:
+                    records.append(carry)
+            else:
+                records.extend(lines[start:])
 
-    return value_retour
+            lines = records
 
+        yield first, lines
+        first += len(lines)
 
-def validate_int(value, decimale, col_name):
+
+def iter_projected_rows(
+        lines, columns, lines_to_delete=(), first_record=0, sous_totaux=(), **reader_params
+):
     """
-    Fonction de validation des int
-        :param value: valeur
-        :param decimale: non nécessaire, juste pour la signature globle
-        :param col_name: nom de colonne
-        :return: valeur validée
+    Générateur des lignes d'un csv réduites aux colonnes demandées. Les positions sont
+    calculées une fois (itemgetter), seules les lignes à garder sont découpées, et au plus
+    jusqu'à la dernière colonne demandée, par str.split. Les lignes avec guillemets passent
+    par csv.reader, qui lit aussi les champs sur plusieurs lignes, comme toutes les lignes
+    des dialectes avec caractère d'échappement ou skipinitialspace. Les lignes supprimées,
+    vides ou de sous totaux sont ignorées, les colonnes absentes d'une ligne courte valent ''
+        :param lines: itérable des lignes de texte, fichier ouvert avec newline=''
+        :param columns: positions des colonnes à prendre, voir get_columns_position
+        :param lines_to_delete: LinesIntervals des numéros d'enregistrements à supprimer
+        :param first_record: numéro du premier enregistrement de lines
+        :param sous_totaux: règles des lignes de sous totaux à supprimer, compile_sous_totaux
+        :param reader_params: paramètres de csv.reader, dialect, delimiter...
+        :return: générateur des list des valeurs des colonnes demandées
     """
-    value = str(value).replace(',', '.').replace(' ', '')
-    list_s = []
+    lines = iter(lines)
+    pending = []
 
-    for l_s in value[::-1]:
+    def feed():
+        while True:
+            if pending:
+                yield pending.pop()
+                continue
 
-        try:
-            int(l_s)
-            list_s.append(l_s)
+            line = next(lines, None)
 
-        except ValueError:
-            if '.' not in list_s and l_s == '.' or '-' in l_s:
-                list_s.append(l_s)
-            elif '(' in l_s and '-' not in list_s:
-                list_s.append('-')
+            if line is None:
+                return
 
-    list_s.reverse()
-    value = "".join(list_s)
+            yield line
 
-    if not value:
-        value_retour = int(0)
+    reader = csv.reader(feed(), **reader_params)
+    sep = reader.dialect.delimiter
+    quote = reader.dialect.quotechar or '\0'
+    blank = BLANK_CHARS + sep
+    fast = not reader.dialect.skipinitialspace and reader.dialect.escapechar is None
+    columns = list(columns)
+    nb_fields = max(columns + [i for i, _ in sous_totaux]) + 1 if columns else 0
+    getter = itemgetter(*columns) if len(columns) > 1 else (lambda row: (row[columns[0]],))
 
-    elif decimale not in {0, 1}:
-        err = (f"Pour un float, l_g doit être un int, 0 (pour int) ou 1 (pour float), "
-               f"colonne {col_name}")
-        value_retour = (err,)
+    def project(row):
+        if len(row) >= nb_fields:
+            return list(getter(row))
 
-    else:
-        val = value
-        try:
-            v_a = float(val)
-            if not value:
-                v_a = int(0)
-            elif v_a == 0:
-                v_a = int(0)
-            else:
-                if decimale == 0:
-                    v_a = int(v_a)
-                elif decimale == 1:
-                    v_a = float(v_a)
+        return [row[i] if i < len(row) else '' for i in columns]
 
-            value_retour = v_a
+    def is_sous_total(row):
+        return any(
+            i < len(row) and row[i].strip().lower().startswith(label) for i, label in sous_totaux
+        )
 
-        except ValueError:
-            err = f"la value '{val}' doit être un nombre, pour la colonne {col_name}\n"
-            value_retour = (err,)
+    k = first_record - 1
 
-    return value_retour
+    for line in lines:
+        k += 1
 
+        if fast and quote not in line:
+            if k in lines_to_delete or not line.strip(blank):
+                continue
 
-def validate_str(value, lg_str, col_name):
-    """
-    Fonction de validation des str
-        :param value: valeur
-        :param lg_str: longueur maxi du str à renvoyer
-        :param col_name: nom de colonne
-        :return: valeur validée
-    """
-    try:
-        if not value:
-            value = ''
-        else:
-            nb_car = int(lg_str)
-            value = value.replace('"', '') \
-                .replace("'", "''") \
-                .replace('\n', '') \
-                .replace('\r', '') \
-                .replace('\t', '')
-            value = value[:nb_car]
+            row = line.split(sep, nb_fields)
 
-            if value == '0.0':
-                value = '0'
+            # La fin de ligne n'est dans une colonne demandée que si la ligne est courte
+            if len(row) <= nb_fields:
+                row[-1] = row[-1].rstrip('\r\n')
 
-        value_retour = value
+            if not sous_totaux or not is_sous_total(row):
+                yield project(row)
 
-    except ValueError:
-        err = f"La longueur de str doit être un integer, colonne {col_name}\n"
-        value_retour = (err,)
+            continue
 
-    return value_retour
+        # Enregistrement lu par csv.reader, y compris ses lignes suivantes
+        pending.append(line)
+        row = next(reader, None)
 
+        if row is None:
+            return
 
-def validate_text(value, lg_str, col_name):
+        if k not in lines_to_delete and ''.join(row).strip() and not (
+                sous_totaux and is_sous_total(row)
+        ):
+            yield project(row)
+
+
+def is_clean_encoding(buffer, encoding_e, encoding_s, block_size=MMAP_BLOCK_SIZE):
     """
-    Fonction de validation des texte
-        :param value: valeur
-        :param lg_str: on nécessaire, juste pour la signature globle
-        :param col_name: nom de colonne
-        :return: valeur validée
+    Fonction qui vérifie, par blocs et sans garder le texte décodé, si les octets d'un fichier
+    sont déjà ceux de encoding_s : fichier valide dans encoding_e, avec le même encodage en
+    sortie, ou fichier entièrement ascii pour deux encodages compatibles ascii. Le décodeur
+    incrémental gère les caractères à cheval sur deux blocs
+        :param buffer: bytes ou mmap du fichier
+        :param encoding_e: encoding du fichier reçu
+        :param encoding_s: encoding du fichier traité
+        :param block_size: taille des blocs de lecture
+        :return: bool
     """
-    print(lg_str)
+    same_codec = codecs.lookup(encoding_e).name == codecs.lookup(encoding_s).name
+
+    if not same_codec and not (
+            is_ascii_compatible(encoding_e) and is_ascii_compatible(encoding_s)
+    ):
+        return False
+
+    decoder = codecs.getincrementaldecoder(encoding_e)('strict')
 
     try:
-        if not value:
-            value = ''
-        else:
-            value = value.replace('"', '') \
-                .replace("'", "''") \
-                .replace('\n', '') \
-                .replace('\r', '') \
-                .replace('\t', '')
-            value = value[:2056]
+        for start in range(0, len(buffer), block_size):
+            block = buffer[start:start + block_size]
 
-            if value == '0.0':
-                value = '0'
+            if same_codec:
+                decoder.decode(block)
+            elif not block.isascii():
+                return False
 
-        value_retour = value
+        decoder.decode(b'', final=True)
 
-    except ValueError:
-        err = f"La longueur de str doit être un integer, colonne {col_name}\n"
-        value_retour = (err,)
+    except UnicodeDecodeError:
+        return False
 
-    return value_retour
+    return True
 
 
-def clean_columns(clean_column):
+def remove_columuns_lines_mmap(
+        file_to_validate,
+        csv_to_validate,
+        columns_to_take,
+        lines_to_delete,
+        dialect,
+        **csv_params
+):
     """
-    fonction qui clean le nom des colonnes
-        :param clean_column: colonne à cleaner
-        :return: valeur cleanée
+    Variante de remove_columuns_lines pour les gros fichiers non compressés, dont toutes les
+    colonnes sont gardées dans l'ordre : le fichier est projeté en mémoire et découpé en
+    enregistrements sur les octets. Les lignes supprimées ne sont pas décodées. Les lignes sans
+    guillemets sont recopiées telles quelles quand le fichier est déjà propre dans encoding_s
+    (is_clean_encoding), ou transcodées par blocs sinon. Les autres lignes sont décodées par
+    lots et réécrites par le csv.writer.
+        :param file_to_validate: Nom et chemin du fichier en entrée
+        :param csv_to_validate: Nom et chemin du fichier en sortie
+        :param columns_to_take: colonnes à conserver
+        :param lines_to_delete: LinesIntervals des lignes non souhaitées
+        :param dialect: dialect csv du fichier en entrée
+        :param csv_params: parametres des fichiers csv : sep | encoding_e | encoding_s | errors
+        :return: None
     """
-    col = clean_column.strip().replace(' ', '_').replace('\n', '_').replace('\r', '_').lower()
-    return col
+    encoding_e = csv_params['encoding_e']
+    encoding_s = csv_params['encoding_s']
+    errors = csv_params['errors']
+    sep = csv_params['sep']
+    sep_b = sep.encode('ascii')
+    blank = BLANK_BYTES + sep_b
+    quote = dialect.quotechar.encode('ascii')
+    nb_sep = len(columns_to_take) - 1
+
+    with open(file_to_validate, 'rb') as binary_file, \
+            mmap.mmap(binary_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer, \
+            open(csv_to_validate, 'wb') as binary_out:
+        clean = is_clean_encoding(buffer, encoding_e, encoding_s)
+
+        def write_records(records):
+            # Les enregistrements à réécrire sont décodés, lus et réécrits par lots
+            text = io.StringIO(newline='')
+            csv.writer(
+                text,
+                delimiter=sep,
+                quotechar='"',
+                quoting=csv.QUOTE_NONNUMERIC
+            ).writerows(
+                iter_projected_rows(
+                    io.StringIO(b'\n'.join(records).decode(encoding_e, errors), newline=''),
+                    columns_to_take,
+                    dialect=dialect,
+                    delimiter=sep
+                )
+            )
+            binary_out.write(text.getvalue().encode(encoding_s))
 
+        def copy_records(records):
+            # Les enregistrements sont recopiés, ou transcodés par blocs
+            data = b'\n'.join(records) + b'\n'
 
-def validate_element(value, col_name, tup_type):
-    """
-    Fonction de validation des données de leur type. La taille de la valeur pour les str
-    est tronquée à la valeur demandée
-        :param value: valeur a verifier
-        :param col_name: nom ou numero de la colonne, pour information en cas d'erreur
-        :param tup_type: le tuple de type de donnees
-        :return: retourne la valeur nettoyee, ou l'erreur
-    """
-    l_g, mandatory, validator = tup_type
-    valeur = str(value).strip()
+            if not clean:
+                data = data.decode(encoding_e, errors).encode(encoding_s)
 
-    # Si l'on a pas de valeur dans la cellule et quelle est obligatoire, alors on lance une
-    # erreur
-    if not valeur and mandatory:
-        err = f"une valeur est obligatoire, pour la colonne {col_name}, le champ est vide\n"
-        valeur_retour = (err,)
+            binary_out.write(data)
 
-    else:
-        try:
-            valeur_retour = globals()[validator](valeur, l_g, col_name)
+        for first, records in iter_records_blocks(buffer, dialect.quotechar):
+            if lines_to_delete:
+                records = [
+                    record for k, record in enumerate(records, first)
+                    if k not in lines_to_delete
+                ]
 
-        except KeyError:
-            raise NotValidatorError(f"le validateur : {validator}, n'existe pas!'")
+            to_write = []
+            to_copy = []
 
-    return valeur_retour
+            for record in records:
+                if quote in record or record.count(sep_b) != nb_sep:
+                    if to_copy:
+                        copy_records(to_copy)
+                        to_copy = []
+
+                    to_write.append(record)
+                    continue
+
+                rest = record.translate(None, blank)
+
+                # Ligne vide, ou seulement des blancs non ascii
+                if not rest or (
+                        not rest.translate(None, HIGH_BYTES)
+                        and not rest.decode(encoding_e, errors).strip()
+                ):
+                    continue
+
+                if to_write:
+                    write_records(to_write)
+                    to_write = []
+
+                to_copy.append(record)
+
+            if to_write:
+                write_records(to_write)
+
+            if to_copy:
+                copy_records(to_copy)
 
 
 def remove_columuns_lines(
@@ -731,6 +3249,7 @@ def remove_columuns_lines(
         csv_to_validate,
         columns_to_take,
         lines_to_delete=(),
+        sous_totaux=(),
         **csv_params
 ):
     """
@@ -738,21 +3257,51 @@ def remove_columuns_lines(
         :param file_to_validate: Nom et chemin du fichier en entrée
         :param csv_to_validate: Nom et chemin du fichier en sortie
         :param columns_to_take: colonnes à conserver
-        :param lines_to_delete: liste des lignes non souhaitées
+        :param lines_to_delete: LinesIntervals des lignes non souhaitées
+        :param sous_totaux: règles des lignes de sous totaux à supprimer, compile_sous_totaux
         :param csv_params: parametres des fichiers csv : sep | encoding_e | encoding_s | errors
         :return: None
     """
-    with open(
+    with open_text_file(
             file_to_validate,
-            'r',
             encoding=csv_params['encoding_e'],
-            errors=csv_params['errors'],
-            newline=''
+            errors=csv_params['errors']
     ) as open_file:
         dialect = csv.Sniffer().sniff(open_file.readline())
-        open_file.seek(0)
-        reader = csv.reader(open_file, dialect, delimiter=csv_params['sep'])
 
+    # Gros fichier non compressé, gardé avec toutes ses colonnes et dont les séparateurs
+    # restent sur leur octet ascii. Sinon la lecture par iter_projected_rows est plus rapide
+    if (
+            get_compression(file_to_validate) is None
+            and os.path.getsize(file_to_validate) >= MMAP_MIN_SIZE
+            and list(columns_to_take) == list(range(len(columns_to_take)))
+            and not sous_totaux
+            and not dialect.skipinitialspace
+            and dialect.escapechar is None
+            and is_ascii_compatible(csv_params['encoding_e'], csv_params['sep'] + dialect.quotechar)
+            and is_ascii_compatible(csv_params['encoding_s'], csv_params['sep'])
+            # Dialecte deviné sur l'entête, sans doublequote les enregistrements ne sont lus
+            # comme par la parité des guillemets que si le fichier n'a aucun guillemet
+            and (
+                dialect.doublequote
+                or not file_contains(file_to_validate, dialect.quotechar.encode('ascii'))
+            )
+    ):
+        remove_columuns_lines_mmap(
+            file_to_validate,
+            csv_to_validate,
+            columns_to_take,
+            lines_to_delete,
+            dialect,
+            **csv_params
+        )
+        return
+
+    with open_text_file(
+            file_to_validate,
+            encoding=csv_params['encoding_e'],
+            errors=csv_params['errors']
+    ) as open_file:
         with open(
                 csv_to_validate,
                 'w',
@@ -765,40 +3314,130 @@ def remove_columuns_lines(
                 quotechar='"',
                 quoting=csv.QUOTE_NONNUMERIC
             )
-            for row in iter_out_elements(reader, lines_to_delete):
-                if ''.join(row).strip():
-                    writer.writerow(iter_in_elements_order(row, columns_to_take))
+            writer.writerows(
+                iter_projected_rows(
+                    open_file,
+                    columns_to_take,
+                    lines_to_delete,
+                    sous_totaux=sous_totaux,
+                    dialect=dialect,
+                    delimiter=csv_params['sep']
+                )
+            )
+
+
+class LinesIntervals:
+    """
+    Lignes à supprimer, en intervalles [début, fin[ triés et fusionnés, sans liste de tous les
+    numéros de lignes. Les tests d'appartenance se font pour des numéros croissants, en lisant
+    le fichier : un curseur avance sur les intervalles, en O(1) amorti. Un numéro inférieur au
+    précédent replace le curseur par bisect
+        exemple:
+            lines = LinesIntervals([(0, 1), (3, 50000000)])
+            3 in lines --> True
+    """
+
+    def __init__(self, intervals=()):
+        """
+        Initialisation de la class LinesIntervals
+            :param intervals: itérable des (début, fin[), dans n'importe quel ordre
+        """
+        merged = []
+
+        for start, end in sorted(r for r in intervals if r[0] < r[1]):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+
+        self.starts = [r[0] for r in merged]
+        self.ends = [r[1] for r in merged]
+        self.cursor = 0
+        self.last = None
+
+    def __contains__(self, num_line):
+        i = self.cursor
+
+        if self.last is not None and num_line < self.last:
+            i = max(bisect_right(self.starts, num_line) - 1, 0)
+
+        while i < len(self.ends) and self.ends[i] <= num_line:
+            i += 1
+
+        self.cursor = i
+        self.last = num_line
+
+        return i < len(self.ends) and self.starts[i] <= num_line
+
+    def __len__(self):
+        return sum(end - start for start, end in zip(self.starts, self.ends))
+
+    def __bool__(self):
+        return bool(self.starts)
+
+    def __repr__(self):
+        return f"LinesIntervals({list(zip(self.starts, self.ends))})"
 
 
 def setting_delete_lines(del_lines, header_line):
     """
-    Fonction qui applati les lignes à supprimer à la façon d'impression des pages
+    Fonction qui renvoie les lignes à supprimer, données à la façon d'impression des pages, en
+    intervalles, numérotées à partir de 0
         ex:
-            (1, 2, '4:7') --> {0, 1, 3, 4, 5, 6}
+            (1, 2, '4:7') --> LinesIntervals([(0, 2), (3, 7)])
         :param del_lines: lignes à supprimer
         :param header_line: lignes entête à supprimer à supprimer
-        :return: None en cas d'erreur de format envoyé, ou Set des lignes à supprimer
+        :return: None en cas d'erreur de format envoyé, ou LinesIntervals des lignes à supprimer
     """
-    set_s = set()
+    intervals = []
+
     for line in del_lines:
         if isinstance(line, (int,)):
-            set_s.add(line - 1)
+            intervals.append((line - 1, line))
         elif isinstance(line, (str,)):
             list_l = line.split(':')
             try:
                 b_inf = int(list_l[0])
                 b_sup = int(list_l[1]) + 1
-                for n_b in range(b_inf, b_sup):
-                    set_s.add(int(n_b) - 1)
-            except ValueError:
+                intervals.append((b_inf - 1, b_sup - 1))
+            except (ValueError, IndexError):
                 return None
         else:
             return None
 
     if header_line:
-        set_s.add(header_line - 1)
+        intervals.append((header_line - 1, header_line))
+
+    return LinesIntervals(intervals)
+
+
+def compile_sous_totaux(sous_total_a_supprimer):
+    """
+    Fonction qui prépare les règles de suppression des lignes de sous totaux : une ligne est
+    supprimée si la valeur de la colonne, sans les blancs et sans tenir compte de la casse,
+    commence par le libellé
+        ex:
+            ((2, 'Sous Total'), (3, 'Total')) --> [(1, 'sous total'), (2, 'total')]
+        :param sous_total_a_supprimer: tuple des (position de la colonne dans le fichier,
+                                       commence à 1, libellé)
+        :return: None en cas d'erreur de format envoyé, ou list des (index, libellé)
+    """
+    sous_totaux = []
+
+    for rule in sous_total_a_supprimer:
+        if (
+                not isinstance(rule, (list, tuple))
+                or len(rule) != 2
+                or not isinstance(rule[0], int)
+                or rule[0] < 1
+                or not isinstance(rule[1], str)
+                or not rule[1].strip()
+        ):
+            return None
+
+        sous_totaux.append((rule[0] - 1, rule[1].strip().lower()))
 
-    return set_s
+    return sous_totaux
 
 
 def csv_file_validator(csv_file, list_columns=None):
@@ -811,6 +3450,312 @@ def csv_file_validator(csv_file, list_columns=None):
     print(csv_file, list_columns)
 
 
+def is_ascii_compatible(encoding, chars=''):
+    """
+    Fonction qui vérifie si un encodage garde les caractères demandés, les guillemets et les fins
+    de lignes, sur leur octet ascii, pour pouvoir découper un fichier sans le décoder
+        :param encoding: encodage
+        :param chars: caractères à vérifier, en plus de '"', '\r' et '\n'
+        :return: bool
+    """
+    test = f'"\r\n{chars}'
+
+    try:
+        return test.encode(encoding) == test.encode('ascii')
+    except (LookupError, UnicodeError):
+        return False
+
+
+def file_contains(file_path, needle, block_size=16 * 1024 * 1024):
+    """
+    Fonction qui indique si un fichier contient un octet, lu par blocs, sans décodage
+        :param file_path: fichier
+        :param needle: octet recherché, ex: b'"'
+        :param block_size: taille des blocs de lecture
+        :return: bool
+    """
+    with open(file_path, 'rb') as binary_file:
+        return any(needle in block for block in iter(lambda: binary_file.read(block_size), b''))
+
+
+def get_chunks_offsets(file_path, nb_chunks, quotechar='"', block_size=16 * 1024 * 1024):
+    """
+    Fonction qui découpe un fichier csv en nb_chunks morceaux de tailles proches, sur des fins
+    d'enregistrements. Les fins de lignes entre guillemets font partie d'un champ, elles sont
+    repérées par la parité du nombre de guillemets depuis le début du fichier. Le fichier est lu
+    par blocs, en octets, sans décodage.
+        :param file_path: fichier à découper
+        :param nb_chunks: nombre de morceaux souhaités
+        :param quotechar: caractère des guillemets du csv
+        :param block_size: taille des blocs de lecture
+        :return: list des (début, fin, numéro du premier enregistrement du morceau)
+    """
+    size = os.path.getsize(file_path)
+    targets = [size * i // nb_chunks for i in range(1, nb_chunks)]
+    quote = quotechar.encode('ascii')
+    splits = [(0, 0)]
+    inside = False
+    records = 0
+    position = 0
+
+    with open(file_path, 'rb') as binary_file:
+        for block in iter(lambda: binary_file.read(block_size), b''):
+            cursor = position
+
+            for i, part in enumerate(block.split(quote)):
+                if i:
+                    inside = not inside
+                    cursor += 1
+
+                if not inside:
+                    while targets and cursor + len(part) > targets[0]:
+                        n_l = part.find(b'\n', max(0, targets[0] - cursor))
+
+                        if n_l < 0:
+                            break
+
+                        targets.pop(0)
+                        offset = cursor + n_l + 1
+
+                        if splits[-1][0] < offset < size:
+                            splits.append((offset, records + part.count(b'\n', 0, n_l + 1)))
+
+                    records += part.count(b'\n')
+
+                cursor += len(part)
+
+            position += len(block)
+
+    ends = [offset for offset, _ in splits[1:]] + [size]
+
+    return [(start, end, first) for (start, first), end in zip(splits, ends)]
+
+
+def validate_file_chunk(task):
+    """
+    Fonction de validation d'un morceau de fichier, exécutée dans un process du pool de
+    CsvTxtValidator.validate_parallel. Les lignes validées sont écrites dans le fichier partiel
+    task['part'], jusqu'à la première erreur du morceau.
+        :param task: dict du morceau, voir CsvTxtValidator.validate_parallel
+        :return: (nombre de lignes conservées, list des erreurs [n° de ligne dans le
+                 morceau, erreur, ...], au plus 50)
+    """
+    validator = CsvTxtValidator(
+        task['file'],
+        task['columns_table'],
+        os.path.dirname(task['part']),
+        sep=task['sep'],
+        batch_size=task['batch_size'],
+        cache_size=task['cache_size']
+    )
+    columns = task['columns']
+    set_delete_lines = task['set_delete_lines']
+
+    with open(task['file'], 'rb') as binary_file:
+        binary_file.seek(task['start'])
+        data = binary_file.read(task['end'] - task['start'])
+
+    open_file = io.StringIO(data.decode(task['encoding_e'], task['errors']), newline='')
+    del data
+    rows = iter_projected_rows(
+        open_file,
+        columns,
+        set_delete_lines,
+        task['first_record'],
+        task['sous_totaux'],
+        delimiter=task['sep'],
+        **task['dialect']
+    )
+
+    list_errors = []
+    nb_kept = 0
+
+    with open(task['part'], 'w', encoding=task['encoding_s'], newline='') as csvfile:
+        csv_write = csv.writer(
+            csvfile,
+            delimiter=task['sep'],
+            quotechar='"',
+            quoting=csv.QUOTE_NONNUMERIC
+        )
+
+        for ligne, errors in validator.validate_rows(rows, columns, 0):
+            if errors:
+                list_errors.append(errors)
+                if len(list_errors) >= 50:
+                    break
+
+            if not list_errors:
+                csv_write.writerow(ligne)
+
+            nb_kept += 1
+
+    return nb_kept, list_errors
+
+
+class IntegrationStats:
+    """
+    Statistiques d'une intégration : temps par étape, lignes lues et rejetées, octets traités.
+    Remplie par integration_file_csv et CsvTxtValidator, elle peut être écrite au format texte
+    Prometheus, pour le textfile collector de node_exporter.
+        exemple:
+            stats = IntegrationStats(prometheus_file='/var/lib/node_exporter/csv_{table}.prom')
+            integration_file_csv(..., stats=stats)
+            stats.as_dict()
+    """
+    STAGES = ('connect', 'schema', 'header', 'projection', 'validation', 'upsert')
+
+    def __init__(self, prometheus_file=None):
+        """
+        Initialisation de la class IntegrationStats
+            :param prometheus_file: fichier .prom à écrire en fin d'intégration, {table} est
+                                    remplacé par le nom de la table
+        """
+        self.prometheus_file = prometheus_file
+        self.file = None
+        self.table = None
+        self.success = None
+        self.times = dict.fromkeys(IntegrationStats.STAGES, 0.0)
+        self.elapsed = 0.0
+        self.rows_read = 0
+        self.rows_rejected = 0
+        self.bytes_processed = 0
+        self.counts = None
+
+    @contextmanager
+    def timer(self, stage, exclude=()):
+        """
+        Context manager qui ajoute le temps passé dans le bloc à l'étape stage
+            :param stage: étape
+            :param exclude: étapes dont le temps, mesuré pendant le bloc, est à déduire
+                            (validation au fil de l'eau pendant l'upsert)
+        """
+        start = time.perf_counter()
+        excluded = sum(self.times[r] for r in exclude)
+
+        try:
+            yield
+        finally:
+            excluded = sum(self.times[r] for r in exclude) - excluded
+            self.times[stage] += time.perf_counter() - start - excluded
+
+    @property
+    def rows_s(self):
+        """
+        Lignes lues par seconde, sur la durée totale de l'intégration
+        """
+        return self.rows_read / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        """
+        Fonction qui renvoie les statistiques
+            :return: dict
+        """
+        return {
+            'file': self.file,
+            'table': self.table,
+            'success': self.success,
+            'times': dict(self.times),
+            'elapsed': self.elapsed,
+            'rows_read': self.rows_read,
+            'rows_rejected': self.rows_rejected,
+            'bytes_processed': self.bytes_processed,
+            'rows_s': self.rows_s,
+            'counts': self.counts,
+        }
+
+    def log_events(self, message):
+        """
+        Fonction qui écrit les enregistrements structurés de l'intégration, voir log_event :
+        un par étape mesurée, puis le total avec les compteurs
+            :param message: message des enregistrements
+            :return: None
+        """
+        level = 'info' if self.success else 'error'
+
+        for stage, duration in self.times.items():
+            if duration:
+                log_event(
+                    message, level, file=self.file, table=self.table, stage=stage,
+                    duration=duration
+                )
+
+        log_event(
+            message,
+            level,
+            file=self.file,
+            table=self.table,
+            stage='total',
+            duration=self.elapsed,
+            success=self.success,
+            rows_read=self.rows_read,
+            rows_rejected=self.rows_rejected,
+            bytes_processed=self.bytes_processed,
+            rows_s=self.rows_s,
+            counts=self.counts
+        )
+
+    def to_prometheus(self):
+        """
+        Fonction qui renvoie les statistiques au format texte Prometheus
+            :return: str
+        """
+        table = str(self.table or '')
+        table = table.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        label = f'table="{table}"'
+        metrics = [
+            ('stage_seconds', "Temps passé par étape lors de la dernière intégration", [
+                (f'{{{label},stage="{stage}"}}', seconds) for stage, seconds in self.times.items()
+            ]),
+            ('duration_seconds', "Durée de la dernière intégration", [
+                (f'{{{label}}}', self.elapsed)
+            ]),
+            ('rows_read', "Lignes lues lors de la dernière intégration", [
+                (f'{{{label}}}', self.rows_read)
+            ]),
+            ('rows_rejected', "Lignes rejetées lors de la dernière intégration", [
+                (f'{{{label}}}', self.rows_rejected)
+            ]),
+            ('bytes_processed', "Octets traités lors de la dernière intégration", [
+                (f'{{{label}}}', self.bytes_processed)
+            ]),
+            ('rows_per_second', "Lignes lues par seconde lors de la dernière intégration", [
+                (f'{{{label}}}', self.rows_s)
+            ]),
+            ('success', "1 si la dernière intégration a réussi", [
+                (f'{{{label}}}', 1 if self.success else 0)
+            ]),
+            ('last_run_timestamp_seconds', "Date de la dernière intégration", [
+                (f'{{{label}}}', time.time())
+            ]),
+        ]
+
+        lines = []
+
+        for name, help_text, samples in metrics:
+            lines.append(f'# HELP csv_integration_{name} {help_text}')
+            lines.append(f'# TYPE csv_integration_{name} gauge')
+
+            for labels, value in samples:
+                lines.append(f'csv_integration_{name}{labels} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, file_path=None):
+        """
+        Fonction qui écrit les statistiques au format texte Prometheus, par un fichier
+        temporaire renommé, pour que node_exporter ne lise jamais un fichier incomplet
+            :param file_path: fichier .prom, par défaut self.prometheus_file
+            :return: None
+        """
+        file_path = (file_path or self.prometheus_file).format(table=self.table)
+        file_tmp = f'{file_path}.{os.getpid()}.tmp'
+
+        with open(file_tmp, 'w', encoding='utf-8') as prom_file:
+            prom_file.write(self.to_prometheus())
+
+        os.replace(file_tmp, file_path)
+
+
 class CsvTxtValidator:
     """
     Validation d'un fichier csv ou un txt avec un separateur. La fonction reçoit les colonnes et
@@ -828,6 +3773,7 @@ class CsvTxtValidator:
                             ('montant', ('float', 1, True)),                        <-- float - 1
                             ('qte_vte', ('float', 0, True)),                        <-- int - 0
                             ('test', ('bool', 0, True) ]                            <-- booléen
+                    ou un ValidatorPlan déjà compilé, réutilisable d'un fichier à l'autre
 
         :param del_lines: Tuple des lignes à supprimer, commence à 1, on peut regrouper des
                             lignes consecutives. les regroupements consecutifs se feront dans un
@@ -848,30 +3794,69 @@ class CsvTxtValidator:
                                                                         ordre des colonnes
                                                                         (columns_table)
         :param sep: caractere de separation des lignes du fichier, par defaut -> ;
-        :param sous_total_a_supprimer: un tuple de tuple des noms et position a supprimmer
+        :param sous_total_a_supprimer: un tuple de tuple des position et libellé a supprimmer,
+                                       la position est celle de la colonne dans le fichier,
+                                       commence à 1. La ligne est supprimée si la valeur
+                                       commence par le libellé, sans tenir compte de la casse
                     exemple:
                         ((2, 'Sous Total'), (3, 'Total'))
         :param encoding_e: encoding du fichier reçu
         :param encoding_s: encoding du fichier traité
+        :param batch_size: si renseigné, nombre de lignes par lot pour la validation par lots,
+                           colonne par colonne, des int, float et dates
+        :param cache_size: si renseigné, taille du cache LRU des résultats de validation par
+                           colonne, désactivé de lui même sur les colonnes à forte cardinalité.
+                           Les compteurs sont donnés par self.plan.cache_info()
+        :param workers: si supérieur à 1, nombre de process pour la validation en parallèle
+                        des fichiers de plus de PARALLEL_MIN_SIZE octets, le fichier est
+                        découpé sur des fins d'enregistrements
+        :param time_sleep: pause entre les étapes de validation, None pour TIME_SLEEP
+        :param stats: IntegrationStats à compléter, temps des entêtes, de la projection et de
+                      la validation, lignes lues et rejetées, octets traités
+        :param partial: si True, chargement partiel : toutes les lignes valides sont gardées,
+                        les lignes en erreur sont écrites avec leurs erreurs dans le fichier
+                        error_dir/REJECTS_<fichier>, self.nb_accepted et self.nb_rejected
+                        donnent les compteurs et self.log_rejects les 50 premiers rejets.
+                        Pas de validation en parallèle dans ce mode
+        :param max_error_rate: en chargement partiel, proportion maximum de lignes rejetées,
+                               au delà le fichier est refusé comme en validation complète
         :return: (header ou None), (nom du fichier validé ou lignes d'erreur)
     """
     TIME_SLEEP = 2
+    PARALLEL_MIN_SIZE = 8 * 1024 * 1024
+    ERROR_RATE_MIN_ROWS = 1000
 
     # ==============================================================================================
     def __init__(self, file_to_validate, columns_table, error_dir, desired_columns=(), del_lines=(),
                  sous_total_a_supprimer=(), header_line=0, sep=";", encoding_e='utf-8',
-                 encoding_s='utf-8', errors='replace'):
+                 encoding_s='utf-8', errors='replace', batch_size=0, cache_size=0, workers=0,
+                 time_sleep=None, stats=None, partial=False, max_error_rate=None):
         self.file_to_validate = file_to_validate
-        self.columns_table = columns_table
+        self.plan = columns_table if isinstance(columns_table, ValidatorPlan) \
+            else ValidatorPlan(columns_table, cache_size)
+        self.columns_table = self.plan.columns_table
         self.error_dir = error_dir
         self.desired_columns = desired_columns
         self.del_lines = del_lines
         self.header_line = header_line
         self.sep = sep
         self.sous_total_a_supprimer = sous_total_a_supprimer
+        self.sous_totaux = []
         self.encoding_e = encoding_e
         self.encoding_s = encoding_s
         self.errors = errors
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.workers = workers
+        self.time_sleep = CsvTxtValidator.TIME_SLEEP if time_sleep is None else time_sleep
+        self.stats = IntegrationStats() if stats is None else stats
+        self.partial = partial
+        self.max_error_rate = max_error_rate
+        self.nb_accepted = 0
+        self.nb_rejected = 0
+        self.rejects_file = None
+        self.log_error = None
+        self.log_rejects = None
 
     # ==============================================================================================
     def get_columns_position(self, col_fichier):
@@ -908,31 +3893,42 @@ class CsvTxtValidator:
         return None, error
 
     # ==============================================================================================
-    @property
-    def validation(self):
+    def get_error_file(self):
         """
-        Validation du fichier, reçu en paramètre
-            :return: (None, Erreur) ou (True, fichier)
+        Fonction qui renvoie le nom du fichier et le chemin du fichier d'erreur, en supprimant
+        un éventuel fichier d'erreur précédent
+            :return: (nom du fichier, chemin du fichier d'erreur)
         """
-        base_dir = os.path.dirname(self.file_to_validate)
         base_name = os.path.basename(self.file_to_validate)
         file_name_error = "ERRORS_" + base_name
         csv_file_to_validate_error = os.path.join(self.error_dir, file_name_error)
         delete_file(csv_file_to_validate_error)
 
+        return base_name, csv_file_to_validate_error
+
+    # ==============================================================================================
+    def check_file(self):
+        """
+        Fonction qui vérifie le fichier avant lecture : existence, extension, lignes et sous
+        totaux à supprimer
+            :return: (None, Erreur) ou (True, LinesIntervals des lignes à supprimer)
+        """
         # On vérifie si le fichier existe
         if not os.path.isfile(self.file_to_validate):
             error = f"Le fichier demandé : {self.file_to_validate}\n\tn'existe pas!\n"
             return None, error
 
-        # On vérifie si l'extension est bien .csv ou .txt. Si ce n'est pas le cas on retourne
-        # une erreur
-        ext = os.path.splitext(os.path.basename(self.file_to_validate))[-1]
+        # On vérifie si l'extension est bien .csv ou .txt, éventuellement compressé. Si ce
+        # n'est pas le cas on retourne une erreur
         fichier = os.path.basename(self.file_to_validate)
+        ext = os.path.splitext(strip_compression(fichier))[-1]
 
         if str(ext) not in {'.csv', '.txt'}:
             error = f"Le fichier doit ête un csv ou un txt : {fichier}\n"
-            move_file(self.file_to_validate, csv_file_to_validate_error)
+            return None, error
+
+        if get_compression(fichier) == '.zst' and zstandard is None:
+            error = f"Le module zstandard est nécessaire pour lire le fichier : {fichier}\n"
             return None, error
 
         # On vérifie si self.del_lines est conforme au format attendu
@@ -941,14 +3937,28 @@ class CsvTxtValidator:
         if set_delete_lines is None:
             error = (f"Il y a une erreur dans les lignes à supprimer : {self.del_lines}\n\t"
                      f"elle doivent être de type (0, 2, '4:7')\n")
-            move_file(self.file_to_validate, csv_file_to_validate_error)
             return None, error
 
-        nb_delele_lines = len(set_delete_lines)
+        # On vérifie si self.sous_total_a_supprimer est conforme au format attendu
+        sous_totaux = compile_sous_totaux(self.sous_total_a_supprimer)
 
-        # On vérifie si les colonnes demandées sont dans le fichier
-        table_columns = [r[0] for r in self.columns_table]
+        if sous_totaux is None:
+            error = (f"Il y a une erreur dans les sous totaux à supprimer : "
+                     f"{self.sous_total_a_supprimer}\n\t"
+                     f"ils doivent être de type ((2, 'Sous Total'), (3, 'Total'))\n")
+            return None, error
 
+        self.sous_totaux = sous_totaux
+
+        return True, set_delete_lines
+
+    # ==============================================================================================
+    def get_header(self, open_file):
+        """
+        Fonction qui lit les entêtes du fichier, puis replace le fichier au début
+            :param open_file: fichier ouvert en lecture
+            :return: (dialect, list des colonnes entêtes du fichier)
+        """
         if self.header_line:
             num_line = self.header_line - 1
         else:
@@ -956,27 +3966,33 @@ class CsvTxtValidator:
 
         list_col_file = []
 
-        # lecture des entêtes du fichier
-        with open(self.file_to_validate, 'r', encoding=self.encoding_e, errors=self.errors,
-                  newline='') as open_file:
-            dialect = csv.Sniffer().sniff(open_file.readline())
-            open_file.seek(0)
-            reader = csv.reader(open_file, dialect, delimiter=self.sep)
-
-            for k, ligne in enumerate(reader):
-                if k == num_line:
-                    list_col_file = [
-                        r.strip().replace(' ', '_').replace('\n', '_').replace('\r', '_').lower()
-                        for r in ligne]
-                    break
+        dialect = csv.Sniffer().sniff(open_file.readline())
+        open_file.seek(0)
+        reader = csv.reader(open_file, dialect, delimiter=self.sep)
+
+        for k, ligne in enumerate(reader):
+            if k == num_line:
+                list_col_file = [
+                    r.strip().replace(' ', '_').replace('\n', '_').replace('\r', '_').lower()
+                    for r in ligne]
+                break
+
+        open_file.seek(0)
 
-            nb_columns_file = len(list_col_file)
+        return dialect, list_col_file
+
+    # ==============================================================================================
+    def get_columns(self, list_col_file):
+        """
+        Fonction qui vérifie les colonnes demandées, par rapport aux entêtes du fichier
+            :param list_col_file: colonnes entêtes du fichier
+            :return: (None, Erreur) ou (True, list des positions des colonnes à prendre)
+        """
+        nb_columns_file = len(list_col_file)
 
-        # Vérification des colonnes
         if self.desired_columns:
             if not isinstance(self.desired_columns, (list, tuple, set)):
                 error = "Les colonnes souhaitées doivent être au format : list, tuple ou set\n"
-                move_file(self.file_to_validate, csv_file_to_validate_error)
                 return None, error
 
             if isinstance(self.desired_columns[0], int):
@@ -984,7 +4000,6 @@ class CsvTxtValidator:
 
                 if max_num_column > nb_columns_file:
                     error = f"Le fichier doit avoir au moins {max_num_column}, colonnes\n"
-                    move_file(self.file_to_validate, csv_file_to_validate_error)
                     return None, error
 
                 desired_columns = self.desired_columns
@@ -994,125 +4009,564 @@ class CsvTxtValidator:
 
                 if test is None:
                     error = desired_columns
-                    move_file(self.file_to_validate, csv_file_to_validate_error)
                     return None, error
 
             nb_columns_desired_columns = len(set(desired_columns))
 
             if nb_columns_desired_columns > nb_columns_file:
                 error = f"Le fichier doit avoir au moins {nb_columns_desired_columns}, colonnes\n"
-                move_file(self.file_to_validate, csv_file_to_validate_error)
                 return None, error
 
-            columns = desired_columns
+            return True, desired_columns
 
-        else:
-            nb_columns_table = len(self.columns_table)
+        nb_columns_table = len(self.columns_table)
 
-            if nb_columns_table > nb_columns_file:
-                error = f"Le fichier doit avoir au moins {nb_columns_table}, colonnes\n"
-                move_file(self.file_to_validate, csv_file_to_validate_error)
-                return None, error
+        if nb_columns_table > nb_columns_file:
+            error = f"Le fichier doit avoir au moins {nb_columns_table}, colonnes\n"
+            return None, error
 
-            columns = [k for k in range(nb_columns_table)]
+        return True, [k for k in range(nb_columns_table)]
 
-        # Contrôle des types, de toutes les lignes conformes aux colonnes de la table
-        file_name_to_validate = "TO_VALIDATED_" + base_name
-        csv_to_validate = os.path.join(base_dir, file_name_to_validate)
+    # ==============================================================================================
+    def validate_line(self, lig, columns, n_ligne):
+        """
+        Fonction qui valide une ligne, déjà réduite aux colonnes demandées
+            :param lig: valeurs de la ligne
+            :param columns: positions des colonnes dans le fichier d'origine
+            :param n_ligne: numéro de la ligne, pour le log d'erreurs
+            :return: (list des valeurs validées, list des erreurs [n_ligne, erreur, ...] ou [])
+        """
+        return self.get_line_errors(self.plan.validate(lig), columns, n_ligne)
 
-        csv_params = {
-            'sep': self.sep,
-            'encoding_e': self.encoding_e,
-            'encoding_s': self.encoding_s,
-            'errors': self.errors
-        }
+    # ==============================================================================================
+    @staticmethod
+    def get_line_errors(ligne, columns, n_ligne):
+        """
+        Fonction qui relève les erreurs d'une ligne validée
+            :param ligne: valeurs validées, les erreurs sont des tuples (erreur,)
+            :param columns: positions des colonnes dans le fichier d'origine
+            :param n_ligne: numéro de la ligne, pour le log d'erreurs
+            :return: (list des valeurs validées, list des erreurs [n_ligne, erreur, ...] ou [])
+        """
+        errors = []
 
-        remove_columuns_lines(
-            self.file_to_validate,
-            csv_to_validate,
-            columns,
-            set_delete_lines,
-            **csv_params
-        )
+        for i, val in enumerate(ligne):
+            if isinstance(val, tuple):
+                if not errors:
+                    errors.append(n_ligne)
+                position = columns[i] + 1
+                errors.append(val[0] + f" -- en position {position}")
 
-        time.sleep(CsvTxtValidator.TIME_SLEEP)
-        file_name_validated = "VALIDATED_" + base_name
-        csv_file_validated = os.path.join(base_dir, file_name_validated)
+        return ligne, errors
+
+    # ==============================================================================================
+    def validate_rows(self, rows, columns, n_ligne):
+        """
+        Générateur de validation des lignes, déjà réduites aux colonnes demandées. Si batch_size
+        est renseigné, les lignes sont validées par lots de batch_size lignes, colonne par
+        colonne, sinon ligne à ligne
+            :param rows: itérable des lignes
+            :param columns: positions des colonnes dans le fichier d'origine
+            :param n_ligne: numéro de la première ligne, pour le log d'erreurs
+            :return: générateur des (list des valeurs validées, list des erreurs)
+        """
+        if not self.batch_size:
+            for lig in rows:
+                yield self.validate_line(lig, columns, n_ligne)
+                n_ligne += 1
+            return
+
+        rows = iter(rows)
+        chunk = list(islice(rows, self.batch_size))
+
+        while chunk:
+            for ligne in self.plan.validate_batch(chunk):
+                yield self.get_line_errors(ligne, columns, n_ligne)
+                n_ligne += 1
+
+            chunk = list(islice(rows, self.batch_size))
+
+    # ==============================================================================================
+    @staticmethod
+    def get_log_error(fichier, list_errors, nb_delele_lines):
+        """
+        Fonction qui met en forme le log des erreurs de validation
+            :param fichier: nom du fichier
+            :param list_errors: list des erreurs par ligne [n_ligne, erreur, ...]
+            :param nb_delele_lines: nombre de lignes supprimées
+            :return: log des erreurs
+        """
+        log_error = f"""Erreurs repérées dans le fichier {fichier}\n"""
+
+        for row in list_errors:
+            ligne_en_erreur = row[0] + nb_delele_lines
+            erreurs_de_la_ligne = row[1:]
+            log_error += f"    * ligne {ligne_en_erreur} :\n"
+
+            for erreur_ligne in erreurs_de_la_ligne:
+                log_error += f"            - {erreur_ligne}\n"
+
+        return log_error
 
+    # ==============================================================================================
+    def partial_rows(self, rows, columns, n_ligne, nb_delele_lines):
+        """
+        Générateur du chargement partiel : renvoie les lignes valides et écrit les lignes en
+        erreur, avec leurs valeurs d'origine et leurs erreurs, dans error_dir/REJECTS_<fichier>.
+        Si le taux de lignes rejetées dépasse max_error_rate, passé ERROR_RATE_MIN_ROWS lignes
+        puis en fin de fichier, le log est placé dans self.log_error et plus aucune ligne
+        n'est renvoyée
+            :param rows: itérable des lignes, déjà réduites aux colonnes demandées
+            :param columns: positions des colonnes dans le fichier d'origine
+            :param n_ligne: numéro de la première ligne, pour le log d'erreurs
+            :param nb_delele_lines: nombre de lignes supprimées, pour le log d'erreurs
+            :return: générateur des lignes validées
+        """
+        base_name = strip_compression(os.path.basename(self.file_to_validate))
+        self.rejects_file = os.path.join(self.error_dir, "REJECTS_" + base_name)
+        delete_file(self.rejects_file)
+        self.nb_accepted = 0
+        self.nb_rejected = 0
         list_errors = []
-        error = None
+        raw_rows = deque()
+        rejects = None
 
-        with open(
-                csv_to_validate,
-                'r',
-                encoding=self.encoding_s,
-                errors=self.errors,
-                newline=''
-        ) as open_file:
-            reader = csv.reader(open_file, delimiter=self.sep)
-
-            with open(csv_file_validated, 'w', encoding=self.encoding_s, newline='') as csvfile:
-                csv_write = csv.writer(
-                    csvfile,
-                    delimiter=self.sep,
-                    quotechar='"',
-                    quoting=csv.QUOTE_NONNUMERIC
+        def keep_raw(rows_to_keep):
+            for row in rows_to_keep:
+                raw_rows.append(row)
+                yield row
+
+        def error_rate_exceeded():
+            nb_rows = self.nb_accepted + self.nb_rejected
+            return self.max_error_rate is not None and nb_rows \
+                and self.nb_rejected / nb_rows > self.max_error_rate
+
+        try:
+            for ligne, errors in self.validate_rows(keep_raw(rows), columns, n_ligne):
+                raw = raw_rows.popleft()
+
+                if not errors:
+                    self.nb_accepted += 1
+                    yield ligne
+                    continue
+
+                self.nb_rejected += 1
+
+                if len(list_errors) < 50:
+                    list_errors.append(errors)
+
+                if rejects is None:
+                    rejects = open(self.rejects_file, 'w', encoding=self.encoding_s, newline='')
+                    rejects_writer = csv.writer(rejects, delimiter=self.sep, quotechar='"')
+                    rejects_writer.writerow(
+                        ['ligne'] + [r[0] for r in self.columns_table] + ['erreurs']
+                    )
+
+                rejects_writer.writerow(
+                    [errors[0] + nb_delele_lines]
+                    + list(raw)
+                    + [' | '.join(' '.join(error.split()) for error in errors[1:])]
                 )
 
-                # On vérifie toutes les colonnes. Si l'on trouve une erreur, alors on parcours
-                # le fichier, pour remonter les 50 premières erreurs et les loguées
-                n_ligne = 1 + nb_delele_lines
-                err = 0
-                for lig in reader:
-                    errors = []
-                    ligne = []
-
-                    for i, row in enumerate(self.columns_table):
-                        col, tup = row
-                        val = validate_element(lig[i], col, tup)
-
-                        if isinstance(val, tuple):
-                            if not errors:
-                                errors.append(n_ligne)
-                            position = columns[i] + 1
-                            val = val[0] + f" -- en position {position}"
-                            errors.append(val)
-                            error = True
-
-                        if not list_errors and not errors:
-                            ligne.append(val)
-
-                    if errors:
-                        err += 1
-                        list_errors.append(errors)
-                        if len(list_errors) >= 50:
-                            break
+                if (
+                        self.nb_accepted + self.nb_rejected >= CsvTxtValidator.ERROR_RATE_MIN_ROWS
+                        and error_rate_exceeded()
+                ):
+                    break
 
-                    if not list_errors:
-                        csv_write.writerow(ligne)
+        finally:
+            if rejects is not None:
+                rejects.close()
 
-                    n_ligne += 1
+            self.stats.rows_read += self.nb_accepted + self.nb_rejected
+            self.stats.rows_rejected += self.nb_rejected
 
-        time.sleep(CsvTxtValidator.TIME_SLEEP)
+        if not list_errors:
+            self.rejects_file = None
+            return
 
-        # Si il y a des erreurs on les renvoient
-        if error:
-            log_error = f"""Erreurs repérées dans le fichier {fichier}\n"""
+        log_error = self.get_log_error(base_name, list_errors, nb_delele_lines)
+
+        if error_rate_exceeded():
+            self.log_error = (
+                f"Le fichier {base_name} dépasse le taux de lignes rejetées maximum de "
+                f"{self.max_error_rate:.2%} : {self.nb_rejected} lignes rejetées sur "
+                f"{self.nb_accepted + self.nb_rejected} lues\n{log_error}"
+            )
+
+        else:
+            self.log_rejects = (
+                f"Chargement partiel du fichier {base_name} : {self.nb_accepted} lignes "
+                f"acceptées, {self.nb_rejected} lignes rejetées dans {self.rejects_file}\n"
+                f"{log_error}"
+            )
+
+    # ==============================================================================================
+    def log_validation(self, stage, error=None):
+        """
+        Fonction qui écrit l'enregistrement structuré du résultat de la validation, voir
+        log_event : fichier validé, chargement partiel ou fichier refusé
+            :param stage: étape de la validation, 'check', 'header' ou 'validation'
+            :param error: erreur, si le fichier est refusé
+            :return: None
+        """
+        if error is not None:
+            message, level = "fichier refusé", 'error'
+        elif self.log_rejects is not None:
+            message, level = "chargement partiel", 'warning'
+        else:
+            message, level = "fichier validé", 'info'
+
+        log_event(
+            message,
+            level,
+            file=self.file_to_validate,
+            table=self.stats.table,
+            stage=stage,
+            duration=self.stats.times.get(stage),
+            rows_read=self.stats.rows_read,
+            rows_rejected=self.stats.rows_rejected,
+            rejects_file=self.rejects_file,
+            error=error
+        )
+
+    # ==============================================================================================
+    def get_chunks(self, dialect):
+        """
+        Fonction qui découpe le fichier en self.workers morceaux, pour la validation en
+        parallèle. Le découpage n'est possible que pour un fichier assez gros, dont l'encodage
+        garde le séparateur, les guillemets et les fins de lignes sur un octet ascii
+            :param dialect: dialect csv du fichier, renvoyé par get_header
+            :return: None ou list des (début, fin, numéro du premier enregistrement)
+        """
+        if (
+                os.path.getsize(self.file_to_validate) < CsvTxtValidator.PARALLEL_MIN_SIZE
+                or get_compression(self.file_to_validate) is not None
+                or dialect.escapechar is not None
+                or not is_ascii_compatible(self.encoding_e, self.sep + dialect.quotechar)
+                or not is_ascii_compatible(self.encoding_s, self.sep + '"')
+        ):
+            return None
+
+        # Le dialecte est deviné sur la ligne d'entêtes, sans guillemets doublequote est faux.
+        # Sans doublequote, le découpage à la parité des guillemets ne suit csv.reader que si
+        # le fichier n'a aucun guillemet
+        if not dialect.doublequote and file_contains(
+                self.file_to_validate, dialect.quotechar.encode('ascii')
+        ):
+            return None
+
+        chunks = get_chunks_offsets(self.file_to_validate, self.workers, dialect.quotechar)
+
+        return chunks if len(chunks) > 1 else None
+
+    # ==============================================================================================
+    def validate_parallel(self, chunks, dialect, columns, set_delete_lines, csv_file_validated):
+        """
+        Fonction qui valide les morceaux du fichier dans un pool de process. Chaque morceau est
+        validé dans un fichier partiel, les fichiers partiels sont ensuite réunis dans l'ordre
+        d'origine dans csv_file_validated. Les numéros de lignes et les 50 premières erreurs
+        sont les mêmes que pour la validation séquentielle
+            :param chunks: list des (début, fin, numéro du premier enregistrement)
+            :param dialect: dialect csv du fichier, renvoyé par get_header
+            :param columns: positions des colonnes à prendre
+            :param set_delete_lines: LinesIntervals des lignes à supprimer
+            :param csv_file_validated: fichier validé en sortie
+            :return: list des erreurs [n_ligne, erreur, ...], vide si le fichier est valide
+        """
+        base_dir = os.path.dirname(csv_file_validated)
+        base_name = os.path.basename(csv_file_validated)
+        tasks = [
+            {
+                'file': self.file_to_validate,
+                'start': start,
+                'end': end,
+                'first_record': first_record,
+                'part': os.path.join(base_dir, f"PART_{i}_{base_name}"),
+                'columns_table': self.columns_table,
+                'columns': columns,
+                'set_delete_lines': set_delete_lines,
+                'sous_totaux': self.sous_totaux,
+                'sep': self.sep,
+                'dialect': {
+                    'quotechar': dialect.quotechar,
+                    'doublequote': dialect.doublequote,
+                    'skipinitialspace': dialect.skipinitialspace,
+                },
+                'encoding_e': self.encoding_e,
+                'encoding_s': self.encoding_s,
+                'errors': self.errors,
+                'batch_size': self.batch_size,
+                'cache_size': self.cache_size,
+            }
+            for i, (start, end, first_record) in enumerate(chunks)
+        ]
+
+        nb_delele_lines = len(set_delete_lines)
+        list_errors = []
+        nb_kept = 0
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                for nb_kept_chunk, errors_chunk in executor.map(validate_file_chunk, tasks):
+                    for errors in errors_chunk:
+                        if len(list_errors) < 50:
+                            n_ligne = errors[0] + 1 + nb_delele_lines + nb_kept
+                            list_errors.append([n_ligne] + errors[1:])
+
+                    nb_kept += nb_kept_chunk
+
+            self.stats.rows_read += nb_kept
 
-            for row in list_errors:
-                ligne_en_erreur = row[0] + nb_delele_lines
-                erreurs_de_la_ligne = row[1:]
-                log_error += f"    * ligne {ligne_en_erreur} :\n"
+            if not list_errors:
+                with open(csv_file_validated, 'wb') as csvfile:
+                    for task in tasks:
+                        with open(task['part'], 'rb') as part_file:
+                            shutil.copyfileobj(part_file, csvfile, 1024 * 1024)
 
-                for erreur_ligne in erreurs_de_la_ligne:
-                    log_error += f"            - {erreur_ligne}\n"
+        finally:
+            for task in tasks:
+                delete_file(task['part'])
+
+        return list_errors
+
+    # ==============================================================================================
+    @property
+    def validation(self):
+        """
+        Validation du fichier, reçu en paramètre
+            :return: (None, Erreur) ou (True, fichier)
+        """
+        base_dir = os.path.dirname(self.file_to_validate)
+        base_name, csv_file_to_validate_error = self.get_error_file()
+        fichier = base_name
+
+        test, set_delete_lines = self.check_file()
+
+        if test is None:
+            error = set_delete_lines
+            if os.path.isfile(self.file_to_validate):
+                move_file(self.file_to_validate, csv_file_to_validate_error)
+            self.log_validation('check', error)
+            return None, error
+
+        nb_delele_lines = len(set_delete_lines)
+        self.stats.bytes_processed += os.path.getsize(self.file_to_validate)
+
+        # On vérifie si les colonnes demandées sont dans le fichier
+        table_columns = [r[0] for r in self.columns_table]
+
+        with self.stats.timer('header'):
+            # lecture des entêtes du fichier
+            with open_text_file(self.file_to_validate, self.encoding_e, self.errors) as open_file:
+                dialect, list_col_file = self.get_header(open_file)
+
+            # Vérification des colonnes
+            test, columns = self.get_columns(list_col_file)
+
+        if test is None:
+            error = columns
+            move_file(self.file_to_validate, csv_file_to_validate_error)
+            self.log_validation('header', error)
+            return None, error
+
+        # Contrôle des types, de toutes les lignes conformes aux colonnes de la table, les
+        # fichiers intermédiaires ne sont pas compressés
+        file_name_to_validate = "TO_VALIDATED_" + strip_compression(base_name)
+        csv_to_validate = os.path.join(base_dir, file_name_to_validate)
+        file_name_validated = "VALIDATED_" + strip_compression(base_name)
+        csv_file_validated = os.path.join(base_dir, file_name_validated)
+
+        chunks = self.get_chunks(dialect) if self.workers > 1 and not self.partial else None
+
+        if chunks:
+            with self.stats.timer('validation'):
+                list_errors = self.validate_parallel(
+                    chunks, dialect, columns, set_delete_lines, csv_file_validated
+                )
+
+        else:
+            csv_params = {
+                'sep': self.sep,
+                'encoding_e': self.encoding_e,
+                'encoding_s': self.encoding_s,
+                'errors': self.errors
+            }
+
+            with self.stats.timer('projection'):
+                remove_columuns_lines(
+                    self.file_to_validate,
+                    csv_to_validate,
+                    columns,
+                    set_delete_lines,
+                    self.sous_totaux,
+                    **csv_params
+                )
+
+            time.sleep(self.time_sleep)
+
+            list_errors = []
+            nb_rows = 0
+
+            with self.stats.timer('validation'), open(
+                    csv_to_validate,
+                    'r',
+                    encoding=self.encoding_s,
+                    errors=self.errors,
+                    newline=''
+            ) as open_file:
+                reader = csv.reader(open_file, delimiter=self.sep)
+
+                with open(
+                        csv_file_validated, 'w', encoding=self.encoding_s, newline=''
+                ) as csvfile:
+                    csv_write = csv.writer(
+                        csvfile,
+                        delimiter=self.sep,
+                        quotechar='"',
+                        quoting=csv.QUOTE_NONNUMERIC
+                    )
+
+                    if self.partial:
+                        # Chargement partiel, les lignes en erreur vont dans le fichier des
+                        # rejets
+                        for ligne in self.partial_rows(
+                                reader, columns, 1 + nb_delele_lines, nb_delele_lines
+                        ):
+                            csv_write.writerow(ligne)
+
+                    else:
+                        # On vérifie toutes les colonnes. Si l'on trouve une erreur, alors on
+                        # parcours le fichier, pour remonter les 50 premières erreurs et les
+                        # loguées
+                        for ligne, errors in self.validate_rows(
+                                reader, columns, 1 + nb_delele_lines
+                        ):
+                            nb_rows += 1
+
+                            if errors:
+                                list_errors.append(errors)
+                                if len(list_errors) >= 50:
+                                    break
+
+                            if not list_errors:
+                                csv_write.writerow(ligne)
+
+            self.stats.rows_read += nb_rows
+            time.sleep(self.time_sleep)
+
+        # Si il y a des erreurs on les renvoient
+        self.stats.rows_rejected += len(list_errors)
+
+        if list_errors or self.log_error is not None:
+            log_error = self.log_error or self.get_log_error(
+                fichier, list_errors, nb_delele_lines
+            )
             move_file(self.file_to_validate, csv_file_to_validate_error)
             delete_file(csv_to_validate)
             delete_file(csv_file_validated)
+            self.log_validation('validation', log_error)
 
             return None, log_error
 
         delete_file(csv_to_validate)
         delete_file(self.file_to_validate)
+        self.log_validation('validation')
 
         return table_columns, csv_file_validated
+
+    # ==============================================================================================
+    def iter_validation(self):
+        """
+        Générateur de validation du fichier en une seule passe, sans fichiers intermédiaires :
+        suppression des lignes, réduction aux colonnes demandées et contrôle des types, ligne à
+        ligne. Les lignes validées sont renvoyées au fil de la lecture, pour être chargées
+        directement, par execute_copy_upsert ou execute_prepared_upsert.
+
+        Dès la première erreur, plus aucune ligne n'est renvoyée et le fichier est parcouru pour
+        remonter les 50 premières erreurs. Le log est alors placé dans self.log_error, le
+        fichier est déplacé dans error_dir et CsvValidationError est levée, ce qui annule la
+        transaction du chargement en cours.
+
+        En chargement partiel (partial=True), toutes les lignes valides sont renvoyées et les
+        lignes en erreur vont dans le fichier des rejets, voir partial_rows. CsvValidationError
+        n'est alors levée que si le taux de lignes rejetées dépasse max_error_rate.
+
+        Le fichier d'origine n'est pas supprimé, c'est à l'appelant de le faire une fois le
+        chargement validé.
+            :return: générateur des lignes validées
+        """
+        self.log_error = None
+        self.log_rejects = None
+        base_name, csv_file_to_validate_error = self.get_error_file()
+
+        test, set_delete_lines = self.check_file()
+
+        if test is None:
+            self.log_error = set_delete_lines
+            if os.path.isfile(self.file_to_validate):
+                move_file(self.file_to_validate, csv_file_to_validate_error)
+            self.log_validation('check', self.log_error)
+            raise CsvValidationError(self.log_error)
+
+        nb_delele_lines = len(set_delete_lines)
+        self.stats.bytes_processed += os.path.getsize(self.file_to_validate)
+        list_errors = []
+
+        with open_text_file(self.file_to_validate, self.encoding_e, self.errors) as open_file:
+            with self.stats.timer('header'):
+                dialect, list_col_file = self.get_header(open_file)
+                test, columns = self.get_columns(list_col_file)
+
+            if test is None:
+                self.log_error = columns
+
+            else:
+                rows = iter_projected_rows(
+                    open_file,
+                    columns,
+                    set_delete_lines,
+                    sous_totaux=self.sous_totaux,
+                    dialect=dialect,
+                    delimiter=self.sep
+                )
+
+                # Le temps passé hors du générateur, au chargement des lignes, n'est pas compté
+                nb_rows = 0
+                start = time.perf_counter()
+
+                if self.partial:
+                    for ligne in self.partial_rows(
+                            rows, columns, 1 + nb_delele_lines, nb_delele_lines
+                    ):
+                        self.stats.times['validation'] += time.perf_counter() - start
+                        yield ligne
+                        start = time.perf_counter()
+
+                else:
+                    for ligne, errors in self.validate_rows(rows, columns, 1 + nb_delele_lines):
+                        nb_rows += 1
+
+                        if errors:
+                            list_errors.append(errors)
+                            if len(list_errors) >= 50:
+                                break
+
+                        elif not list_errors:
+                            self.stats.times['validation'] += time.perf_counter() - start
+                            yield ligne
+                            start = time.perf_counter()
+
+                self.stats.times['validation'] += time.perf_counter() - start
+                self.stats.rows_read += nb_rows
+                self.stats.rows_rejected += len(list_errors)
+
+        if list_errors:
+            self.log_error = self.get_log_error(base_name, list_errors, nb_delele_lines)
+
+        if self.log_error is not None:
+            move_file(self.file_to_validate, csv_file_to_validate_error)
+            self.log_validation('header' if test is None else 'validation', self.log_error)
+            raise CsvValidationError(self.log_error)
+
+        self.log_validation('validation')
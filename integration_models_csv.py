@@ -1,24 +1,38 @@
 """
 Module générique d'intégration de fichier sur un modèle
 """
+import os
 import sys
 import csv
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime as dt
 import time
 
 from functions import (
     cnx_postgresql,
+    get_pool_postgresql,
     execute_prepared_upsert,
+    execute_copy_upsert,
+    execute_chunked_upsert,
+    execute_parallel_upsert,
+    UpsertCheckpoint,
     GetModel,
     delete_file,
     list_file,
-    CsvTxtValidator
+    CsvTxtValidator,
+    IntegrationStats,
+    envoi_mail_erreur,
+    write_log,
+    LOG_FILE
 )
 
 TIME_SLEEP = 2
 
 
-def integration_file_csv(kwargs_cnx, kwargs_file, kwargs_modele, kwargs_validate, kwargs_upsert):
+def integration_file_csv(
+        kwargs_cnx, kwargs_file, kwargs_modele, kwargs_validate, kwargs_upsert, stream=None,
+        file_csv=None, time_sleep=None, stats=None
+):
     """
     Intégration génerique de fichiers csv en base de données pour un modèle Django
               :param kwargs_cnx: Paramètres pour string_connection
@@ -27,7 +41,8 @@ def integration_file_csv(kwargs_cnx, kwargs_file, kwargs_modele, kwargs_validate
                                         USER_DATABASE,
                                         PASSWORD_DATABASE,
                                         HOST_DATABASE,
-                                        PORT_DATABASE
+                                        PORT_DATABASE,
+                                        POOL_DATABASE=None ou (minconn, maxconn)
                                     }
              :param kwargs_file: Paramètres pour list_file(**kwargs_file)
                                     kwargs_file = {
@@ -53,18 +68,70 @@ def integration_file_csv(kwargs_cnx, kwargs_file, kwargs_modele, kwargs_validate
                                         sep=";",
                                         encoding_e='utf-8',
                                         encoding_s='utf-8',
-                                        errors='replace'
+                                        errors='replace',
+                                        batch_size=0,
+                                        cache_size=0,
+                                        workers=0,
+                                        partial=False,
+                                        max_error_rate=None
                                     }
+                               si partial=True, les lignes valides sont chargées et les lignes
+                               en erreur écrites dans error_dir/REJECTS_<fichier>, les rejets
+                               sont envoyés par mail. Au delà de max_error_rate lignes rejetées
+                               le fichier est refusé
          :param kwargs_upsert: Paramètres pour execute_prepared_upsert(kwargs_upsert)
+                               ou execute_copy_upsert(kwargs_upsert) si copy=True
                                     kwargs_upsert = {
                                         champs_unique=('test', ),
-                                        upsert=True
+                                        upsert=True,
+                                        copy=None ou True ou 'binary',
+                                        skip_unchanged=None,
+                                        commit_every=None,
+                                        checkpoint_dir=None,
+                                        workers=None
                                     }
-        :return: None ou True, "success"
+                               si commit_every est renseigné, un commit est fait toutes les
+                               commit_every lignes (execute_chunked_upsert). En stream, avec
+                               checkpoint_dir, un point de reprise CHECKPOINT_<fichier>.json
+                               permet à une intégration relancée de reprendre après les lignes
+                               déjà committées. En stream, une erreur de validation laisse en
+                               base les morceaux déjà committés.
+                               Si workers est renseigné, les lignes sont réparties par hash des
+                               champs_unique et chargées sur workers connexions en parallèle
+                               (execute_parallel_upsert), prises dans le pool du process,
+                               agrandi à workers + 1 connexions si besoin. Le fichier est
+                               chargé entièrement ou pas du tout, commit_every n'est pas utilisé
+                  :param stream: si True, la validation et le chargement se font en une seule
+                                 passe, par CsvTxtValidator.iter_validation, sans fichiers
+                                 intermédiaires TO_VALIDATED_ et VALIDATED_
+                :param file_csv: fichier à intégrer, si None le premier fichier de
+                                 list_file(**kwargs_file)
+              :param time_sleep: pause en fin d'intégration et entre les étapes de validation,
+                                 None pour TIME_SLEEP et CsvTxtValidator.TIME_SLEEP
+                   :param stats: IntegrationStats remplie au fil de l'intégration : temps de
+                                 connexion, de lecture du schéma, des entêtes, de la projection,
+                                 de la validation et de l'upsert, lignes lues et rejetées,
+                                 octets traités et lignes/s. En stream, la projection est
+                                 comptée dans la validation. Si stats.prometheus_file est
+                                 renseigné, le fichier Prometheus est écrit en fin d'intégration.
+                                 Les temps et compteurs sont aussi écrits dans LOG_FILE_JSON
+        :return: (None, log) en cas d'erreur, le log étant aussi écrit dans LOG_FILE et envoyé
+                 par mail, ou (True, "success")
     """
     csv_valid = ""
+    counts = None
+    postgres_cnx = None
+    pool = None
+    stats = IntegrationStats() if stats is None else stats
+    start = time.perf_counter()
+    kwargs_validate = dict(kwargs_validate, stats=stats)
+
+    if time_sleep is not None:
+        kwargs_validate['time_sleep'] = time_sleep
 
     try:
+        stats.table = GetModel(None, **kwargs_modele).get_model_table_name()
+
         # On se connecte à postgresql
         cnx_string = (
             f"dbname={kwargs_cnx['NAME_DATABASE']} "
@@ -74,7 +141,12 @@ def integration_file_csv(kwargs_cnx, kwargs_file, kwargs_modele, kwargs_validate
             f"port={kwargs_cnx['PORT_DATABASE']}"
         )
 
-        postgres_cnx = cnx_postgresql(cnx_string)
+        with stats.timer('connect'):
+            # Si POOL_DATABASE est renseigné, la connexion est prise dans le pool du process
+            if kwargs_cnx.get('POOL_DATABASE'):
+                pool = get_pool_postgresql(cnx_string, *kwargs_cnx['POOL_DATABASE'])
+
+            postgres_cnx = cnx_postgresql(cnx_string, pool)
 
         # On verifie si on a la connexion à postgresql
         if postgres_cnx is None:
@@ -86,7 +158,8 @@ def integration_file_csv(kwargs_cnx, kwargs_file, kwargs_modele, kwargs_validate
             return None, log_line
 
         # On récupère le fichier
-        file_csv = list_file(**kwargs_file)[0]
+        if file_csv is None:
+            file_csv = list_file(**kwargs_file)[0]
 
         if file_csv is None:
             log_line = (
@@ -97,48 +170,201 @@ def integration_file_csv(kwargs_cnx, kwargs_file, kwargs_modele, kwargs_validate
             write_log(LOG_FILE, log_line)
             return None, log_line
 
-        # Lancement validation du csv
-        model_def = GetModel(postgres_cnx, **kwargs_modele)
-        table, champs_type = model_def.get_champs_types()
-        colonnes, csv_valid = CsvTxtValidator(
-            file_csv,
-            champs_type,
-            **kwargs_validate
-        ).validation
-
-        # On verifie si le fichier n'est pas valide
-        if colonnes is None:
-            envoi_mail_erreur(csv_valid)
-            log_line = csv_valid
-            write_log(LOG_FILE, log_line)
-            return None, log_line
+        stats.file = file_csv
 
+        # Lancement validation du csv
+        with stats.timer('schema'):
+            model_def = GetModel(postgres_cnx, **kwargs_modele)
+            table, champs_type = model_def.get_champs_types()
         champs = [r[0] for r in champs_type]
+        upsert = execute_copy_upsert if kwargs_upsert.get('copy') else execute_prepared_upsert
+        kwargs_upsert['cnx'] = postgres_cnx
+        kwargs_upsert['table'] = table
+        kwargs_upsert['champs'] = champs
+
+        if kwargs_upsert.get('commit_every'):
+            upsert = execute_chunked_upsert
+
+            # En stream le fichier d'origine reste en place jusqu'à la fin du chargement, une
+            # intégration relancée peut donc reprendre sur le même fichier
+            if stream and kwargs_upsert.get('checkpoint_dir'):
+                kwargs_upsert['checkpoint'] = UpsertCheckpoint(
+                    os.path.join(
+                        kwargs_upsert['checkpoint_dir'],
+                        f"CHECKPOINT_{os.path.basename(file_csv)}.json"
+                    ),
+                    file_csv
+                )
+
+        if kwargs_upsert.get('workers'):
+            upsert = execute_parallel_upsert
+            kwargs_upsert['pool'] = get_pool_postgresql(
+                cnx_string, 1, kwargs_upsert['workers'] + 1
+            )
 
-        # On lance la mise à jour depuis le csv vérifié
-        with open(csv_valid, newline='', encoding='utf-8', errors='replace') as csvfile:
-            file_reader = csv.reader(csvfile, delimiter=';')
-            kwargs_upsert['cnx'] = postgres_cnx
-            kwargs_upsert['table'] = table
-            kwargs_upsert['champs'] = champs
-            kwargs_upsert['rows'] = file_reader
-            execute_prepared_upsert(kwargs_upsert)
+            # Les connexions des partitions sont prises dans le même pool, la connexion de
+            # l'intégration est rendue avant, pour ne pas bloquer un chargement simultané
+            if pool is not None:
+                pool.putconn(postgres_cnx)
+                postgres_cnx = None
+                kwargs_upsert['cnx'] = None
+
+        if stream:
+            # Validation et mise à jour en une seule passe, la transaction est annulée si le
+            # fichier n'est pas valide
+            validator = CsvTxtValidator(file_csv, champs_type, **kwargs_validate)
+            kwargs_upsert['rows'] = validator.iter_validation()
+
+            try:
+                with stats.timer('upsert', exclude=('header', 'validation')):
+                    counts = upsert(kwargs_upsert)
+
+            except Exception:
+                if validator.log_error is None:
+                    raise
+
+                envoi_mail_erreur(validator.log_error)
+                log_line = validator.log_error
+                write_log(LOG_FILE, log_line)
+                return None, log_line
+
+            delete_file(file_csv)
+
+        else:
+            validator = CsvTxtValidator(file_csv, champs_type, **kwargs_validate)
+            colonnes, csv_valid = validator.validation
+
+            # On verifie si le fichier n'est pas valide
+            if colonnes is None:
+                envoi_mail_erreur(csv_valid)
+                log_line = csv_valid
+                write_log(LOG_FILE, log_line)
+                return None, log_line
+
+            # On lance la mise à jour depuis le csv vérifié
+            with open(csv_valid, newline='', encoding='utf-8', errors='replace') as csvfile:
+                file_reader = csv.reader(csvfile, delimiter=';')
+                kwargs_upsert['rows'] = file_reader
+
+                with stats.timer('upsert'):
+                    counts = upsert(kwargs_upsert)
 
         ligne = (
             f'{dt.now().isoformat()} | integration_file_csv : le modèle '
             f'{kwargs_modele["modele"].__name__} '
-            f'a été mis à jour\n'
+            f'a été mis à jour'
         )
-        write_log(LOG_FILE, ligne)
+
+        stats.success = True
+        stats.counts = counts
+
+        # Chargement partiel, les lignes rejetées sont signalées
+        if validator.log_rejects is not None:
+            envoi_mail_erreur(validator.log_rejects)
+            write_log(LOG_FILE, validator.log_rejects)
+
+        if counts is not None:
+            ligne += (
+                f' ({counts["inserted"]} insérées, {counts["updated"]} mises à jour, '
+                f'{counts["skipped"]} inchangées)'
+            )
+
+        write_log(LOG_FILE, f'{ligne}\n')
 
     except:
         ligne = f'{dt.now().isoformat()} | integration_file_csv : ' \
                 f'{csv_valid}\n\t\t{sys.exc_info()[1]}\n'
         write_log(LOG_FILE, ligne)
         envoi_mail_erreur(ligne)
+        return None, ligne
 
     finally:
+        if pool is not None and postgres_cnx is not None:
+            pool.putconn(postgres_cnx)
+
         delete_file(csv_valid)
-        time.sleep(TIME_SLEEP)
+        stats.elapsed = time.perf_counter() - start
+
+        if stats.success is None:
+            stats.success = False
+
+        stats.log_events('integration_file_csv')
+
+        if stats.prometheus_file:
+            try:
+                stats.write_prometheus()
+            except OSError:
+                write_log(
+                    LOG_FILE,
+                    f'{dt.now().isoformat()} | integration_file_csv : {stats.prometheus_file}'
+                    f'\n\t\t{sys.exc_info()[1]}\n'
+                )
+
+        time.sleep(TIME_SLEEP if time_sleep is None else time_sleep)
 
     return True, "success"
+
+
+def integration_files_csv(list_kwargs, max_workers=4, stream=None, time_sleep=0):
+    """
+    Intégration de tous les fichiers présents dans les répertoires, avec un pool de max_workers
+    intégrations simultanées. Les fichiers d'une même table sont intégrés l'un après l'autre,
+    dans l'ordre des noms de fichiers, les tables différentes sont intégrées en parallèle.
+    Un fichier trouvé par plusieurs modèles n'est intégré que par le premier de list_kwargs.
+        :param list_kwargs: list des paramètres de integration_file_csv, un dict par modèle
+                                list_kwargs = [
+                                    {
+                                        kwargs_cnx,
+                                        kwargs_file,
+                                        kwargs_modele,
+                                        kwargs_validate,
+                                        kwargs_upsert
+                                    },
+                                    ...
+                                ]
+        :param max_workers: nombre maximum d'intégrations simultanées
+        :param stream: voir integration_file_csv
+        :param time_sleep: voir integration_file_csv, par défaut pas de pause entre les fichiers
+        :return: dict {fichier: (None ou True, log ou "success")}
+    """
+    tables = {}
+    known = set()
+
+    for kwargs in list_kwargs:
+        table = GetModel(None, **kwargs['kwargs_modele']).get_model_table_name()
+        kwargs_file = {
+            k: v for k, v in kwargs['kwargs_file'].items()
+            if k in {'path', 'extension', 'name_part'}
+        }
+
+        for file_csv in list_file(**kwargs_file) or []:
+            if file_csv in known:
+                continue
+
+            known.add(file_csv)
+            tables.setdefault(table, []).append((os.path.basename(file_csv), file_csv, kwargs))
+
+    def integration_table(files):
+        results = {}
+
+        for _, file_csv, kwargs in sorted(files, key=lambda r: r[:2]):
+            results[file_csv] = integration_file_csv(
+                kwargs['kwargs_cnx'],
+                kwargs['kwargs_file'],
+                kwargs['kwargs_modele'],
+                kwargs['kwargs_validate'],
+                dict(kwargs['kwargs_upsert']),
+                stream=stream,
+                file_csv=file_csv,
+                time_sleep=time_sleep
+            )
+
+        return results
+
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for results_table in executor.map(integration_table, tables.values()):
+            results.update(results_table)
+
+    return results
@@ -0,0 +1,31 @@
+"""
+Configuration des tests : les logs sont écrits dans le répertoire temporaire du test et aucun
+mail n'est envoyé
+"""
+import sys
+
+import pytest
+
+LOG_FILES = ('LOG_FILE', 'LOG_FILE_DIVERS', 'LOG_FILE_JSON')
+MODULES = ('functions', 'integration_models_csv', 'async_integration', 'watch_integration')
+
+
+@pytest.fixture(autouse=True)
+def isolate_logs(tmp_path, monkeypatch):
+    for name in MODULES:
+        module = sys.modules.get(name)
+
+        if module is None:
+            continue
+
+        for log_file in LOG_FILES:
+            if hasattr(module, log_file):
+                monkeypatch.setattr(module, log_file, str(tmp_path / f'{log_file.lower()}.log'))
+
+        if hasattr(module, 'MAIL_DISPATCHER'):
+            monkeypatch.setattr(module.MAIL_DISPATCHER, 'send', lambda *args, **kwargs: None)
+
+    yield
+
+    if 'functions' in sys.modules:
+        sys.modules['functions'].close_log_writers()
@@ -0,0 +1,119 @@
+"""
+Tests de la conversion des lignes et de la file producteur / chargeur de async_integration
+"""
+import asyncio
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from async_integration import get_record_converter, load_batches, produce_batches
+
+
+class FakeTransaction:
+    def __init__(self, cnx):
+        self.cnx = cnx
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.cnx.state = 'commit' if exc_type is None else 'rollback'
+        return False
+
+
+class FakeStats:
+    def timer(self, name):
+        return FakeTimer()
+
+
+class FakeTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+class FakeAsyncCnx:
+    def __init__(self):
+        self.state = None
+        self.records = []
+        self.queries = []
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    async def execute(self, query):
+        self.queries.append(query)
+
+    async def copy_records_to_table(self, table, records, columns):
+        self.records.extend(records)
+
+
+KWARGS_UPSERT = {
+    'table': 'foo',
+    'champs': ['id', 'prix', 'nom'],
+    'champs_unique': ('id',),
+    'upsert': True,
+}
+
+
+def test_record_converter():
+    types_champs = {
+        'id': ('integer', 0, 'NO'),
+        'prix': ('numeric', 14, 'YES'),
+        'nom': ('character varying', 30, 'YES'),
+    }
+    convert = get_record_converter(types_champs, ['id', 'prix', 'nom'])
+
+    assert convert([1, 1.1, 'a']) == (1, Decimal('1.1'), 'a')
+    assert convert([2, '<NULL>', None]) == (2, None, None)
+    assert convert([3, 2, '<NULL>']) == (3, Decimal('2'), None)
+
+
+def run_pipeline(rows, batch_size=2):
+    async def pipeline():
+        queue = asyncio.Queue(maxsize=2)
+        cnx = FakeAsyncCnx()
+        producer = asyncio.ensure_future(produce_batches(rows, queue, batch_size, tuple))
+
+        try:
+            return cnx, await load_batches(cnx, queue, KWARGS_UPSERT, FakeStats())
+        finally:
+            await producer
+
+    return asyncio.run(pipeline())
+
+
+def test_pipeline_loads_all_batches():
+    rows = [[i, i, str(i)] for i in range(5)]
+    cnx, counts = run_pipeline(rows)
+
+    assert counts is None
+    assert cnx.state == 'commit'
+    assert cnx.records == [tuple(row) for row in rows]
+    assert any('INSERT INTO "foo"' in query for query in cnx.queries)
+
+
+def test_pipeline_producer_error_rolls_back():
+    def rows():
+        yield [1, 1, 'a']
+        raise ValueError("ligne invalide")
+
+    async def pipeline():
+        queue = asyncio.Queue(maxsize=2)
+        cnx = FakeAsyncCnx()
+        producer = asyncio.ensure_future(produce_batches(rows(), queue, 1, tuple))
+
+        with pytest.raises(ValueError):
+            await load_batches(cnx, queue, KWARGS_UPSERT, FakeStats())
+
+        await producer
+        return cnx
+
+    cnx = asyncio.run(pipeline())
+
+    assert cnx.state == 'rollback'
+    assert not any('INSERT INTO "foo"' in query for query in cnx.queries)
@@ -0,0 +1,109 @@
+"""
+Tests des encodeurs COPY BINARY, comparés aux octets envoyés par PostgreSQL (numeric_send,
+date_send, timestamp_send), sans base de données
+"""
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from functions import (
+    BINARY_ENCODERS,
+    BinaryIteratorFile,
+    encode_binary_date,
+    encode_binary_numeric,
+    encode_binary_timestamp,
+)
+
+
+def numeric(ndigits, weight, sign, dscale, *digits):
+    """
+    Octets attendus d'un numeric : longueur, puis les champs de numeric_send en hexadécimal
+    """
+    body = f'{ndigits:04x}{weight & 0xFFFF:04x}{sign:04x}{dscale:04x}'
+    body += ''.join(f'{digit:04x}' for digit in digits)
+
+    return bytes.fromhex(f'{len(body) // 2:08x}{body}')
+
+
+@pytest.mark.parametrize('value, expected', [
+    (0, numeric(0, 0, 0, 0)),
+    ('0.00', numeric(0, 0, 0, 2)),
+    (Decimal('-0'), numeric(0, 0, 0, 0)),
+    ('12.5', numeric(2, 0, 0, 1, 12, 5000)),
+    (12.5, numeric(2, 0, 0, 1, 12, 5000)),
+    ('-12.5', numeric(2, 0, 0x4000, 1, 12, 5000)),
+    ('0.0001', numeric(1, -1, 0, 4, 1)),
+    ('-0.5', numeric(1, -1, 0x4000, 1, 5000)),
+    (0.1, numeric(1, -1, 0, 1, 1000)),
+    (10000, numeric(1, 1, 0, 0, 1)),
+    ('123456789012', numeric(3, 2, 0, 0, 1234, 5678, 9012)),
+    (-98765432109876543210, numeric(5, 4, 0x4000, 0, 9876, 5432, 1098, 7654, 3210)),
+    ('1.00000001', numeric(3, 0, 0, 8, 1, 0, 1)),
+    ('NaN', numeric(0, 0, 0xC000, 0)),
+])
+def test_encode_binary_numeric(value, expected):
+    assert encode_binary_numeric(value) == expected
+
+
+def test_encode_binary_numeric_infinite():
+    with pytest.raises(ValueError):
+        encode_binary_numeric('Infinity')
+
+
+@pytest.mark.parametrize('value, expected', [
+    (date(2000, 1, 1), '00000004' '00000000'),
+    (date(2000, 1, 2), '00000004' '00000001'),
+    (date(1999, 12, 31), '00000004' 'ffffffff'),
+    ('2001-01-01', '00000004' '0000016e'),
+    (datetime(2000, 1, 3, 12, 0), '00000004' '00000002'),
+])
+def test_encode_binary_date(value, expected):
+    assert encode_binary_date(value) == bytes.fromhex(expected)
+
+
+@pytest.mark.parametrize('value, expected', [
+    (datetime(2000, 1, 1), '00000008' '0000000000000000'),
+    ('2000-01-01 00:00:01', '00000008' '00000000000f4240'),
+    (datetime(1999, 12, 31, 23, 59, 59, 999999), '00000008' 'ffffffffffffffff'),
+    (date(2000, 1, 2), '00000008' '000000141dd76000'),
+])
+def test_encode_binary_timestamp(value, expected):
+    assert encode_binary_timestamp(value) == bytes.fromhex(expected)
+
+
+@pytest.mark.parametrize('type_champ, value, expected', [
+    ('smallint', '-2', '00000002' 'fffe'),
+    ('integer', 7, '00000004' '00000007'),
+    ('bigint', -1, '00000008' 'ffffffffffffffff'),
+    ('boolean', 't', '00000001' '01'),
+    ('boolean', 'false', '00000001' '00'),
+    ('double precision', 1.5, '00000008' '3ff8000000000000'),
+])
+def test_binary_encoders(type_champ, value, expected):
+    assert BINARY_ENCODERS[type_champ](value) == bytes.fromhex(expected)
+
+
+def test_binary_iterator_file():
+    encoders = [BINARY_ENCODERS['integer'], encode_binary_numeric]
+    rows = [(1, '12.5'), (2, None), (3, '<NULL>')]
+    expected = (
+        b'PGCOPY\n\xff\r\n\x00' + bytes.fromhex('00000000' '00000000')
+        + bytes.fromhex('0002' '00000004' '00000001') + numeric(2, 0, 0, 1, 12, 5000)
+        + bytes.fromhex('0002' '00000004' '00000002' 'ffffffff')
+        + bytes.fromhex('0002' '00000004' '00000003' 'ffffffff')
+        + bytes.fromhex('ffff')
+    )
+
+    assert BinaryIteratorFile(rows, encoders).read() == expected
+
+    chunks = []
+    stream = BinaryIteratorFile(rows, encoders)
+
+    for data in iter(lambda: stream.read(5), b''):
+        assert len(data) <= 5
+        chunks.append(data)
+
+    assert b''.join(chunks) == expected
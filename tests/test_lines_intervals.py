@@ -0,0 +1,130 @@
+"""
+Tests des lignes à supprimer (LinesIntervals, setting_delete_lines) et des sous totaux
+"""
+import random
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from functions import CsvTxtValidator, LinesIntervals, compile_sous_totaux, setting_delete_lines
+
+
+def old_setting_delete_lines(del_lines, header_line):
+    """
+    Ensemble des numéros de lignes, comme l'ancien setting_delete_lines
+    """
+    lines = set()
+
+    for line in del_lines:
+        if isinstance(line, int):
+            lines.add(line - 1)
+        else:
+            b_inf, b_sup = line.split(':')
+            lines.update(n - 1 for n in range(int(b_inf), int(b_sup) + 1))
+
+    if header_line:
+        lines.add(header_line - 1)
+
+    return lines
+
+
+def test_unsorted_and_overlapping_intervals_are_merged():
+    lines = LinesIntervals([(10, 20), (0, 2), (15, 30), (2, 4), (40, 40), (50, 45)])
+
+    assert repr(lines) == "LinesIntervals([(0, 4), (10, 30)])"
+    assert len(lines) == 24
+    assert [n for n in range(60) if n in lines] == list(range(0, 4)) + list(range(10, 30))
+
+
+def test_decreasing_queries_use_bisect():
+    lines = LinesIntervals([(0, 2), (5, 8), (20, 25)])
+
+    assert 22 in lines
+    assert lines.cursor == 2
+    assert 6 in lines
+    assert 3 not in lines
+    assert 0 in lines
+    assert 24 in lines
+    assert 25 not in lines
+
+
+def test_empty_intervals():
+    lines = LinesIntervals()
+
+    assert not lines
+    assert len(lines) == 0
+    assert 0 not in lines
+
+
+def test_setting_delete_lines_matches_old_set():
+    rnd = random.Random(0)
+
+    for _ in range(300):
+        del_lines = []
+
+        for _ in range(rnd.randint(0, 5)):
+            if rnd.random() < 0.5:
+                del_lines.append(rnd.randint(1, 40))
+            else:
+                start = rnd.randint(1, 40)
+                del_lines.append(f'{start}:{start + rnd.randint(-3, 10)}')
+
+        header_line = rnd.randint(0, 3)
+        expected = old_setting_delete_lines(del_lines, header_line)
+        lines = setting_delete_lines(del_lines, header_line)
+
+        assert len(lines) == len(expected)
+        assert {n for n in range(-5, 60) if n in lines} == expected
+        assert [n for n in range(60, -5, -1) if n in lines] == sorted(expected, reverse=True)
+
+
+def test_setting_delete_lines_formats():
+    assert setting_delete_lines(('5',), 0) is None
+    assert setting_delete_lines(('a:4',), 0) is None
+    assert setting_delete_lines((1.5,), 0) is None
+    assert not setting_delete_lines(('7:4',), 0)
+    assert repr(setting_delete_lines(('7:4',), 1)) == "LinesIntervals([(0, 1)])"
+    assert repr(setting_delete_lines((1, 2, '4:7'), 0)) == "LinesIntervals([(0, 2), (3, 7)])"
+
+
+def test_compile_sous_totaux():
+    assert compile_sous_totaux(((2, ' Sous Total '), (3, 'Total'))) == [
+        (1, 'sous total'), (2, 'total')
+    ]
+    assert compile_sous_totaux(((0, 'Total'),)) is None
+    assert compile_sous_totaux(((2, ''),)) is None
+    assert compile_sous_totaux(('Total',)) is None
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_sous_totaux_are_removed(tmp_path, stream):
+    file_csv = tmp_path / 'fichier.csv'
+    file_csv.write_text(
+        'id;nom\n'
+        '1;a\n'
+        '2;b\n'
+        ';Sous total groupe 1\n'
+        '3;c\n'
+        ';  TOTAL GENERAL\n',
+        encoding='utf-8'
+    )
+    validator = CsvTxtValidator(
+        str(file_csv),
+        [('id', (0, True, 'validate_int')), ('nom', (30, True, 'validate_str'))],
+        error_dir=str(tmp_path),
+        header_line=1,
+        sous_total_a_supprimer=((2, 'Sous total'), (2, 'Total')),
+        time_sleep=0
+    )
+
+    if stream:
+        rows = list(validator.iter_validation())
+    else:
+        colonnes, csv_valid = validator.validation
+        assert colonnes is not None
+
+        with open(csv_valid, encoding='utf-8') as validated:
+            rows = [line.rstrip('\n').split(';') for line in validated]
+
+    assert [str(row[1]).strip('"') for row in rows] == ['a', 'b', 'c']
@@ -0,0 +1,136 @@
+"""
+Tests de MailDispatcher sur un serveur SMTP local minimal
+"""
+import email
+import socketserver
+import threading
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import functions
+from functions import MailDispatcher
+
+
+class SmtpHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.connexions += 1
+        self.reply('220 localhost')
+        data = None
+
+        for line in self.rfile:
+            line = line.decode().rstrip('\r\n')
+
+            if data is not None:
+                if line == '.':
+                    self.server.messages.append('\n'.join(data))
+                    data = None
+                    self.reply('250 ok')
+                else:
+                    data.append(line)
+                continue
+
+            command = line[:4].upper()
+
+            if command == 'DATA':
+                data = []
+                self.reply('354 go')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+
+class SmtpServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), SmtpHandler)
+        self.connexions = 0
+        self.messages = []
+
+
+@pytest.fixture
+def smtp_server():
+    server = SmtpServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+def get_dispatcher(server, **kwargs):
+    return MailDispatcher(
+        host='127.0.0.1',
+        port=server.server_address[1],
+        use_ssl=False,
+        use_tls=False,
+        login=False,
+        sender='integration@localhost',
+        to='dev@localhost',
+        **kwargs
+    )
+
+
+def test_same_error_with_different_dates_is_merged(smtp_server):
+    dispatcher = get_dispatcher(smtp_server, window=60)
+
+    for i in range(5):
+        dispatcher.send(
+            f'{datetime(2024, 1, 31, 12, 0, i).isoformat()} | integration_file_csv : '
+            f'pas de connexion à postgresql\n'
+        )
+
+    dispatcher.send('2024-01-31T12:00:09.5 | integration_file_csv : autre erreur\n')
+    dispatcher.close(5)
+
+    assert smtp_server.connexions == 1
+    assert len(smtp_server.messages) == 1
+    message = email.message_from_string(smtp_server.messages[0])
+    body = message.get_payload()[0].get_payload(decode=True).decode()
+    assert message['Subject'] == 'Erreur B.I (2)'
+    assert body.count('pas de connexion') == 1
+    assert ' -> ' in body and '(5 fois)' in body
+    assert 'autre erreur' in body
+
+
+def test_errors_are_split_by_subject_and_max_errors(smtp_server):
+    dispatcher = get_dispatcher(smtp_server, window=60, max_errors=2)
+
+    for i in range(5):
+        dispatcher.send(f'erreur {i}')
+
+    dispatcher.send('erreur de validation', 'Validation')
+    dispatcher.close(5)
+
+    assert smtp_server.connexions == 1
+    assert len(smtp_server.messages) == 4
+    assert sum('Subject: Validation' in m for m in smtp_server.messages) == 1
+
+
+def test_failed_mail_is_logged(smtp_server, monkeypatch):
+    lines = []
+    monkeypatch.setattr(functions, 'write_log', lambda file, line: lines.append(line))
+    port = smtp_server.server_address[1]
+    smtp_server.shutdown()
+    smtp_server.server_close()
+
+    dispatcher = MailDispatcher(
+        window=0, host='127.0.0.1', port=port, use_ssl=False, use_tls=False, login=False,
+        sender='integration@localhost', to='dev@localhost'
+    )
+    dispatcher.send('erreur perdue')
+    dispatcher.close(5)
+
+    assert dispatcher.nb_sent == 0
+    assert any('mail non envoyé' in line and 'erreur perdue' in line for line in lines)
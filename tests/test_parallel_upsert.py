@@ -0,0 +1,252 @@
+"""
+Tests de execute_parallel_upsert et de la prise de connexions du pool, sans serveur PostgreSQL
+"""
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import functions
+import integration_models_csv
+from functions import PoolCnxPostgresql, PoolError, execute_parallel_upsert
+
+
+class FakeInfo:
+    transaction_status = 0
+
+
+class FakeCursor:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    def execute(self, query, *args):
+        pass
+
+
+class FakeCnx:
+    closed = 0
+
+    def __init__(self):
+        self.autocommit = False
+        self.info = FakeInfo()
+        self.state = None
+        self.rows = []
+
+    def cursor(self):
+        return FakeCursor()
+
+    def commit(self):
+        self.state = 'commit'
+
+    def rollback(self):
+        self.state = 'rollback'
+
+
+class FakeThreadedPool:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.in_use = 0
+        self.max_in_use = 0
+
+    def getconn(self):
+        with self.lock:
+            self.opened += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+        return FakeCnx()
+
+    def putconn(self, cnx, close=False):
+        with self.lock:
+            self.in_use -= 1
+
+
+class FakePool(PoolCnxPostgresql):
+    def __init__(self, maxconn, timeout=None):
+        super().__init__('dbname=test', 1, maxconn, timeout=timeout)
+        self.pool = FakeThreadedPool()
+        self.connexions = []
+
+    def connect(self):
+        cnx = self.pool.getconn()
+        self.connexions.append(cnx)
+        return cnx
+
+
+def fake_upsert(kwargs_upsert):
+    with kwargs_upsert['cnx'] as cnx:
+        for row in kwargs_upsert['rows']:
+            if row[1] == 'erreur':
+                raise ValueError("erreur de chargement")
+
+            cnx.rows.append(row)
+            time.sleep(0.0001)
+
+    return {"inserted": len(cnx.rows), "updated": 0, "skipped": 0}
+
+
+@pytest.fixture(autouse=True)
+def patch_upsert(monkeypatch):
+    monkeypatch.setattr(functions, 'execute_prepared_upsert', fake_upsert)
+
+
+def get_kwargs(pool, rows, workers=2):
+    return {
+        'table': 'foo',
+        'champs': ['id', 'nom'],
+        'champs_unique': ('id',),
+        'upsert': True,
+        'skip_unchanged': True,
+        'pool': pool,
+        'workers': workers,
+        'rows': rows,
+    }
+
+
+def test_partitions_by_unique_key():
+    pool = FakePool(maxconn=3)
+    rows = [[str(i % 100), str(i)] for i in range(5000)]
+
+    counts = execute_parallel_upsert(get_kwargs(pool, rows, workers=3))
+
+    assert counts == {"inserted": 5000, "updated": 0, "skipped": 0}
+    assert all(cnx.state == 'commit' for cnx in pool.connexions)
+    keys = [{row[0] for row in cnx.rows} for cnx in pool.connexions]
+    assert sum(len(k) for k in keys) == 100
+
+    last = {}
+    for cnx in pool.connexions:
+        for key, value in cnx.rows:
+            last[key] = value
+    assert all(last[str(k)] == str(4900 + k) for k in range(100))
+    assert pool.used == 0
+
+
+def test_error_rolls_back_every_partition():
+    pool = FakePool(maxconn=2)
+    rows = [[str(i), 'erreur' if i == 1500 else 'ok'] for i in range(3000)]
+
+    with pytest.raises(ValueError):
+        execute_parallel_upsert(get_kwargs(pool, rows))
+
+    assert [cnx.state for cnx in pool.connexions] == ['rollback', 'rollback']
+    assert pool.used == 0
+
+
+def test_concurrent_loads_on_a_small_pool():
+    pool = FakePool(maxconn=3)
+    holder = pool.getconn()
+    results = []
+
+    def load():
+        rows = [[str(i), 'ok'] for i in range(2000)]
+        results.append(execute_parallel_upsert(get_kwargs(pool, rows)))
+
+    threads = [threading.Thread(target=load, daemon=True) for _ in range(2)]
+
+    for thread in threads:
+        thread.start()
+
+    time.sleep(0.2)
+    pool.putconn(holder)
+
+    for thread in threads:
+        thread.join(10)
+
+    assert not any(thread.is_alive() for thread in threads)
+    assert len(results) == 2
+    assert pool.pool.max_in_use <= 3
+    assert pool.used == 0
+
+
+def test_more_workers_than_pool():
+    pool = FakePool(maxconn=2)
+
+    with pytest.raises(PoolError):
+        execute_parallel_upsert(get_kwargs(pool, [['1', 'ok']], workers=3))
+
+    assert pool.used == 0
+
+
+def test_getconns_timeout_releases_nothing():
+    pool = FakePool(maxconn=2, timeout=0.1)
+    holder = pool.getconn()
+
+    with pytest.raises(PoolError):
+        pool.getconns(2)
+
+    assert pool.used == 1
+    pool.putconn(holder)
+    assert pool.used == 0
+
+
+def test_concurrent_integrations_on_a_small_pool(monkeypatch):
+    pool = FakePool(maxconn=3)
+    barrier = threading.Barrier(2, timeout=5)
+
+    class FakeModel:
+        def __init__(self, cnx, modele):
+            self.cnx = cnx
+
+        def get_model_table_name(self):
+            return 'foo'
+
+        def get_champs_types(self):
+            # Les deux intégrations ont leur connexion avant de charger
+            barrier.wait()
+            return 'foo', [('id', None), ('nom', None)]
+
+    class FakeValidator:
+        log_error = None
+        log_rejects = None
+
+        def __init__(self, file_csv, champs_type, **kwargs):
+            pass
+
+        def iter_validation(self):
+            return ([str(i), 'ok'] for i in range(2000))
+
+    monkeypatch.setattr(integration_models_csv, 'GetModel', FakeModel)
+    monkeypatch.setattr(integration_models_csv, 'CsvTxtValidator', FakeValidator)
+    monkeypatch.setattr(integration_models_csv, 'get_pool_postgresql', lambda *args: pool)
+    monkeypatch.setattr(integration_models_csv, 'write_log', lambda *args: None)
+    monkeypatch.setattr(integration_models_csv, 'envoi_mail_erreur', lambda *args: None)
+    kwargs_cnx = {
+        'NAME_DATABASE': 'test',
+        'USER_DATABASE': 'test',
+        'PASSWORD_DATABASE': 'test',
+        'HOST_DATABASE': 'localhost',
+        'PORT_DATABASE': 5432,
+        'POOL_DATABASE': (1, 3),
+    }
+    results = []
+
+    def integration(i):
+        results.append(integration_models_csv.integration_file_csv(
+            kwargs_cnx,
+            {'path': '/tmp'},
+            {'modele': FakeModel},
+            {'error_dir': '/tmp'},
+            {'champs_unique': ('id',), 'upsert': True, 'workers': 2},
+            stream=True,
+            file_csv=f'/tmp/absent_{i}.csv',
+            time_sleep=0
+        ))
+
+    threads = [threading.Thread(target=integration, args=(i,), daemon=True) for i in range(2)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join(10)
+
+    assert not any(thread.is_alive() for thread in threads)
+    assert results == [(True, "success"), (True, "success")]
+    assert pool.used == 0
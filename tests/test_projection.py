@@ -0,0 +1,87 @@
+"""
+Tests de remove_columuns_lines : la lecture par mmap et la lecture texte par
+iter_projected_rows donnent le même fichier
+"""
+import csv
+import random
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import functions
+from functions import remove_columuns_lines, setting_delete_lines
+
+CSV_PARAMS = {'sep': ';', 'encoding_e': 'utf-8', 'encoding_s': 'utf-8', 'errors': 'replace'}
+
+
+def project(tmp_path, monkeypatch, content, del_lines, mmap):
+    calls = []
+    remove_mmap = functions.remove_columuns_lines_mmap
+
+    def spy_mmap(*args, **kwargs):
+        calls.append(args[0])
+        return remove_mmap(*args, **kwargs)
+
+    monkeypatch.setattr(functions, 'remove_columuns_lines_mmap', spy_mmap)
+    monkeypatch.setattr(functions, 'MMAP_MIN_SIZE', 0 if mmap else float('inf'))
+    file_csv = tmp_path / 'fichier.csv'
+    file_csv.write_bytes(content.encode('utf-8'))
+    out = tmp_path / 'TO_VALIDATED_fichier.csv'
+    remove_columuns_lines(
+        str(file_csv), str(out), [0, 1], setting_delete_lines(del_lines, 0), **CSV_PARAMS
+    )
+
+    # La lecture par mmap recopie les enregistrements propres tels quels, les fichiers sont
+    # comparés sur leurs enregistrements
+    with open(out, encoding='utf-8', newline='') as projected:
+        rows = list(csv.reader(projected, delimiter=';'))
+
+    return rows, bool(calls)
+
+
+def test_doubled_quotes_without_doublequote_dialect(tmp_path, monkeypatch):
+    content = 'id;nom\n1;"dit ""oui""\nfin"\n2;b\n3;c\n'
+
+    text, _ = project(tmp_path, monkeypatch, content, (1, 3), mmap=False)
+    result, used_mmap = project(tmp_path, monkeypatch, content, (1, 3), mmap=True)
+
+    assert not used_mmap
+    assert result == text
+    assert ['2', 'b'] in result and ['fin"'] not in result
+
+
+def test_quote_free_file_uses_mmap(tmp_path, monkeypatch):
+    content = 'id;nom\n1;a\n2;b\n3;c\n'
+
+    text, _ = project(tmp_path, monkeypatch, content, (1, 3), mmap=False)
+    result, used_mmap = project(tmp_path, monkeypatch, content, (1, 3), mmap=True)
+
+    assert used_mmap
+    assert result == text
+
+
+def random_value(rnd):
+    value = ''.join(rnd.choice('ab ;"\n') for _ in range(rnd.randint(0, 6)))
+
+    if rnd.random() < 0.5 or any(c in value for c in ';"\n'):
+        return '"' + value.replace('"', '""') + '"'
+
+    return value
+
+
+@pytest.mark.parametrize('header', ['id;nom', '"id";"nom ""client"""'])
+def test_mmap_matches_text_path(tmp_path, monkeypatch, header):
+    rnd = random.Random(0)
+
+    for _ in range(200):
+        lines = [header] + [
+            f'{random_value(rnd)};{random_value(rnd)}' for _ in range(rnd.randint(1, 8))
+        ]
+        content = '\n'.join(lines) + '\n'
+        del_lines = tuple(rnd.sample(range(1, 10), rnd.randint(0, 3)))
+
+        text, _ = project(tmp_path, monkeypatch, content, del_lines, mmap=False)
+        result, _ = project(tmp_path, monkeypatch, content, del_lines, mmap=True)
+
+        assert result == text, content
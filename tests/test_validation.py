@@ -0,0 +1,103 @@
+"""
+Tests de CsvTxtValidator : fichiers refusés, lignes à supprimer et sous totaux
+"""
+import os
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from functions import CsvTxtValidator, CsvValidationError
+
+COLUMNS_TABLE = [
+    ('id', (0, True, 'validate_int')),
+    ('nom', (30, True, 'validate_str')),
+]
+
+
+def get_validator(tmp_path, content, **kwargs):
+    file_csv = tmp_path / 'fichier.csv'
+    file_csv.write_text(content, encoding='utf-8')
+    error_dir = tmp_path / 'errors'
+    error_dir.mkdir(exist_ok=True)
+    kwargs.setdefault('desired_columns', ('id', 'nom'))
+
+    return CsvTxtValidator(
+        str(file_csv), COLUMNS_TABLE, error_dir=str(error_dir), header_line=1, time_sleep=0,
+        **kwargs
+    )
+
+
+def test_iter_validation_missing_column_moves_file(tmp_path):
+    validator = get_validator(tmp_path, 'id;autre\n1;a\n')
+
+    with pytest.raises(CsvValidationError, match="Ne contient pas toutes les colonnes"):
+        list(validator.iter_validation())
+
+    assert not (tmp_path / 'fichier.csv').exists()
+    assert (tmp_path / 'errors' / 'ERRORS_fichier.csv').is_file()
+    assert validator.log_error is not None
+
+
+def test_validation_missing_column_moves_file(tmp_path):
+    validator = get_validator(tmp_path, 'id;autre\n1;a\n')
+
+    colonnes, log_error = validator.validation
+
+    assert colonnes is None
+    assert "Ne contient pas toutes les colonnes" in log_error
+    assert not (tmp_path / 'fichier.csv').exists()
+    assert os.listdir(tmp_path / 'errors') == ['ERRORS_fichier.csv']
+
+
+def get_multiline_csv(nb_rows, error_every=None):
+    lines = ['"id";"nom ""client"""\n']
+
+    for i in range(nb_rows):
+        identifiant = '' if error_every and i % error_every == 7 else str(i)
+
+        if i % 7 == 0:
+            nom = f'"nom {i}\nsur deux lignes"'
+        elif i % 5 == 0:
+            nom = f'"dit ""oui"" {i}"'
+        else:
+            nom = f'nom {i}'
+
+        lines.append(f'{identifiant};{nom}\n')
+
+    return ''.join(lines)
+
+
+def validate(tmp_path, name, content, monkeypatch, workers):
+    chunks = []
+    get_chunks = CsvTxtValidator.get_chunks
+
+    def spy_get_chunks(self, dialect):
+        result = get_chunks(self, dialect)
+        chunks.append(result)
+        return result
+
+    monkeypatch.setattr(CsvTxtValidator, 'get_chunks', spy_get_chunks)
+    work_dir = tmp_path / name
+    work_dir.mkdir()
+    validator = get_validator(work_dir, content, desired_columns=(), workers=workers)
+    colonnes, result = validator.validation
+
+    if colonnes is not None:
+        with open(result, encoding='utf-8') as validated:
+            result = validated.read()
+
+    return colonnes, result.replace(str(work_dir), ''), chunks
+
+
+@pytest.mark.parametrize('error_every', [None, 300])
+def test_parallel_validation_matches_sequential(tmp_path, monkeypatch, error_every):
+    monkeypatch.setattr(CsvTxtValidator, 'PARALLEL_MIN_SIZE', 0)
+    content = get_multiline_csv(3000, error_every)
+
+    sequential = validate(tmp_path, 'sequential', content, monkeypatch, workers=0)
+    parallel = validate(tmp_path, 'parallel', content, monkeypatch, workers=3)
+
+    assert parallel[2] and parallel[2][0] is not None and len(parallel[2][0]) == 3
+    assert parallel[:2] == sequential[:2]
+    assert (sequential[0] is None) == (error_every is not None)
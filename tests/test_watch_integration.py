@@ -0,0 +1,95 @@
+"""
+Tests de WatchIntegration : un fichier en échec n'est repris que s'il change
+"""
+import os
+import time
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import watch_integration
+from watch_integration import WatchIntegration
+
+
+class FakeModel:
+    def __init__(self, cnx, modele):
+        pass
+
+    def get_model_table_name(self):
+        return 'foo'
+
+
+@pytest.fixture
+def watcher(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_integration(*args, file_csv=None, **kwargs):
+        calls.append(file_csv)
+        return None, "pas de connexion à postgresql"
+
+    monkeypatch.setattr(watch_integration, 'GetModel', FakeModel)
+    monkeypatch.setattr(watch_integration, 'integration_file_csv', fake_integration)
+    list_kwargs = [{
+        'kwargs_cnx': {},
+        'kwargs_file': {'path': str(tmp_path), 'extension': 'csv'},
+        'kwargs_modele': {'modele': FakeModel},
+        'kwargs_validate': {},
+        'kwargs_upsert': {},
+    }]
+    watcher = WatchIntegration(list_kwargs, max_workers=1, stable_time=0)
+    watcher.calls = calls
+
+    yield watcher
+
+    watcher.executor.shutdown(wait=True)
+
+
+def wait_idle(watcher):
+    for _ in range(200):
+        with watcher.lock:
+            if not watcher.running:
+                return
+        time.sleep(0.01)
+
+
+def test_failed_file_is_not_retried_until_changed(tmp_path, watcher):
+    file_csv = str(tmp_path / 'fichier.csv')
+
+    with open(file_csv, 'w') as csv_file:
+        csv_file.write('id;nom\n1;a\n')
+
+    watcher.ready(file_csv)
+    wait_idle(watcher)
+    assert watcher.calls == [file_csv]
+
+    for _ in range(3):
+        watcher.scan()
+        watcher.check_pending()
+        watcher.ready(file_csv)
+        wait_idle(watcher)
+
+    assert watcher.calls == [file_csv]
+    assert not watcher.pending
+
+    with open(file_csv, 'a') as csv_file:
+        csv_file.write('2;b\n')
+
+    watcher.scan()
+    watcher.check_pending()
+    wait_idle(watcher)
+    assert watcher.calls == [file_csv, file_csv]
+
+
+def test_deleted_failed_file_is_forgotten(tmp_path, watcher):
+    file_csv = str(tmp_path / 'fichier.csv')
+
+    with open(file_csv, 'w') as csv_file:
+        csv_file.write('id;nom\n1;a\n')
+
+    watcher.ready(file_csv)
+    wait_idle(watcher)
+    os.remove(file_csv)
+
+    assert not watcher.is_failed(file_csv)
+    assert file_csv not in watcher.failed
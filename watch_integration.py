@@ -0,0 +1,400 @@
+"""
+Module de surveillance des répertoires d'intégration, les fichiers sont intégrés dès qu'ils sont
+complets, sans pause fixe
+"""
+import os
+import sys
+import ctypes
+import ctypes.util
+import fnmatch
+import select
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime as dt
+
+from functions import (
+    GetModel,
+    get_file_patterns,
+    list_file,
+    write_log,
+    LOG_FILE
+)
+from integration_models_csv import integration_file_csv
+
+# Fichiers écrits par la validation dans les répertoires surveillés, à ne pas intégrer
+GENERATED_PREFIXES = (
+    'TO_VALIDATED_', 'VALIDATED_', 'PART_', 'ERRORS_', 'CHECKPOINT_', 'REJECTS_'
+)
+
+
+class Inotify:
+    """
+    Accès minimal à inotify (Linux) par ctypes
+        exemple:
+            inotify = Inotify()
+            inotify.add_watch('/path', Inotify.IN_CLOSE_WRITE | Inotify.IN_MOVED_TO)
+            for wd, mask, name in inotify.read_events(timeout=1):
+                ...
+    """
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self):
+        """
+        Initialisation de la class Inotify
+            :raise OSError: si inotify n'est pas disponible
+        """
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+
+        try:
+            self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except AttributeError:
+            raise OSError("inotify n'est pas disponible")
+
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+
+        self.watches = {}
+
+    def add_watch(self, path, mask):
+        """
+        Fonction qui ajoute un répertoire à surveiller
+            :param path: répertoire
+            :param mask: événements à surveiller
+            :return: None
+        """
+        w_d = self.libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+
+        if w_d < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch {path}")
+
+        self.watches[w_d] = path
+
+    def read_events(self, timeout):
+        """
+        Fonction qui renvoie les événements reçus, en attendant au plus timeout secondes
+            :param timeout: attente maximum en secondes
+            :return: list des (chemin complet, mask)
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        i = 0
+
+        while i < len(data):
+            w_d, mask, _, length = self.EVENT_HEADER.unpack_from(data, i)
+            i += self.EVENT_HEADER.size
+            name = data[i:i + length].rstrip(b'\0')
+            i += length
+
+            if w_d in self.watches and name:
+                events.append((os.path.join(self.watches[w_d], os.fsdecode(name)), mask))
+
+        return events
+
+    def close(self):
+        """
+        Fonction qui ferme le descripteur inotify
+            :return: None
+        """
+        os.close(self.fd)
+
+
+class WatchIntegration:
+    """
+    Démon d'intégration : les répertoires kwargs_file['path'] sont surveillés et chaque fichier
+    est intégré par integration_file_csv dès qu'il est complet, sans les pauses TIME_SLEEP.
+    Un fichier est complet quand celui qui l'écrit le ferme (IN_CLOSE_WRITE), quand il est
+    déplacé dans le répertoire (IN_MOVED_TO), ou quand sa taille et sa date de modification
+    n'ont pas changé depuis stable_time secondes. Sans inotify, les répertoires sont parcourus
+    toutes les stable_time secondes.
+
+    Comme pour integration_files_csv, les fichiers d'une même table sont intégrés l'un après
+    l'autre dans l'ordre des noms, les tables différentes en parallèle.
+
+    Un fichier dont l'intégration a échoué et qui est resté en place n'est pas réintégré tant
+    que sa taille et sa date de modification n'ont pas changé, pour ne pas relancer la même
+    erreur, et son mail, à chaque parcours du répertoire.
+        exemple:
+            WatchIntegration(list_kwargs, max_workers=4).run()
+    """
+
+    def __init__(self, list_kwargs, max_workers=4, stream=None, stable_time=2.0,
+                 stop_event=None):
+        """
+        Initialisation de la class WatchIntegration
+            :param list_kwargs: list des paramètres de integration_file_csv, un dict par modèle,
+                                voir integration_files_csv
+            :param max_workers: nombre maximum d'intégrations simultanées
+            :param stream: voir integration_file_csv
+            :param stable_time: délai sans changement de taille ni de date, pour qu'un fichier
+                                encore ouvert soit jugé complet
+            :param stop_event: threading.Event, pour arrêter le démon
+        """
+        self.list_kwargs = list_kwargs
+        self.stream = stream
+        self.stable_time = stable_time
+        self.stop_event = stop_event or threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.queues = {}
+        self.running = set()
+        self.known = set()
+        self.failed = {}
+        self.patterns = [
+            (
+                pattern,
+                GetModel(None, **kwargs['kwargs_modele']).get_model_table_name(),
+                kwargs
+            )
+            for kwargs in list_kwargs
+            for pattern in get_file_patterns(
+                kwargs['kwargs_file']['path'],
+                kwargs['kwargs_file'].get('extension'),
+                kwargs['kwargs_file'].get('name_part')
+            )
+        ]
+
+    def get_target(self, file_csv):
+        """
+        Fonction qui renvoie la table et les paramètres d'intégration d'un fichier
+            :param file_csv: chemin du fichier
+            :return: (table, kwargs) ou None si le fichier n'est pas à intégrer
+        """
+        if os.path.basename(file_csv).startswith(GENERATED_PREFIXES + ('.',)):
+            return None
+
+        for pattern, table, kwargs in self.patterns:
+            if fnmatch.fnmatch(file_csv, pattern):
+                return table, kwargs
+
+        return None
+
+    @staticmethod
+    def get_signature(file_csv):
+        """
+        Fonction qui renvoie la signature d'un fichier, sa taille et sa date de modification
+            :param file_csv: chemin du fichier
+            :return: (taille, date de modification en ns) ou None si le fichier n'existe plus
+        """
+        try:
+            stat = os.stat(file_csv)
+        except FileNotFoundError:
+            return None
+
+        return stat.st_size, stat.st_mtime_ns
+
+    def is_failed(self, file_csv):
+        """
+        Fonction qui indique si un fichier a échoué à l'intégration et n'a pas changé depuis,
+        un fichier modifié ou supprimé est oublié
+            :param file_csv: chemin du fichier
+            :return: bool
+        """
+        with self.lock:
+            if file_csv not in self.failed:
+                return False
+
+            if self.failed[file_csv] == self.get_signature(file_csv):
+                return True
+
+            del self.failed[file_csv]
+            return False
+
+    def watch(self, file_csv):
+        """
+        Fonction qui met un fichier en attente de stabilité
+            :param file_csv: chemin du fichier
+            :return: None
+        """
+        try:
+            stat = os.stat(file_csv)
+        except FileNotFoundError:
+            self.pending.pop(file_csv, None)
+            return
+
+        signature = (stat.st_size, stat.st_mtime_ns)
+        previous = self.pending.get(file_csv)
+
+        if previous is None or previous[0] != signature:
+            self.pending[file_csv] = (signature, time.monotonic())
+
+    def check_pending(self):
+        """
+        Fonction qui lance l'intégration des fichiers en attente dont la taille et la date de
+        modification n'ont pas changé depuis stable_time secondes
+            :return: None
+        """
+        now = time.monotonic()
+
+        for file_csv in list(self.pending):
+            self.watch(file_csv)
+
+            if file_csv in self.pending and now - self.pending[file_csv][1] >= self.stable_time:
+                self.ready(file_csv)
+
+    def ready(self, file_csv):
+        """
+        Fonction qui met un fichier complet dans la file de sa table
+            :param file_csv: chemin du fichier
+            :return: None
+        """
+        self.pending.pop(file_csv, None)
+        target = self.get_target(file_csv)
+
+        if target is None or not os.path.isfile(file_csv):
+            return
+
+        table, kwargs = target
+
+        if self.is_failed(file_csv):
+            return
+
+        with self.lock:
+            if file_csv in self.known:
+                return
+
+            self.known.add(file_csv)
+            self.queues.setdefault(table, []).append((os.path.basename(file_csv), file_csv, kwargs))
+
+            if table not in self.running:
+                self.running.add(table)
+                self.executor.submit(self.integration_table, table)
+
+    def integration_table(self, table):
+        """
+        Fonction qui intègre les fichiers de la file d'une table, dans l'ordre des noms
+            :param table: table
+            :return: None
+        """
+        while True:
+            with self.lock:
+                queue = self.queues.get(table)
+
+                if not queue:
+                    self.running.discard(table)
+                    return
+
+                queue.sort(key=lambda r: r[:2])
+                _, file_csv, kwargs = queue.pop(0)
+
+            signature = self.get_signature(file_csv)
+            success = False
+
+            try:
+                success = integration_file_csv(
+                    kwargs['kwargs_cnx'],
+                    kwargs['kwargs_file'],
+                    kwargs['kwargs_modele'],
+                    kwargs['kwargs_validate'],
+                    dict(kwargs['kwargs_upsert']),
+                    stream=self.stream,
+                    file_csv=file_csv,
+                    time_sleep=0
+                )[0] is not None
+
+            except Exception:
+                log_line = (
+                    f'{dt.now().isoformat()} | WatchIntegration : {file_csv}'
+                    f'\n\t\t{sys.exc_info()[1]}\n'
+                )
+                write_log(LOG_FILE, log_line)
+
+            finally:
+                with self.lock:
+                    self.known.discard(file_csv)
+
+                    # Un fichier en échec encore en place n'est repris que s'il change
+                    if not success and signature is not None:
+                        if self.get_signature(file_csv) is not None:
+                            self.failed[file_csv] = signature
+
+    def scan(self):
+        """
+        Fonction qui met en attente les fichiers déjà présents dans les répertoires
+            :return: None
+        """
+        for kwargs in self.list_kwargs:
+            kwargs_file = {
+                k: v for k, v in kwargs['kwargs_file'].items()
+                if k in {'path', 'extension', 'name_part'}
+            }
+
+            for file_csv in list_file(**kwargs_file) or []:
+                if (
+                        file_csv not in self.known
+                        and self.get_target(file_csv) is not None
+                        and not self.is_failed(file_csv)
+                ):
+                    self.watch(file_csv)
+
+    def run(self):
+        """
+        Boucle du démon, jusqu'à stop_event.set() ou KeyboardInterrupt
+            :return: None
+        """
+        try:
+            inotify = Inotify()
+            mask = Inotify.IN_CLOSE_WRITE | Inotify.IN_MOVED_TO | Inotify.IN_CREATE \
+                | Inotify.IN_MODIFY
+
+            for path in {kwargs['kwargs_file']['path'] for kwargs in self.list_kwargs}:
+                inotify.add_watch(path, mask)
+
+        except OSError:
+            inotify = None
+
+        self.scan()
+
+        try:
+            while not self.stop_event.is_set():
+                if inotify is None:
+                    self.stop_event.wait(self.stable_time / 2)
+                    self.scan()
+
+                else:
+                    timeout = self.stable_time / 2 if self.pending else 1
+
+                    for file_csv, event in inotify.read_events(timeout):
+                        if self.get_target(file_csv) is None:
+                            continue
+
+                        if event & (Inotify.IN_CLOSE_WRITE | Inotify.IN_MOVED_TO):
+                            self.ready(file_csv)
+                        else:
+                            self.watch(file_csv)
+
+                self.check_pending()
+
+        except KeyboardInterrupt:
+            pass
+
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+            self.executor.shutdown(wait=True)
+
+
+def watch_integration(list_kwargs, max_workers=4, stream=None, stable_time=2.0):
+    """
+    Lancement du démon d'intégration des répertoires, voir WatchIntegration
+        :param list_kwargs: list des paramètres de integration_file_csv, un dict par modèle
+        :param max_workers: nombre maximum d'intégrations simultanées
+        :param stream: voir integration_file_csv
+        :param stable_time: délai sans changement, pour qu'un fichier encore ouvert soit complet
+        :return: None
+    """
+    WatchIntegration(list_kwargs, max_workers, stream, stable_time).run()